@@ -0,0 +1,210 @@
+"""Response compression negotiated from Accept-Encoding.
+
+CompressionMiddleware compresses responses with Brotli (br) or gzip, the one
+the client prefers, br on a tie. Streamed bodies (csv exports) are compressed
+as they are produced, in batches of COMPRESSION_STREAM_FLUSH_BYTES of input
+flushed one by one. The client keeps receiving rows, without a flush per csv
+line ruining the ratio.
+
+Bodies under COMPRESSION_MIN_SIZE and the COMPRESSION_SKIP_CONTENT_TYPES
+(pdf, images, archives, already compressed) are sent as they are. Levels are
+COMPRESSION_BROTLI_QUALITY (0-11) and COMPRESSION_GZIP_LEVEL (1-9).
+"""
+
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+
+except ImportError:
+    # Brotli is optional, gzip only without it
+    brotli = None
+
+from typing import AsyncIterator, Iterable, Iterator
+
+# Preferred first, when the client weighs them the same
+ENCODINGS = ("br", "gzip")
+
+
+def available_encodings() -> tuple:
+    return ENCODINGS if brotli is not None else ("gzip",)
+
+
+def _qualities(accept_encoding: str) -> dict:
+    qualities = {}
+
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+
+        if not coding:
+            continue
+
+        quality = 1.0
+
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+
+                except ValueError:
+                    quality = 0.0
+
+        qualities[coding] = quality
+
+    return qualities
+
+
+def negotiate(accept_encoding: str) -> str:
+    """Encoding to answer an Accept-Encoding header with
+
+    Parameters
+    ----------
+    accept_encoding : str
+        The header, e.g. "gzip, deflate, br;q=0.9"
+
+    Return
+    ------
+     encoding: str, one of ENCODINGS, None when the client takes neither
+    """
+    qualities = _qualities(accept_encoding)
+
+    best = None
+    best_quality = 0.0
+
+    for encoding in available_encodings():
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+class Compressor:
+    """Incremental compressor, the same calls for br and gzip
+
+    Parameters
+    ----------
+    encoding : str
+        br or gzip
+
+    level : int, default None
+        Brotli quality or gzip level, from the settings when None
+    """
+
+    def __init__(self, encoding: str, level: int = None):
+        self.encoding = encoding
+
+        if encoding == "br":
+            if level is None:
+                level = settings.COMPRESSION_BROTLI_QUALITY
+
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            if level is None:
+                level = settings.COMPRESSION_GZIP_LEVEL
+
+            # wbits 31, deflate with a gzip header and trailer
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        """Feed data, returns what the compressor has ready (often nothing)"""
+        if self.encoding == "br":
+            return self._compressor.process(data)
+
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Everything fed so far, decodable by the client right away"""
+        if self.encoding == "br":
+            return self._compressor.flush()
+
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+
+        return self._compressor.flush()
+
+
+def compress(content: bytes, encoding: str, level: int = None) -> bytes:
+    """Compress a whole body"""
+    compressor = Compressor(encoding, level)
+
+    return compressor.compress(content) + compressor.finish()
+
+
+def compress_stream(
+    chunks: Iterable[bytes], encoding: str, level: int = None
+) -> Iterator[bytes]:
+    """Compress a streamed body, see COMPRESSION_STREAM_FLUSH_BYTES
+
+    Chunks (single csv lines) are batched up to the flush size, fed to the
+    compressor at once and flushed, so every piece sent is decodable.
+    """
+    compressor = Compressor(encoding, level)
+    batch = []
+    pending = 0
+
+    for chunk in chunks:
+        batch.append(chunk)
+        pending += len(chunk)
+
+        if pending >= settings.COMPRESSION_STREAM_FLUSH_BYTES:
+            yield compressor.compress(b"".join(batch)) + compressor.flush()
+            batch = []
+            pending = 0
+
+    yield compressor.compress(b"".join(batch)) + compressor.finish()
+
+
+async def acompress_stream(
+    chunks: AsyncIterator[bytes], encoding: str, level: int = None
+) -> AsyncIterator[bytes]:
+    """Async compress_stream, for the bodies of async views"""
+    compressor = Compressor(encoding, level)
+    batch = []
+    pending = 0
+
+    async for chunk in chunks:
+        batch.append(chunk)
+        pending += len(chunk)
+
+        if pending >= settings.COMPRESSION_STREAM_FLUSH_BYTES:
+            yield compressor.compress(b"".join(batch)) + compressor.flush()
+            batch = []
+            pending = 0
+
+    yield compressor.compress(b"".join(batch)) + compressor.finish()
+
+
+def is_compressible(response) -> bool:
+    """False for encoded, small, partial or already compressed bodies"""
+    if response.has_header("Content-Encoding") or response.status_code in (
+        204,
+        206,
+        304,
+    ):
+        return False
+
+    content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+
+    if any(
+        content_type.startswith(skipped)
+        for skipped in settings.COMPRESSION_SKIP_CONTENT_TYPES
+    ):
+        return False
+
+    if response.streaming:
+        # A file response knows its size
+        length = response.get("Content-Length")
+
+        return length is None or int(length) >= settings.COMPRESSION_MIN_SIZE
+
+    return len(response.content) >= settings.COMPRESSION_MIN_SIZE
@@ -0,0 +1,323 @@
+import abc
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import compression, profiling, routers, timing
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCapableMiddleware(abc.ABC):
+    """Base of the middlewares here, sync and async capable
+
+    Under ASGI, a middleware that is sync only makes Django run the whole
+    chain below it in the single thread sensitive thread, one request at a
+    time. These get an async chain and answer with __acall__ then. Both paths
+    are abstract, a subclass missing one fails when Django loads the
+    middleware chain at startup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        return self.call(request)
+
+    @abc.abstractmethod
+    def call(self, request):
+        """Answer the request under WSGI or a sync chain"""
+
+    @abc.abstractmethod
+    async def __acall__(self, request):
+        """Answer the request under an async chain"""
+
+
+class ServerTimingMiddleware(AsyncCapableMiddleware):
+    """Report where a request spent its time
+
+    Every query of every database connection is timed through
+    timing.execute_wrapper. The response gets a Server-Timing header with the
+    db time and query count and the serialize and render times. Requests
+    slower than SLOW_REQUEST_MS are logged as one JSON line with their most
+    repeated SQL statements.
+    """
+
+    def call(self, request):
+        with timing.collect() as timings:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            total = time.perf_counter() - started
+
+        return self.report(request, response, timings, total)
+
+    async def __acall__(self, request):
+        # The timings follow the request into its sync_to_async threads
+        with timing.collect() as timings:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            total = time.perf_counter() - started
+
+        return self.report(request, response, timings, total)
+
+    def report(self, request, response, timings, total: float):
+        response["Server-Timing"] = self.server_timing(timings, total)
+
+        if total * 1000 >= settings.SLOW_REQUEST_MS:
+            self.log_slow_request(request, response, timings, total)
+
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before render, the callback right after it
+        timings = timing.current_timings()
+        started = time.perf_counter()
+
+        def rendered(response):
+            timings.add("render", time.perf_counter() - started)
+
+        if timings is not None:
+            response.add_post_render_callback(rendered)
+
+        return response
+
+    def server_timing(self, timings: "timing.RequestTimings", total: float) -> str:
+        durations = timings.durations
+
+        # Microseconds kept, a small page renders in well under 0.1 ms
+        return ", ".join(
+            [
+                f"db;dur={durations['db'] * 1000:.3f}",
+                f'db-count;desc="{timings.db_count}"',
+                f"serialize;dur={durations['serialize'] * 1000:.3f}",
+                f"render;dur={durations['render'] * 1000:.3f}",
+                f"total;dur={total * 1000:.3f}",
+            ]
+        )
+
+    def log_slow_request(self, request, response, timings, total: float) -> None:
+        durations = timings.durations
+
+        logger.warning(
+            json.dumps(
+                {
+                    "event": "slow_request",
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "duration_ms": round(total * 1000, 3),
+                    "db_ms": round(durations["db"] * 1000, 3),
+                    "db_count": timings.db_count,
+                    "serialize_ms": round(durations["serialize"] * 1000, 3),
+                    "render_ms": round(durations["render"] * 1000, 3),
+                    "top_sql": timings.top_statements(settings.SLOW_REQUEST_TOP_SQL),
+                }
+            )
+        )
+
+
+class ProfilerMiddleware(AsyncCapableMiddleware):
+    """Profile single requests sent with a staff token, see drf.profiling
+
+    The profile is stored under PROFILE_ROOT and its path returned in the
+    X-Profile response header. Requests without a token go straight through.
+    """
+
+    def call(self, request):
+        token = self.token(request)
+
+        if not token:
+            return self.get_response(request)
+
+        if not profiling.check_token(token):
+            logger.warning("Rejected profiling token for %s", request.path)
+            return self.get_response(request)
+
+        profile_format = self.profile_format(request)
+
+        profiler = profiling.start_profiler(profile_format)
+
+        try:
+            response = self.get_response(request)
+
+        except BaseException:
+            profiler.stop()
+            raise
+
+        path = profiling.profile_path(self.view_name(request), profile_format)
+        response["X-Profile"] = path
+
+        # Async bodies are produced on the event loop, not this thread
+        if response.streaming and not response.is_async:
+            response.streaming_content = profiling.stream_then_save(
+                response.streaming_content, profiler, path
+            )
+        else:
+            profiling.stop_and_save(profiler, path)
+
+        return response
+
+    async def __acall__(self, request):
+        token = self.token(request)
+
+        if not token:
+            return await self.get_response(request)
+
+        if not await sync_to_async(profiling.check_token)(token):
+            logger.warning("Rejected profiling token for %s", request.path)
+            return await self.get_response(request)
+
+        profile_format = self.profile_format(request)
+
+        # Of the event loop thread, stopped on it (cProfile is per thread)
+        profiler = profiling.start_profiler(profile_format)
+
+        try:
+            response = await self.get_response(request)
+
+        finally:
+            profiler.stop()
+
+        def save() -> str:
+            path = profiling.profile_path(self.view_name(request), profile_format)
+            profiling.save_profile(profiler, path)
+
+            return path
+
+        # Files written off the event loop
+        response["X-Profile"] = await sync_to_async(save)()
+
+        return response
+
+    def token(self, request) -> str:
+        return request.headers.get("X-Profile") or request.GET.get("profile")
+
+    def profile_format(self, request) -> str:
+        profile_format = (
+            request.headers.get("X-Profile-Format")
+            or request.GET.get("profile_format")
+            or "collapsed"
+        )
+
+        return profile_format if profile_format in profiling.FORMATS else "collapsed"
+
+    def view_name(self, request) -> str:
+        """Class name of the view that served the request"""
+        if request.resolver_match is None:
+            return "unresolved"
+
+        func = request.resolver_match.func
+        view_class = getattr(func, "view_class", None)
+
+        return view_class.__name__ if view_class else func.__name__
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """Serve safe requests from the read replicas, see drf.routers
+
+    A request that wrote sets the pin cookie, the client then reads from the
+    primary until it expires.
+    """
+
+    safe_methods = ("GET", "HEAD", "OPTIONS")
+
+    def call(self, request):
+        with routers.replica_reads(self.replicas_allowed(request)) as state:
+            response = self.get_response(request)
+
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        # The state is a context variable, sync_to_async carries it into the
+        # threads the queries of async views run on
+        with routers.replica_reads(self.replicas_allowed(request)) as state:
+            response = await self.get_response(request)
+
+        return self.pin(response, state)
+
+    def replicas_allowed(self, request) -> bool:
+        return (
+            request.method in self.safe_methods
+            and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+        )
+
+    def pin(self, response, state: "routers.DatabaseState"):
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+
+        return response
+
+
+class CompressionMiddleware(AsyncCapableMiddleware):
+    """Compress responses with br or gzip, see drf.compression
+
+    Streamed bodies are compressed while they are sent, whole bodies only
+    when that makes them shorter.
+    """
+
+    def call(self, request):
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if not compression.is_compressible(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = compression.negotiate(request.headers.get("Accept-Encoding", ""))
+
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_stream(
+                    response.streaming_content, encoding
+                )
+            else:
+                response.streaming_content = compression.compress_stream(
+                    response.streaming_content, encoding
+                )
+
+            # Unknown until sent
+            del response.headers["Content-Length"]
+        else:
+            content = compression.compress(response.content, encoding)
+
+            if len(content) >= len(response.content):
+                return response
+
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+
+        # Bytes differ from the uncompressed body, RFC 9110 8.8.1
+        etag = response.get("ETag")
+
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+
+        response.headers["Content-Encoding"] = encoding
+
+        return response
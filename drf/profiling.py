@@ -0,0 +1,194 @@
+"""On demand profiling of single requests.
+
+A staff member gets a signed token from the profile_token command and sends
+it as the X-Profile header (or the profile query param). ProfilerMiddleware
+then runs that request under a profiler and stores the result under
+PROFILE_ROOT/<view class>/. Requests without a token are not touched.
+
+Two formats:
+
+- collapsed (default): a sampling profiler reads the stack of the request
+  thread every PROFILE_INTERVAL seconds. One "frame;frame;frame count" line
+  per stack, trimmed to the frames below the Django handler, ready for
+  flamegraph.pl or speedscope.
+- prof: cProfile stats, for pstats or snakeviz.
+
+Under ASGI the profile is of the event loop thread, the other requests it
+serves meanwhile show up in it too.
+"""
+
+import collections
+import cProfile
+import os
+import sys
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils import timezone
+
+TOKEN_SALT = "drf.profiling"
+
+FORMATS = ("collapsed", "prof")
+
+
+def make_token(user_id) -> str:
+    """Signed profiling token of a staff user, see PROFILE_TOKEN_MAX_AGE"""
+    return signing.dumps({"user": str(user_id)}, salt=TOKEN_SALT)
+
+
+def check_token(token: str) -> bool:
+    """True when the token is valid, unexpired and its user still staff"""
+    try:
+        payload = signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+
+    except signing.BadSignature:
+        return False
+
+    return (
+        get_user_model()
+        .objects.filter(id=payload["user"], is_staff=True, is_active=True)
+        .exists()
+    )
+
+
+def _frame_label(code) -> str:
+    filename = os.path.relpath(code.co_filename, settings.BASE_DIR)
+
+    if filename.startswith(".."):
+        # Libraries, keep the path below site-packages (or the stdlib)
+        filename = code.co_filename.rsplit("site-packages" + os.sep, 1)[-1]
+
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _is_handler_frame(code) -> bool:
+    # Streamed bodies are produced below stream_then_save
+    if code.co_name == "stream_then_save" and code.co_filename == __file__:
+        return True
+
+    return code.co_name in (
+        "_get_response",
+        "_get_response_async",
+    ) and code.co_filename.endswith(
+        os.path.join("django", "core", "handlers", "base.py")
+    )
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread
+
+    Parameters
+    ----------
+    thread_id : int
+        Thread to sample, threading.get_ident() of the request thread
+
+    interval : float
+        Seconds between samples
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+
+            if frame is not None:
+                self.samples[self.stack(frame)] += 1
+
+    def stack(self, frame) -> str:
+        """Collapsed stack of a frame, root first, trimmed below the handler"""
+        codes = []
+
+        while frame is not None:
+            if _is_handler_frame(frame.f_code):
+                break
+
+            codes.append(frame.f_code)
+            frame = frame.f_back
+
+        return ";".join(_frame_label(code) for code in reversed(codes))
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as file:
+            file.write(self.collapsed())
+
+
+class CallProfiler:
+    """cProfile of the calling thread, same interface as SamplingProfiler"""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profiler.enable()
+
+    def stop(self) -> None:
+        self.profiler.disable()
+
+    def save(self, path: str) -> None:
+        self.profiler.dump_stats(path)
+
+
+def start_profiler(profile_format: str):
+    """Start profiling the calling thread in one of FORMATS"""
+    if profile_format == "prof":
+        profiler = CallProfiler()
+    else:
+        profiler = SamplingProfiler(threading.get_ident(), settings.PROFILE_INTERVAL)
+
+    profiler.start()
+
+    return profiler
+
+
+def profile_path(view_name: str, profile_format: str) -> str:
+    """New file name under PROFILE_ROOT/<view_name>/, relative to PROFILE_ROOT"""
+    os.makedirs(os.path.join(settings.PROFILE_ROOT, view_name), exist_ok=True)
+
+    return (
+        f"{view_name}/{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        f".{profile_format}"
+    )
+
+
+def stop_and_save(profiler, path: str) -> None:
+    profiler.stop()
+    save_profile(profiler, path)
+
+
+def save_profile(profiler, path: str) -> None:
+    """Write a stopped profile under PROFILE_ROOT"""
+    profiler.save(os.path.join(settings.PROFILE_ROOT, path))
+
+
+def stream_then_save(streaming_content, profiler, path: str):
+    """Profile a streamed body too, the profile is saved once it was sent"""
+    try:
+        yield from streaming_content
+
+    finally:
+        stop_and_save(profiler, path)
@@ -0,0 +1,92 @@
+"""JSON renderer and parser on orjson, registered as the DRF defaults.
+
+Same bytes as rest_framework's JSONRenderer (compact, UTF-8, U+2028 and
+U+2029 escaped). orjson encodes str, int, dict and list (ReturnDict,
+ReturnList and OrderedDict too, no copy), UUID and tuple in Rust, straight
+into its output buffer. Datetimes, dates and times keep DRF's format, they
+go through DRF's JSONEncoder hook like every other type orjson does not know
+(Decimal, lazy strings, timedelta, querysets).
+
+Not byte for byte: floats in exponent form are written without the "+" and
+the leading exponent zero (1e16, not 1e+16), and NaN and Infinity are
+written as null where DRF raises. Payloads orjson cannot encode (integers
+over 64 bits), indented output and non UTF-8 requests go through the DRF
+classes. Without orjson installed both classes are the DRF ones.
+"""
+
+import io
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+
+except ImportError:
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_NON_STR_KEYS
+    if orjson is not None
+    else 0
+)
+
+# UTF-8 of the line and paragraph separators, escaped as DRF does
+LINE_SEPARATOR = "\u2028".encode()
+PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            content = orjson.dumps(data, default=_encoder.default, option=OPTIONS)
+
+        except orjson.JSONEncodeError:
+            # Raises the same error, or renders what orjson cannot
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if LINE_SEPARATOR in content:
+            content = content.replace(LINE_SEPARATOR, b"\\u2028")
+
+        if PARAGRAPH_SEPARATOR in content:
+            content = content.replace(PARAGRAPH_SEPARATOR, b"\\u2029")
+
+        return content
+
+
+class JSONParser(parsers.JSONParser):
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+
+        if orjson is None or encoding.lower().replace("_", "-") not in (
+            "utf-8",
+            "utf8",
+        ):
+            return super().parse(stream, media_type, parser_context)
+
+        content = stream.read()
+
+        try:
+            return orjson.loads(content)
+
+        except orjson.JSONDecodeError:
+            # Same ParseError message as JSONParser
+            return super().parse(io.BytesIO(content), media_type, parser_context)
+
@@ -0,0 +1,111 @@
+"""Database routing between the primary and its read replicas.
+
+Writes always go to the primary (default). Reads go to a replica only inside
+replica_reads(), which ReplicaRoutingMiddleware opens for safe (GET, HEAD)
+requests. A request stops using replicas once it wrote anything, and a
+client that wrote keeps reading from the primary for REPLICA_PIN_SECONDS
+(pin cookie), so users always read their own writes despite the
+replication lag. Results outliving the request (cached payloads) are read
+inside primary_reads(), a lagging replica would keep them stale.
+"""
+
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = contextvars.ContextVar("database_state", default=None)
+
+
+class DatabaseState:
+    """Routing state of one request
+
+    Class varibles
+    ----------
+    replicas : bool
+        Reads may go to a replica
+
+    wrote : bool
+        The request wrote to the primary, later reads stay on it
+    """
+
+    def __init__(self, replicas: bool):
+        self.replicas = replicas
+        self.wrote = False
+
+
+@contextlib.contextmanager
+def replica_reads(allowed: bool = True):
+    """Route the reads of the block to the replicas, when allowed
+
+    The state is held in a context variable, so the block may await: the
+    tasks and sync_to_async threads it runs share the state, and
+    concurrent requests each keep their own.
+    """
+    state = DatabaseState(allowed)
+    token = _state.set(state)
+
+    try:
+        yield state
+
+    finally:
+        _state.reset(token)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Route the reads of the block to the primary
+
+    For reads whose result outlives the request, such as cache fills. The
+    rest of the request keeps its routing, writes made in the block still
+    pin it to the primary.
+    """
+    state = _state.get()
+
+    if state is None:
+        yield
+        return
+
+    replicas = state.replicas
+    state.replicas = False
+
+    try:
+        yield
+
+    finally:
+        state.replicas = replicas
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+
+        if (
+            state is None
+            or not state.replicas
+            or state.wrote
+            or not settings.DATABASE_REPLICAS
+            # A transaction reads its own uncommitted rows
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+
+        if state is not None:
+            state.wrote = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return db not in settings.DATABASE_REPLICAS
@@ -50,6 +50,12 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    "drf.middleware.ServerTimingMiddleware",
+    "drf.middleware.ProfilerMiddleware",
+    # Below the profiler, so profiles include the compression
+    "drf.middleware.CompressionMiddleware",
+    "drf.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -99,6 +105,31 @@ if os.environ.get("SSH_CLIENT", None) != None:
         }
     }
 
+elif os.environ.get("DB_SQLITE", None):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        },
+    }
+
+    # DB_SQLITE_REPLICA local stand-in of a replica, a second file kept in
+    # step with ./manage.py sync_sqlite_replicas. Off by default, safe reads
+    # would hit an empty or stale file otherwise
+    if os.environ.get("DB_SQLITE_REPLICA", None):
+        DATABASES["replica_1"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, "db-replica.sqlite3"),
+            "TEST": {"MIRROR": "default"},
+        }
+
+    # DB_SQLITE_SHARDS local note shards, one file each
+    for index in range(1, int(os.environ.get("DB_SQLITE_SHARDS", 0)) + 1):
+        DATABASES[f"shard_{index}"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, f"db-shard-{index}.sqlite3"),
+        }
+
 else:
     # Local DB
     DATABASES = {
@@ -113,6 +144,61 @@ else:
     }
 
 
+# Read replicas of the primary, comma separated hosts, same credentials
+REPLICA_HOSTNAMES = os.environ.get("DB_REPLICA_HOSTNAMES", "").split(",")
+
+for index, host in enumerate(filter(None, map(str.strip, REPLICA_HOSTNAMES)), 1):
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+
+# Safe requests read from these, see drf/routers.py
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica_")]
+
+# Note shards, comma separated hosts, same credentials. Every shard holds the
+# notes of part of the users, see note/sharding.py
+SHARD_HOSTNAMES = os.environ.get("DB_SHARD_HOSTNAMES", "").split(",")
+
+for index, host in enumerate(filter(None, map(str.strip, SHARD_HOSTNAMES)), 1):
+    DATABASES[f"shard_{index}"] = {**DATABASES["default"], "HOST": host}
+
+NOTE_SHARDS = [alias for alias in DATABASES if alias.startswith("shard_")]
+
+# Points of every shard on the consistent-hash ring
+NOTE_SHARD_VNODES = 64
+
+DATABASE_ROUTERS = ["note.sharding.NoteShardRouter", "drf.routers.ReplicaRouter"]
+
+# Clients that wrote read from the primary this long, covers replication lag
+REPLICA_PIN_COOKIE = "db_pin"
+REPLICA_PIN_SECONDS = 5
+
+# MySQL has no partial indexes, the open notes index is only built elsewhere
+SILENCED_SYSTEM_CHECKS = ["models.W037"]
+
+
+# Cache
+# Shared by every worker process: Redis when REDIS_URL is set, else files on
+# the local disk (one host).
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL"),
+        }
+    }
+
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(BASE_DIR, ".cache"),
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -161,8 +247,74 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     # YOUR SETTINGS
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # orjson, same bytes as the DRF classes, see drf/renderers.py
+    "DEFAULT_RENDERER_CLASSES": [
+        "drf.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "drf.renderers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
+# Seconds an authenticated user stays cached, saves drop it earlier
+AUTH_USER_CACHE_TTL = 60
+
+# Seconds a serialized note list page stays cached, writes drop it earlier
+NOTE_CACHE_TTL = 300
+
+# Keyset pagination of the note list apis
+NOTE_PAGE_SIZE = 50
+NOTE_PAGE_MAX_SIZE = 500
+
+# Delta sync api, changes per response
+NOTE_CHANGES_SIZE = 200
+NOTE_CHANGES_MAX_SIZE = 1000
+
+# Bulk note apis, maximum items per request and rows per insert/update query
+NOTE_BULK_MAX_SIZE = 1000
+NOTE_BULK_BATCH_SIZE = 500
+
+# Rows read per query by the streaming exports
+NOTE_EXPORT_CHUNK_SIZE = 2000
+
+# Background pdf exports, rendered by a local worker pool
+NOTE_EXPORT_ROOT = os.path.join(BASE_DIR, "exports")
+NOTE_EXPORT_WORKERS = 2
+# Render in the submitting request instead, handy for tests and debugging
+NOTE_EXPORT_RUN_INLINE = False
+# Seconds a worker may hold a running export before others take it over
+NOTE_EXPORT_LEASE = 600
+
+# Requests slower than this (ms) are logged as JSON with their top SQL
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", 1000))
+SLOW_REQUEST_TOP_SQL = 5
+
+# Response compression, see drf/compression.py
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+# Smaller bodies are sent as they are, the headers outweigh the saving
+COMPRESSION_MIN_SIZE = 1024
+# Input bytes of a streamed body between flushes to the client
+COMPRESSION_STREAM_FLUSH_BYTES = 64 * 1024
+# Already compressed, Content-Type prefixes
+COMPRESSION_SKIP_CONTENT_TYPES = (
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "image/",
+    "audio/",
+    "video/",
+)
+
+# Profiles of requests sent with a profile_token, see drf/profiling.py
+PROFILE_ROOT = os.path.join(BASE_DIR, "profiles")
+# Seconds between stack samples of the collapsed format
+PROFILE_INTERVAL = 0.001
+PROFILE_TOKEN_MAX_AGE = 3600
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Online Note",
     "DESCRIPTION": "Online Note taker for Tunga company",
@@ -191,8 +343,18 @@ CORS_ALLOW_HEADERS = (*default_headers,)
 
 # Email Setup
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_USE_TLS = True
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "1") == "1"
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "smtp.gmail.com")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 587))
 EMAIL_HOST_USER = os.environ.get("HOST_EMAIL_USER", "Enter yours")
 EMAIL_HOST_PASSWORD = os.environ.get("HOST_EMAIL_PASSWORD", "Enter yours")
+
+# Email outbox, see users/outbox.py
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled on every failure
+EMAIL_OUTBOX_RETRY_DELAY = 60
+# Seconds a dispatcher may hold emails before others take them over
+EMAIL_OUTBOX_LEASE = 300
+# Send in the committing thread instead of the background dispatcher
+EMAIL_OUTBOX_RUN_INLINE = False
@@ -0,0 +1,147 @@
+"""Per request timings, filled while a request is served.
+
+ServerTimingMiddleware starts a RequestTimings for every request. Code on the
+request path adds to it with timed(), response serializers do so through
+TimedSerializerMixin.
+
+Queries are timed by execute_wrapper, installed once on every database
+connection. It adds to the timings of the current context, which
+sync_to_async carries into its threads, so the queries of async views count
+too, and concurrent requests never see each other's queries.
+"""
+
+import collections
+import contextlib
+import contextvars
+import time
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Durations (seconds) and SQL statements of one request"""
+
+    def __init__(self):
+        self.durations = collections.defaultdict(float)
+        self.db_count = 0
+        # sql -> [count, seconds]
+        self.statements = collections.defaultdict(lambda: [0, 0.0])
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] += seconds
+
+    def add_query(self, sql: str, seconds: float) -> None:
+        self.db_count += 1
+        self.durations["db"] += seconds
+
+        statement = self.statements[sql]
+        statement[0] += 1
+        statement[1] += seconds
+
+    def top_statements(self, limit: int) -> list[dict]:
+        """The most repeated statements, slowest first among equals"""
+        ranked = sorted(
+            self.statements.items(), key=lambda item: (-item[1][0], -item[1][1])
+        )
+
+        return [
+            {"sql": sql, "count": count, "ms": round(seconds * 1000, 3)}
+            for sql, (count, seconds) in ranked[:limit]
+        ]
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook timing the queries of a request"""
+    timings = _current.get()
+
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+
+    finally:
+        timings.add_query(sql, time.perf_counter() - started)
+
+
+def install(connection, **kwargs) -> None:
+    """Add execute_wrapper to a connection, once"""
+    # First, connection.execute_wrapper() blocks pop the last one on exit
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+def install_all(**kwargs) -> None:
+    """Add execute_wrapper to the connections of this thread"""
+    for connection in connections.all():
+        install(connection)
+
+
+# Connections opened later, in any thread (sync_to_async ones included)
+connection_created.connect(install)
+
+# And the ones opened before, request_started is sent from the thread the
+# sync code of the request runs on (the thread sensitive one under ASGI)
+request_started.connect(install_all)
+
+
+def current_timings() -> "RequestTimings":
+    """Timings of the request being served, None outside a request"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def collect():
+    """Start the timings of a request"""
+    timings = RequestTimings()
+    token = _current.set(timings)
+
+    try:
+        yield timings
+
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def timed(name: str):
+    """Add the duration of the block to the request timings under name"""
+    timings = _current.get()
+
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Counts the time spent building .data as serialize"""
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
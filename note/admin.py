@@ -3,3 +3,7 @@ from django.contrib import admin
 from . import models
 
 admin.site.register(models.Note)
+admin.site.register(models.ExportJob)
+admin.site.register(models.NoteStats)
+admin.site.register(models.NoteShard)
+admin.site.register(models.NoteTombstone)
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class NoteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'note'
+
+    def ready(self):
+        from . import search, signals  # noqa: F401
+
+        # The full-text index is backend specific, built after every migrate
+        post_migrate.connect(search.install_search_index, sender=self)
@@ -0,0 +1,55 @@
+from django.urls import path
+
+from . import async_views as apis
+
+# Async twins of the read only apis in note/urls.py, same paths
+urlpatterns = [
+    path("create/", apis.AsyncUserNotesApi.as_view(), name="async user notes"),
+    path("", apis.AsyncNotesApi.as_view(), name="async all notes"),
+    path(
+        "unfinished/",
+        apis.AsyncNoteListApi.as_view(listing="unfinished"),
+        name="async unfinished",
+    ),
+    path(
+        "finished/",
+        apis.AsyncNoteListApi.as_view(listing="finished"),
+        name="async finished",
+    ),
+    path("overdue/", apis.AsyncOverDueNoteApi.as_view(), name="async overdue"),
+    path(
+        "generate-csv/",
+        apis.AsyncGenerateCSVApi.as_view(),
+        name="async generate csv",
+    ),
+    path(
+        "exports/<str:job_id>/",
+        apis.AsyncExportJobApi.as_view(),
+        name="async export job",
+    ),
+    path(
+        "exports/<str:job_id>/download/",
+        apis.AsyncExportJobDownloadApi.as_view(),
+        name="async export download",
+    ),
+    path(
+        "order-duedate/<str:order_arg>/",
+        apis.AsyncNoteListApi.as_view(listing="order_due_date"),
+        name="async order-duedate",
+    ),
+    path(
+        "order-priority/<str:order_arg>/",
+        apis.AsyncNoteListApi.as_view(listing="order_priority"),
+        name="async order-priority",
+    ),
+    path(
+        "order-created-at/<str:order_arg>/",
+        apis.AsyncNoteListApi.as_view(listing="order_created_at"),
+        name="async order-created-at",
+    ),
+    path(
+        "note/<str:note_id>/",
+        apis.AsyncNoteRetreiveApi.as_view(),
+        name="async retreive",
+    ),
+]
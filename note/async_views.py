@@ -0,0 +1,249 @@
+"""Async versions of the read only note apis, mounted under /api/async/notes/.
+
+DRF views are sync only, these are plain Django async views that authenticate,
+check permissions and render responses and errors the same way the DRF apis
+do. Served by an ASGI server, a slow client or db read never holds a thread.
+"""
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import exceptions, status
+
+from drf.renderers import JSONRenderer
+from drf.timing import timed
+
+from users import permission, authentication as user_auth
+from . import serializers as note_serializer
+
+from . import services
+from .views import note_version_etag, user_notes_version_etag
+
+
+def render_json(data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    """Render data with the default JSON renderer, same bytes as the sync apis"""
+    with timed("render"):
+        content = JSONRenderer().render(data)
+
+    return HttpResponse(
+        content,
+        content_type="application/json",
+        status=status_code,
+    )
+
+
+def conditional_response(request, etag: str = None, last_modified=None):
+    """304/412 response when the client copy is current, None otherwise
+
+    Same checks as django.views.decorators.http.condition, which only wraps
+    sync views in Django 4.2.
+    """
+    etag = quote_etag(etag) if etag else None
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+
+def set_validators(response, etag: str = None, last_modified=None) -> None:
+    if etag:
+        response.headers.setdefault("ETag", quote_etag(etag))
+
+    if last_modified and not response.has_header("Last-Modified"):
+        response.headers["Last-Modified"] = http_date(last_modified.timestamp())
+
+
+class AsyncNoteView(View):
+    """Base of the async apis
+
+    Authenticates with the jwt cookie (CustomUserAuthentication), checks
+    CustomPermision and turns API exceptions into DRF style error responses.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user, request.auth = await user_auth.authenticate_async(
+                request
+            )
+
+            if not permission.CustomPermision().has_permission(request, self):
+                raise exceptions.PermissionDenied()
+
+            return await super().dispatch(request, *args, **kwargs)
+
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc: exceptions.APIException) -> HttpResponse:
+        status_code = exc.status_code
+
+        # DRF answers 403, CustomUserAuthentication sends no WWW-Authenticate
+        if isinstance(
+            exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)
+        ):
+            status_code = status.HTTP_403_FORBIDDEN
+
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {"detail": exc.detail}
+
+        return render_json(data, status_code)
+
+    def page_params(self, request) -> dict:
+        params = note_serializer.PageParamsSerializer(data=request.GET)
+        params.is_valid(raise_exception=True)
+
+        return params.validated_data
+
+
+class AsyncNoteListApi(AsyncNoteView):
+    """A page of one of the note lists, see services.note_listing"""
+
+    listing = None
+
+    # Notes of the authenticated user only
+    user_scoped = False
+
+    async def get(self, request, order_arg: str = None):
+        page_params = self.page_params(request)
+
+        user = request.user if self.user_scoped else None
+
+        async def build():
+            notes = await services.aget_note_page(
+                self.listing, **page_params, user=user, order_arg=order_arg
+            )
+
+            return note_serializer.NotePageSerializer(notes).data
+
+        cache_params = self.cache_params(page_params, order_arg)
+
+        # Same cache entries as the sync apis
+        data = await services.aget_cached_payload(
+            self.listing, cache_params, build, user=user
+        )
+
+        return render_json(data)
+
+    def cache_params(self, page_params: dict, order_arg: str = None) -> dict:
+        if order_arg is None:
+            return page_params
+
+        return {**page_params, "order_arg": order_arg}
+
+
+class AsyncNotesApi(AsyncNoteView):
+    """All notes through the filter and sort engine, see services.query_notes"""
+
+    async def get(self, request):
+        params = note_serializer.NoteQueryParamsSerializer(data=request.GET)
+        params.is_valid(raise_exception=True)
+
+        async def build():
+            notes = await services.aquery_notes(**params.validated_data)
+
+            return note_serializer.NotePageSerializer(notes).data
+
+        data = await services.aget_cached_payload(
+            "notes", params.validated_data, build
+        )
+
+        return render_json(data)
+
+
+class AsyncUserNotesApi(AsyncNoteListApi):
+    listing = "user_notes"
+    user_scoped = True
+
+    async def get(self, request):
+        version = await services.aget_user_notes_version(request.user)
+
+        etag = user_notes_version_etag(request, version)
+
+        not_modified = conditional_response(request, etag=etag)
+
+        if not_modified is not None:
+            return not_modified
+
+        response = await super().get(request)
+
+        set_validators(response, etag=etag)
+
+        return response
+
+
+class AsyncOverDueNoteApi(AsyncNoteListApi):
+    listing = "overdue"
+
+    def cache_params(self, page_params: dict, order_arg: str = None) -> dict:
+        # Notes turn overdue as time passes, cache per minute
+        return {**page_params, "minute": timezone.now().strftime("%Y%m%d%H%M")}
+
+
+class AsyncNoteRetreiveApi(AsyncNoteView):
+    async def get(self, request, note_id):
+        params = note_serializer.NoteFieldsParamsSerializer(data=request.GET)
+        params.is_valid(raise_exception=True)
+
+        fields = params.validated_data["fields"]
+
+        version = await services.aget_note_version(note_id)
+
+        etag = note_version_etag(note_id, version, request.GET.urlencode())
+        last_modified = version[0] if version else None
+
+        not_modified = conditional_response(request, etag, last_modified)
+
+        if not_modified is not None:
+            return not_modified
+
+        if fields is not None:
+            row = await services.aget_user_note_row(note_id, fields)
+
+            data = note_serializer.note_row_to_representation(row, fields)
+        else:
+            note = await services.aget_user_note(note_id)
+
+            data = note_serializer.NoteSeralizer(note).data
+
+        response = render_json(data)
+
+        set_validators(response, etag, last_modified)
+
+        return response
+
+
+class AsyncGenerateCSVApi(AsyncNoteView):
+    async def get(self, request):
+        # Async iterator, chunks are read without blocking the event loop
+        response = StreamingHttpResponse(
+            services.astream_notes_csv(),
+            content_type="text/csv",
+        )
+
+        response["Content-Disposition"] = 'attachment; filename="notes.csv"'
+
+        return response
+
+
+class AsyncExportJobApi(AsyncNoteView):
+    async def get(self, request, job_id):
+        job = await services.aget_export_job(request.user, job_id)
+
+        return render_json(note_serializer.ExportJobSerializer(job).data)
+
+
+class AsyncExportJobDownloadApi(AsyncNoteView):
+    async def get(self, request, job_id):
+        export_file = await services.aopen_export_file(request.user, job_id)
+
+        return FileResponse(
+            export_file,
+            as_attachment=True,
+            filename="notes.pdf",
+            content_type="application/pdf",
+        )
@@ -0,0 +1,605 @@
+"""Endpoint benchmarks on a seeded dataset.
+
+Users and notes are seeded with bulk inserts, then every url of note/urls.py
+and users/urls.py is driven through the test client. Each endpoint reports
+latency percentiles, SQL queries and SQL time per request, the payload size
+and the peak memory of one traced request. Used by the bench_endpoints
+command.
+
+Endpoints with the "sparse" variant ask for SPARSE_FIELDS only, reductions()
+compares their payload and SQL time with the full payload of the same url.
+"""
+
+import dataclasses
+import datetime
+import itertools
+import math
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+
+from note import models, services, urls as note_urls
+from users import services as user_services, urls as user_urls
+
+from typing import Callable
+
+PASSWORD = "benchmark-password"
+
+WORDS = (
+    "meeting",
+    "groceries",
+    "invoice",
+    "release",
+    "review",
+    "lorem",
+    "ipsum",
+    "travel",
+    "deadline",
+    "budget",
+)
+
+
+@dataclasses.dataclass
+class Dataset:
+    """Seeded rows the endpoints are driven with.
+
+    Class varibles
+    ----------
+    user : User
+        The authenticated user, owner of every users-th note
+
+    note_ids : list
+        Ids of notes of the user, read and updated by the endpoints
+
+    export_job_id : uuid
+        A finished pdf export of the user
+    """
+
+    user: "object"
+    note_ids: list
+    export_job_id: uuid.UUID = None
+    counter: "itertools.count" = dataclasses.field(default_factory=itertools.count)
+
+    def client(self) -> APIClient:
+        """A client logged in as the user, fresh so logout does not leak"""
+        client = APIClient()
+        client.cookies["jwt"] = user_services.create_token(self.user.id)
+
+        return client
+
+    def note_payload(self, **fields) -> dict:
+        return {
+            "title": f"Benchmark {next(self.counter)}",
+            "content": "Lorem ipsum dolor sit amet",
+            "due_date": (timezone.now() + datetime.timedelta(days=1)).isoformat(),
+            "is_complete": False,
+            "priority": 5,
+            **fields,
+        }
+
+    def new_notes(self, count: int) -> list:
+        """Notes created outside the timing, for the delete endpoints"""
+        created = services.bulk_create_notes(
+            self.user,
+            [
+                services.NoteDataClass(
+                    title=f"Benchmark {next(self.counter)}",
+                    content="Lorem ipsum dolor sit amet",
+                    due_date=timezone.now(),
+                    priority=5,
+                )
+                for _ in range(count)
+            ],
+        )
+
+        return [str(result.id) for result in created]
+
+
+@dataclasses.dataclass
+class Endpoint:
+    """One api under benchmark.
+
+    Class varibles
+    ----------
+    name : str
+        The url name, as in the urls.py files
+
+    method : str
+        The http method
+
+    request : Callable
+        Called with the Dataset before every run, outside the timing.
+        Returns (path, data) of the request
+
+    heavy : bool, default False
+        Reads every note (pdf, email), run at most HEAVY_REPEAT times
+
+    variant : str, default ""
+        Tells apart several benchmarks of the same url and method
+    """
+
+    name: str
+    method: str
+    request: Callable[["Dataset"], tuple]
+    heavy: bool = False
+    variant: str = ""
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} [{self.variant}]" if self.variant else self.name
+
+
+HEAVY_REPEAT = 3
+
+# ?fields= of the sparse variants, a summary view without the content
+SPARSE_FIELDS = "?fields=id,title,due_date"
+
+# Changes behind the cursor of the delta variant of the sync api
+DELTA_CHANGES = 10
+
+
+def _path(name: str, query: str = "", **kwargs) -> Callable:
+    return lambda dataset: (reverse(name, kwargs=kwargs) + query, None)
+
+
+def _note_path(dataset: "Dataset", note_id: str = None) -> str:
+    return reverse(
+        "Retreive update delete", kwargs={"note_id": note_id or dataset.note_ids[0]}
+    )
+
+
+def _reset_password_request(dataset: "Dataset") -> tuple:
+    # A reset changes the password hash, sign with the current one
+    user = get_user_model().objects.get(id=dataset.user.id)
+
+    uidb64 = urlsafe_base64_encode(force_bytes(user.id))
+    token = PasswordResetTokenGenerator().make_token(user)
+
+    path = reverse("reset_password_confirm", args=(uidb64, token))
+
+    return path, {"password": PASSWORD}
+
+
+def _changes_request(dataset: "Dataset") -> tuple:
+    # A client that missed the last DELTA_CHANGES changes of the user
+    last_synced = list(
+        models.Note.objects.filter(user_id=dataset.user.id)
+        .order_by("-change_seq", "-id")
+        .values_list("change_seq", "id")[DELTA_CHANGES : DELTA_CHANGES + 1]
+    )
+
+    # Fewer notes than that, the client missed them all
+    query = f"?since={services.encode_cursor(last_synced[0])}" if last_synced else ""
+
+    return reverse("note changes") + query, None
+
+
+ENDPOINTS = [
+    # users/urls.py
+    Endpoint(
+        "register",
+        "post",
+        lambda dataset: (
+            reverse("register"),
+            {
+                "first_name": "Bench",
+                "last_name": "Mark",
+                "email": f"register{next(dataset.counter)}@benchmark.test",
+                "password": PASSWORD,
+            },
+        ),
+    ),
+    Endpoint(
+        "login",
+        "post",
+        lambda dataset: (
+            reverse("login"),
+            {"email": dataset.user.email, "password": PASSWORD},
+        ),
+    ),
+    Endpoint("logout", "post", _path("logout")),
+    Endpoint("me", "get", _path("me")),
+    Endpoint(
+        "verify-email",
+        "post",
+        lambda dataset: (
+            reverse(
+                "verify-email",
+                kwargs={"token": user_services.create_token(dataset.user.id)},
+            ),
+            None,
+        ),
+    ),
+    Endpoint(
+        "request_password_email",
+        "post",
+        lambda dataset: (
+            reverse("request_password_email"),
+            {"email": dataset.user.email},
+        ),
+    ),
+    Endpoint("reset_password_confirm", "patch", _reset_password_request),
+    # note/urls.py, reads
+    Endpoint("create note", "get", _path("create note")),
+    Endpoint("all notes", "get", _path("all notes")),
+    Endpoint(
+        "all notes",
+        "get",
+        _path("all notes", "?status=unfinished&ordering=due_date"),
+        variant="filtered",
+    ),
+    Endpoint(
+        "all notes", "get", _path("all notes", SPARSE_FIELDS), variant="sparse"
+    ),
+    Endpoint(
+        "create note", "get", _path("create note", SPARSE_FIELDS), variant="sparse"
+    ),
+    Endpoint("search notes", "get", _path("search notes", "?q=budget")),
+    Endpoint("note stats", "get", _path("note stats")),
+    Endpoint("note changes", "get", _path("note changes")),
+    Endpoint("note changes", "get", _changes_request, variant="delta"),
+    Endpoint("unfinished", "get", _path("unfinished")),
+    Endpoint("finished", "get", _path("finished")),
+    Endpoint("overdue", "get", _path("overdue")),
+    Endpoint("order-duedate", "get", _path("order-duedate", order_arg="asc")),
+    Endpoint("order-priority", "get", _path("order-priority", order_arg="desc")),
+    Endpoint("order-created-at", "get", _path("order-created-at", order_arg="asc")),
+    Endpoint(
+        "Retreive update delete",
+        "get",
+        lambda dataset: (_note_path(dataset), None),
+    ),
+    Endpoint(
+        "Retreive update delete",
+        "get",
+        lambda dataset: (_note_path(dataset) + SPARSE_FIELDS, None),
+        variant="sparse",
+    ),
+    Endpoint(
+        "export job",
+        "get",
+        lambda dataset: (
+            reverse("export job", kwargs={"job_id": dataset.export_job_id}),
+            None,
+        ),
+    ),
+    Endpoint(
+        "export download",
+        "get",
+        lambda dataset: (
+            reverse("export download", kwargs={"job_id": dataset.export_job_id}),
+            None,
+        ),
+    ),
+    # note/urls.py, writes
+    Endpoint(
+        "create note",
+        "post",
+        lambda dataset: (reverse("create note"), dataset.note_payload()),
+    ),
+    Endpoint(
+        "Retreive update delete",
+        "put",
+        lambda dataset: (_note_path(dataset), dataset.note_payload(priority=7)),
+    ),
+    Endpoint(
+        "Retreive update delete",
+        "delete",
+        lambda dataset: (_note_path(dataset, dataset.new_notes(1)[0]), None),
+    ),
+    Endpoint(
+        "bulk notes",
+        "post",
+        lambda dataset: (
+            reverse("bulk notes"),
+            [dataset.note_payload() for _ in range(10)],
+        ),
+    ),
+    Endpoint(
+        "bulk notes",
+        "put",
+        lambda dataset: (
+            reverse("bulk notes"),
+            [
+                dataset.note_payload(id=note_id, priority=3)
+                for note_id in dataset.note_ids[:10]
+            ],
+        ),
+    ),
+    Endpoint(
+        "bulk notes",
+        "delete",
+        lambda dataset: (reverse("bulk notes"), {"ids": dataset.new_notes(10)}),
+    ),
+    # note/urls.py, every note
+    Endpoint("Generate csv", "get", _path("Generate csv"), heavy=True),
+    Endpoint("Generate pdf", "get", _path("Generate pdf"), heavy=True),
+    Endpoint("export pdf", "post", _path("export pdf"), heavy=True),
+    Endpoint("mail notes", "post", _path("mail notes"), heavy=True),
+]
+
+
+def uncovered_urls() -> list[str]:
+    """Names of the api urls no benchmark drives"""
+    covered = {endpoint.name for endpoint in ENDPOINTS}
+
+    return [
+        pattern.name
+        for pattern in [*user_urls.urlpatterns, *note_urls.urlpatterns]
+        if pattern.name not in covered
+    ]
+
+
+def seed(users: int, notes: int, seed: int = 0) -> "Dataset":
+    """Insert users and notes with bulk inserts
+
+    The same seed gives the same titles, priorities, statuses and due dates.
+
+    Parameters
+    ----------
+    users : int
+        Number of users, the first one is the authenticated user
+
+    notes : int
+        Number of notes, spread evenly over the users
+
+    seed : int, default 0
+        Seed of the generated values
+
+    Return
+    ------
+     Dataset: the seeded rows
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+
+    # Hashing is slow on purpose, every user shares one hash
+    password = make_password(PASSWORD)
+
+    user_rows = User.objects.bulk_create(
+        [
+            User(
+                id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                first_name=f"First {index}",
+                last_name=f"Last {index}",
+                email=f"user{index}@benchmark.test",
+                password=password,
+                is_email_verified=True,
+            )
+            for index in range(max(users, 1))
+        ],
+        batch_size=settings.NOTE_BULK_BATCH_SIZE,
+    )
+
+    now = timezone.now()
+    chunk = []
+
+    for index in range(notes):
+        chunk.append(
+            models.Note(
+                id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                user_id=user_rows[index % len(user_rows)].id,
+                title=" ".join(rng.choices(WORDS, k=3)),
+                content=" ".join(rng.choices(WORDS, k=20)),
+                due_date=now + datetime.timedelta(minutes=rng.randint(-43200, 43200)),
+                is_complete=rng.random() < 0.3,
+                priority=rng.randint(1, 10),
+            )
+        )
+
+        if len(chunk) == settings.NOTE_EXPORT_CHUNK_SIZE:
+            models.Note.objects.bulk_create(
+                chunk, batch_size=settings.NOTE_BULK_BATCH_SIZE
+            )
+            chunk = []
+
+    models.Note.objects.bulk_create(chunk, batch_size=settings.NOTE_BULK_BATCH_SIZE)
+
+    # bulk_create skips the counters
+    services.reconcile_note_stats()
+
+    user = User.objects.get(id=user_rows[0].id)
+
+    note_ids = list(
+        models.Note.objects.filter(user=user)
+        .order_by("id")
+        .values_list("id", flat=True)[:10]
+    )
+
+    dataset = Dataset(user=user, note_ids=[str(note_id) for note_id in note_ids])
+
+    if not dataset.note_ids:
+        dataset.note_ids = dataset.new_notes(10)
+
+    # Rendering is measured by the pdf endpoints, the download serves a file
+    job = models.ExportJob.objects.create(user=user)
+    file_name = services.export_storage().save(
+        f"{job.id}.pdf", ContentFile(b"%PDF-1.4\n" + rng.randbytes(256 * 1024))
+    )
+    models.ExportJob.objects.filter(id=job.id).update(
+        status=models.ExportJob.STATUS_DONE,
+        file_name=file_name,
+        finished_at=timezone.now(),
+    )
+    dataset.export_job_id = job.id
+
+    return dataset
+
+
+def percentile(timings: list[float], percent: float) -> float:
+    """Nearest rank percentile of sorted timings"""
+    rank = math.ceil(percent / 100 * len(timings))
+
+    return timings[max(rank, 1) - 1]
+
+
+class QueryTimer:
+    """Counts the queries run on a connection and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _send(endpoint: "Endpoint", dataset: "Dataset"):
+    path, data = endpoint.request(dataset)
+    client = dataset.client()
+
+    started = time.perf_counter()
+
+    response = getattr(client, endpoint.method)(path, data, format="json")
+
+    # Streamed bodies are produced while read
+    if response.streaming:
+        size = len(b"".join(response.streaming_content))
+    else:
+        size = len(response.content)
+
+    elapsed = time.perf_counter() - started
+
+    response.close()
+
+    return response, elapsed, size
+
+
+def measure(endpoint: "Endpoint", dataset: "Dataset", repeat: int) -> dict:
+    """Benchmark one endpoint
+
+    Parameters
+    ----------
+    endpoint : Endpoint
+        The api to drive
+
+    dataset : Dataset
+        The seeded rows
+
+    repeat : int
+        Timed requests, after one untimed warm up request
+
+    Return
+    ------
+     result: dict
+    """
+    if endpoint.heavy:
+        repeat = min(repeat, HEAVY_REPEAT)
+
+    response, _, size = _send(endpoint, dataset)
+
+    timings = []
+    query_counts = []
+    sql_times = []
+
+    for _ in range(max(repeat, 1)):
+        queries = QueryTimer()
+
+        with connection.execute_wrapper(queries):
+            response, elapsed, size = _send(endpoint, dataset)
+
+        timings.append(elapsed * 1000)
+        query_counts.append(queries.count)
+        sql_times.append(queries.seconds * 1000)
+
+    # Traced apart, tracemalloc slows every allocation down
+    tracemalloc.start()
+
+    try:
+        _send(endpoint, dataset)
+        peak = tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+
+    return {
+        "name": endpoint.label,
+        "url": endpoint.name,
+        "variant": endpoint.variant,
+        "method": endpoint.method.upper(),
+        "status": response.status_code,
+        "runs": len(timings),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": statistics.median_low(query_counts),
+        "sql_ms": round(statistics.median(sql_times), 3),
+        "payload_bytes": size,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def reductions(results: list[dict], variant: str = "sparse") -> list[dict]:
+    """Payload and SQL time of the variant runs against the plain run of the url
+
+    Parameters
+    ----------
+    results : list[dict]
+        Results of measure()
+
+    variant : str, default "sparse"
+        The variant compared with the plain runs
+
+    Return
+    ------
+     reductions: list[dict], the share saved, 0.25 for a quarter less
+    """
+    plain = {
+        (result["method"], result["url"]): result
+        for result in results
+        if not result["variant"]
+    }
+
+    compared = []
+
+    for result in results:
+        full = plain.get((result["method"], result["url"]))
+
+        if result["variant"] != variant or full is None:
+            continue
+
+        compared.append(
+            {
+                "name": result["name"],
+                "method": result["method"],
+                "payload": (
+                    1 - result["payload_bytes"] / full["payload_bytes"]
+                    if full["payload_bytes"]
+                    else 0.0
+                ),
+                "sql": 1 - result["sql_ms"] / full["sql_ms"] if full["sql_ms"] else 0.0,
+            }
+        )
+
+    return compared
+
+
+def run(dataset: "Dataset", repeat: int, endpoints: list = None) -> list[dict]:
+    """Benchmark endpoints in order, every one of ENDPOINTS when None"""
+    return [
+        measure(endpoint, dataset, repeat) for endpoint in endpoints or ENDPOINTS
+    ]
@@ -0,0 +1,168 @@
+"""Local worker pool running the background note exports.
+
+The ExportJob table is the queue: a job is claimed by atomically moving it
+from pending to running, so the in process pool and the run_export_jobs
+command can work side by side without an external broker. A claim expires
+after NOTE_EXPORT_LEASE, the running jobs of a worker that died (restart,
+deploy) are then taken over by the next run_export_jobs poll.
+"""
+
+import datetime
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import models, services
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Lazily start the process wide export worker pool"""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.NOTE_EXPORT_WORKERS,
+            thread_name_prefix="note-export",
+        )
+
+    return _executor
+
+
+def schedule_export_job(job_id: uuid.UUID) -> None:
+    """Hand a committed job to the worker pool
+
+    Parameters
+    ----------
+    job_id : uuid
+        The job to run
+    """
+    if settings.NOTE_EXPORT_RUN_INLINE:
+        run_export_job(job_id)
+        return
+
+    get_executor().submit(_run_in_worker, job_id)
+
+
+def _run_in_worker(job_id: uuid.UUID) -> None:
+    # Worker threads own their db connection, drop it once the job is done
+    close_old_connections()
+
+    try:
+        run_export_job(job_id)
+
+    except Exception:
+        logger.exception("Export job %s crashed", job_id)
+
+    finally:
+        close_old_connections()
+
+
+def _claimable(now: datetime.datetime) -> Q:
+    # Pending jobs, and running jobs whose worker let the claim expire
+    return Q(status=models.ExportJob.STATUS_PENDING) | Q(
+        status=models.ExportJob.STATUS_RUNNING, claimed_until__lt=now
+    )
+
+
+def claim_export_job(job_id: uuid.UUID) -> "uuid.UUID | None":
+    """Move a job to running for NOTE_EXPORT_LEASE seconds
+
+    Parameters
+    ----------
+    job_id : uuid
+        The job to claim
+
+    Return
+    ------
+     claim token: uuid, None if another worker holds the job
+    """
+    now = timezone.now()
+    claim_token = uuid.uuid4()
+
+    claimed = models.ExportJob.objects.filter(_claimable(now), id=job_id).update(
+        status=models.ExportJob.STATUS_RUNNING,
+        started_at=now,
+        claimed_until=now + datetime.timedelta(seconds=settings.NOTE_EXPORT_LEASE),
+        claim_token=claim_token,
+    )
+
+    return claim_token if claimed else None
+
+
+def run_export_job(job_id: uuid.UUID) -> None:
+    """Render the pdf of a job and store it
+
+    Parameters
+    ----------
+    job_id : uuid
+        The job to run
+    """
+    claim_token = claim_export_job(job_id)
+
+    if claim_token is None:
+        return
+
+    # Only while the claim is ours, a worker that took the job over finishes it
+    job = models.ExportJob.objects.filter(id=job_id, claim_token=claim_token)
+
+    try:
+        pdf = services.render_notes_pdf()
+
+        file_name = services.export_storage().save(
+            f"{job_id}.pdf", ContentFile(pdf)
+        )
+
+    except Exception as error:
+        job.update(
+            status=models.ExportJob.STATUS_FAILED,
+            error=str(error),
+            finished_at=timezone.now(),
+            claimed_until=None,
+            claim_token=None,
+        )
+        return
+
+    finished = job.update(
+        status=models.ExportJob.STATUS_DONE,
+        file_name=file_name,
+        finished_at=timezone.now(),
+        claimed_until=None,
+        claim_token=None,
+    )
+
+    if not finished:
+        services.export_storage().delete(file_name)
+
+
+def run_pending_export_jobs(limit: int = None) -> int:
+    """Run queued jobs and expired running ones oldest first in the thread
+
+    Parameters
+    ----------
+    limit : int, default None
+        Maximum number of jobs to run
+
+    Return
+    ------
+     number of jobs looked at: int
+    """
+    pending = models.ExportJob.objects.filter(_claimable(timezone.now())).order_by(
+        "created_at"
+    )
+
+    job_ids = list(pending.values_list("id", flat=True)[:limit])
+
+    for job_id in job_ids:
+        run_export_job(job_id)
+
+    return len(job_ids)
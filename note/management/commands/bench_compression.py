@@ -0,0 +1,133 @@
+import csv
+import datetime
+import io
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from drf import compression
+from drf.renderers import JSONRenderer
+from note import serializers as note_serializer, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU cost and the bytes saved of the br and gzip levels "
+        "on a note list payload and a streamed csv export. No database is "
+        "needed."
+    )
+
+    # (encoding, level) pairs, the settings defaults among them
+    LEVELS = (
+        ("gzip", 1),
+        ("gzip", 6),
+        ("gzip", 9),
+        ("br", 1),
+        ("br", 4),
+        ("br", 6),
+        ("br", 9),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="Runs per level, best is kept."
+        )
+
+    def handle(self, *args, **options):
+        rows = self.sample(options["rows"], options["users"])
+
+        payloads = {
+            "json": [
+                JSONRenderer().render(
+                    {
+                        "next": None,
+                        "previous": None,
+                        "results": note_serializer.note_rows_to_representation(rows),
+                    }
+                )
+            ],
+            # Line by line, as GenerateCSVApi streams it
+            "csv": self.csv_lines(rows),
+        }
+
+        self.stdout.write(
+            f"{'payload':<8}{'encoding':<10}{'level':>5}{'raw KB':>10}"
+            f"{'sent KB':>10}{'saved':>8}{'ms':>9}{'MB/s':>9}"
+        )
+
+        for name, chunks in payloads.items():
+            size = sum(len(chunk) for chunk in chunks)
+
+            for encoding, level in self.LEVELS:
+                if encoding not in compression.available_encodings():
+                    continue
+
+                def run():
+                    return b"".join(
+                        compression.compress_stream(chunks, encoding, level)
+                    )
+
+                sent = len(run())
+                seconds = self.best_of(run, options["repeat"])
+
+                self.stdout.write(
+                    f"{name:<8}{encoding:<10}{level:>5}{size / 1024:>10.1f}"
+                    f"{sent / 1024:>10.1f}{1 - sent / size:>8.0%}"
+                    f"{seconds * 1000:>9.1f}{size / seconds / 1e6:>9.1f}"
+                )
+
+    def sample(self, count: int, user_count: int) -> list[tuple]:
+        """In memory NOTE_ROW_COLUMNS rows"""
+        users = [
+            (
+                uuid.uuid4(),
+                f"First {index}",
+                f"Last {index}",
+                f"user{index}@example.com",
+            )
+            for index in range(max(user_count, 1))
+        ]
+
+        start = timezone.now()
+
+        return [
+            (
+                uuid.uuid4(),
+                f"Note {index}",
+                "Lorem ipsum dolor sit amet " * 4,
+                start - datetime.timedelta(seconds=index),
+                start + datetime.timedelta(days=index % 30),
+                index % 10 + 1,
+                index % 2 == 0,
+                *users[index % len(users)],
+                True,
+            )
+            for index in range(count)
+        ]
+
+    def csv_lines(self, rows: list) -> list[bytes]:
+        lines = []
+
+        # is_email_verified is not exported
+        csv_rows = [services._csv_row(row[:-1]) for row in rows]
+
+        for row in [services.CSV_HEADER, *csv_rows]:
+            line = io.StringIO()
+            csv.writer(line).writerow(row)
+            lines.append(line.getvalue().encode())
+
+        return lines
+
+    def best_of(self, func, repeat: int) -> float:
+        timings = []
+
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+
+        return min(timings)
@@ -0,0 +1,205 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from note import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and benchmark every api of "
+        "note/urls.py and users/urls.py, results are saved as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--notes", type=int, default=10000)
+        parser.add_argument(
+            "--repeat", type=int, default=50, help="Timed requests per endpoint."
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the generated rows."
+        )
+        parser.add_argument(
+            "--skip",
+            nargs="*",
+            default=[],
+            help="Url names left out, e.g. 'Generate pdf' on large datasets.",
+        )
+        parser.add_argument(
+            "--output",
+            help="JSON file, benchmark-results/<commit>-<users>x<notes>.json "
+            "by default.",
+        )
+        parser.add_argument(
+            "--baseline", help="JSON file of an earlier run to compare p50 with."
+        )
+
+    def handle(self, *args, **options):
+        missing = benchmarks.uncovered_urls()
+
+        if missing:
+            raise CommandError("No benchmark for urls: " + ", ".join(missing))
+
+        endpoints = [
+            endpoint
+            for endpoint in benchmarks.ENDPOINTS
+            if endpoint.name not in options["skip"]
+        ]
+
+        commit = self.git_commit()
+
+        # Locmem email and a test database per alias (replicas mirror default,
+        # shards get their own), nothing real is touched
+        setup_test_environment()
+        old_config = setup_databases(
+            verbosity=0,
+            interactive=False,
+            aliases=set(connections),
+            serialized_aliases=set(),
+        )
+        exports = tempfile.TemporaryDirectory()
+
+        try:
+            # Own cache, entries of other runs would be served otherwise.
+            # Background work runs inline, no worker skews the next endpoint
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                        "LOCATION": "note-benchmarks",
+                    }
+                },
+                NOTE_EXPORT_RUN_INLINE=True,
+                NOTE_EXPORT_ROOT=exports.name,
+                EMAIL_OUTBOX_RUN_INLINE=True,
+            ):
+                started = time.perf_counter()
+                dataset = benchmarks.seed(
+                    options["users"], options["notes"], options["seed"]
+                )
+                self.stdout.write(
+                    f"Seeded {options['users']} users and {options['notes']} notes "
+                    f"in {time.perf_counter() - started:.1f} s"
+                )
+
+                results = []
+
+                for endpoint in endpoints:
+                    result = benchmarks.measure(endpoint, dataset, options["repeat"])
+                    results.append(result)
+
+                    self.write_result(result)
+
+        finally:
+            exports.cleanup()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "commit": commit,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "users": options["users"],
+            "notes": options["notes"],
+            "seed": options["seed"],
+            "repeat": options["repeat"],
+            "endpoints": results,
+            "sparse_reductions": benchmarks.reductions(results),
+        }
+
+        output = options["output"] or os.path.join(
+            "benchmark-results",
+            f"{(commit or 'nocommit')[:12]}-{options['users']}x{options['notes']}.json",
+        )
+
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+        self.write_reductions(report["sparse_reductions"])
+
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {output}"))
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"])
+
+    def write_result(self, result: dict) -> None:
+        self.stdout.write(
+            f"{result['method']:<7}{result['name']:<34}{result['status']:>4}"
+            f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+            f"{result['p99_ms']:>10.1f} ms{result['queries']:>5} queries"
+            f"{result['sql_ms']:>9.1f} ms sql{result['payload_bytes'] / 1024:>10.1f} KB"
+            f"{result['peak_memory_kb']:>10.0f} KB peak"
+        )
+
+    def write_reductions(self, reductions: list) -> None:
+        """Print what the sparse fieldsets save against the full payloads"""
+        if not reductions:
+            return
+
+        self.stdout.write(f"Sparse fieldsets ({benchmarks.SPARSE_FIELDS}) saved")
+
+        for reduction in reductions:
+            self.stdout.write(
+                f"{reduction['method']:<7}{reduction['name']:<34}"
+                f"{reduction['payload']:>9.0%} payload{reduction['sql']:>9.0%} sql"
+            )
+
+    def compare(self, results: list, baseline_path: str) -> None:
+        """Print the p50 change of every endpoint against an earlier run"""
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+
+        before = {
+            (result["method"], result["name"]): result
+            for result in baseline["endpoints"]
+        }
+
+        self.stdout.write(f"p50 against {baseline.get('commit') or baseline_path}")
+
+        for result in results:
+            previous = before.get((result["method"], result["name"]))
+
+            if previous is None or not previous["p50_ms"]:
+                continue
+
+            change = result["p50_ms"] / previous["p50_ms"] - 1
+
+            self.stdout.write(
+                f"{result['method']:<7}{result['name']:<34}{change:>+9.0%}"
+            )
+
+    def git_commit(self) -> str:
+        try:
+            completed = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+        return completed.stdout.strip()
@@ -0,0 +1,137 @@
+import datetime
+import io
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import parsers, renderers
+
+from drf import renderers as drf_renderers
+from note import serializers as note_serializer, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the DRF JSON renderer and parser with the orjson ones of "
+        "drf/renderers.py on a note page, checking they give the same bytes. "
+        "No database is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Runs per class, best is kept."
+        )
+
+    def handle(self, *args, **options):
+        if drf_renderers.orjson is None:
+            raise CommandError("orjson is not installed, nothing to compare")
+
+        rows = self.sample(options["rows"], options["users"])
+
+        page = services.NotePage(results=rows)
+
+        # As the list apis pass it, a ReturnDict of plain dicts
+        data = note_serializer.NotePageSerializer(page).data
+
+        drf_content = renderers.JSONRenderer().render(data)
+        content = drf_renderers.JSONRenderer().render(data)
+
+        if content != drf_content:
+            raise CommandError("orjson renderer output differs from JSONRenderer")
+
+        def parse(parser):
+            return lambda: parser.parse(io.BytesIO(content))
+
+        if parse(drf_renderers.JSONParser())() != parse(parsers.JSONParser())():
+            raise CommandError("orjson parser output differs from JSONParser")
+
+        per_10k = 10000 / max(options["rows"], 1)
+
+        timings = [
+            (
+                "render",
+                "JSONRenderer",
+                self.best_of(
+                    lambda: renderers.JSONRenderer().render(data), options["repeat"]
+                ),
+            ),
+            (
+                "render",
+                "orjson",
+                self.best_of(
+                    lambda: drf_renderers.JSONRenderer().render(data),
+                    options["repeat"],
+                ),
+            ),
+            (
+                "parse",
+                "JSONParser",
+                self.best_of(parse(parsers.JSONParser()), options["repeat"]),
+            ),
+            (
+                "parse",
+                "orjson",
+                self.best_of(parse(drf_renderers.JSONParser()), options["repeat"]),
+            ),
+        ]
+
+        self.stdout.write(
+            f"rows          {options['rows']}, {len(content) / 1024:.0f} KB"
+        )
+
+        for action, name, seconds in timings:
+            self.stdout.write(
+                f"{action:<7}{name:<14}{seconds * 1000:9.1f} ms"
+                f"{seconds * 1000 * per_10k:9.1f} ms per 10k notes"
+            )
+
+        for action in ("render", "parse"):
+            stdlib, fast = [
+                seconds for kind, _, seconds in timings if kind == action
+            ]
+
+            self.stdout.write(
+                self.style.SUCCESS(f"{action:<7}speedup       {stdlib / fast:9.1f}x")
+            )
+
+    def sample(self, count: int, user_count: int) -> list[tuple]:
+        """In memory NOTE_ROW_COLUMNS rows"""
+        users = [
+            (
+                uuid.uuid4(),
+                f"First {index}",
+                f"Last {index}",
+                f"user{index}@example.com",
+            )
+            for index in range(max(user_count, 1))
+        ]
+
+        start = timezone.now()
+
+        return [
+            (
+                uuid.uuid4(),
+                f"Note {index}",
+                "Lorem ipsum dolor sit amet, café " * 4,
+                start - datetime.timedelta(seconds=index),
+                start + datetime.timedelta(days=index % 30),
+                index % 10 + 1,
+                index % 2 == 0,
+                *users[index % len(users)],
+                True,
+            )
+            for index in range(count)
+        ]
+
+    def best_of(self, func, repeat: int) -> float:
+        timings = []
+
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+
+        return min(timings)
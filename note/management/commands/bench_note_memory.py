@@ -0,0 +1,111 @@
+import datetime
+import gc
+import tracemalloc
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from note import models, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the memory held per note by model instances and by "
+        "NoteDataClass rows with shared user records. No database is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=100)
+
+    def handle(self, *args, **options):
+        count = options["rows"]
+        user_count = max(options["users"], 1)
+
+        user_rows = [
+            (
+                uuid.uuid4(),
+                f"First {index}",
+                f"Last {index}",
+                f"user{index}@example.com",
+                True,
+            )
+            for index in range(user_count)
+        ]
+
+        start = timezone.now()
+
+        def rows():
+            # Fresh values per row, as read from the db
+            for index in range(count):
+                yield (
+                    uuid.uuid4(),
+                    f"Note {index}",
+                    f"Lorem ipsum dolor sit amet {index}",
+                    start - datetime.timedelta(seconds=index),
+                    start + datetime.timedelta(days=index % 30),
+                    index % 10 + 1,
+                    index % 2 == 0,
+                    *user_rows[index % user_count],
+                )
+
+        def model_instances():
+            # select_related builds one User instance per note
+            User = get_user_model()
+
+            return [
+                models.Note(
+                    id=row[0],
+                    title=row[1],
+                    content=row[2],
+                    created_at=row[3],
+                    due_date=row[4],
+                    priority=row[5],
+                    is_complete=row[6],
+                    user=User(
+                        id=row[7],
+                        first_name=row[8],
+                        last_name=row[9],
+                        email=row[10],
+                        is_email_verified=row[11],
+                    ),
+                )
+                for row in rows()
+            ]
+
+        def data_classes():
+            users = {}
+
+            return [services.NoteDataClass.from_row(row, users) for row in rows()]
+
+        model_bytes = self.retained(model_instances) / count
+        row_bytes = self.retained(data_classes) / count
+
+        self.stdout.write(f"{'rows':<23}{count:>9}")
+        self.stdout.write(f"{'model instances':<23}{model_bytes:9.0f} bytes/note")
+        self.stdout.write(
+            f"{'NoteDataClass.from_row':<23}{row_bytes:9.0f} bytes/note"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{'saved':<23}{1 - row_bytes / model_bytes:9.0%}")
+        )
+
+    def retained(self, build) -> int:
+        """Bytes still allocated once build() returned, its result included"""
+        gc.collect()
+        tracemalloc.start()
+
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            result = build()
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+
+        finally:
+            tracemalloc.stop()
+
+        del result
+
+        return after - before
@@ -0,0 +1,114 @@
+import datetime
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from note import models, serializers as note_serializer, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare NoteSeralizer with the NoteRowsField fast path on in memory "
+        "notes. No database is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Runs per path, best is kept."
+        )
+
+    def handle(self, *args, **options):
+        notes, rows = self.sample(options["rows"], options["users"])
+
+        renderer = JSONRenderer()
+
+        def drf_path():
+            results = [services.NoteDataClass.from_instance(note) for note in notes]
+
+            return renderer.render(
+                note_serializer.NoteSeralizer(results, many=True).data
+            )
+
+        def fast_path():
+            return renderer.render(note_serializer.note_rows_to_representation(rows))
+
+        if drf_path() != fast_path():
+            raise CommandError("Fast path output differs from NoteSeralizer")
+
+        drf_time = self.best_of(drf_path, options["repeat"])
+        fast_time = self.best_of(fast_path, options["repeat"])
+
+        self.stdout.write(f"rows          {options['rows']}")
+        self.stdout.write(f"NoteSeralizer {drf_time * 1000:9.1f} ms")
+        self.stdout.write(f"NoteRowsField {fast_time * 1000:9.1f} ms")
+        self.stdout.write(
+            self.style.SUCCESS(f"speedup       {drf_time / fast_time:9.1f}x")
+        )
+
+    def sample(self, count: int, user_count: int) -> tuple[list, list]:
+        """Unsaved notes and the matching NOTE_ROW_COLUMNS rows"""
+        users = [
+            get_user_model()(
+                id=uuid.uuid4(),
+                first_name=f"First {index}",
+                last_name=f"Last {index}",
+                email=f"user{index}@example.com",
+                is_email_verified=True,
+            )
+            for index in range(max(user_count, 1))
+        ]
+
+        start = timezone.now()
+
+        notes = []
+        rows = []
+
+        for index in range(count):
+            user = users[index % len(users)]
+
+            note = models.Note(
+                id=uuid.uuid4(),
+                title=f"Note {index}",
+                content="Lorem ipsum dolor sit amet " * 4,
+                created_at=start - datetime.timedelta(seconds=index),
+                due_date=start + datetime.timedelta(days=index % 30),
+                priority=index % 10 + 1,
+                is_complete=index % 2 == 0,
+                user=user,
+            )
+
+            notes.append(note)
+            rows.append(
+                (
+                    note.id,
+                    note.title,
+                    note.content,
+                    note.created_at,
+                    note.due_date,
+                    note.priority,
+                    note.is_complete,
+                    user.id,
+                    user.first_name,
+                    user.last_name,
+                    user.email,
+                    user.is_email_verified,
+                )
+            )
+
+        return notes, rows
+
+    def best_of(self, func, repeat: int) -> float:
+        timings = []
+
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+
+        return min(timings)
@@ -0,0 +1,246 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from note import services
+
+
+class RollbackQueries(Exception):
+    """Raised to roll back the sample rows written while capturing"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on every query issued by note/services.py and fail "
+        "when one of them does a full table scan."
+    )
+
+    # Exports read every note on purpose
+    full_scan_allowed = ("get_export_notes", "stream_notes_csv")
+
+    def handle(self, *args, **options):
+        captured = self.capture_service_queries()
+
+        failures = []
+
+        for name, sql in captured:
+            plan = self.explain(sql)
+
+            full_scan = name not in self.full_scan_allowed and self.is_full_scan(
+                plan
+            )
+
+            if full_scan:
+                failures.append(name)
+
+            self.stdout.write(f"{'FULL SCAN' if full_scan else 'OK':<9} {name}")
+
+            if options["verbosity"] > 1:
+                self.stdout.write(f"    {sql}")
+
+                for line in plan:
+                    self.stdout.write(f"    {line}")
+
+        if failures:
+            raise CommandError(
+                "Full table scan in: " + ", ".join(sorted(set(failures)))
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"{len(captured)} queries checked"))
+
+    def capture_service_queries(self) -> list[tuple[str, str]]:
+        """Call every service function on sample rows and record their SQL"""
+        captured = []
+
+        def capture(name, func, *args, **kwargs):
+            with CaptureQueriesContext(connection) as queries:
+                result = func(*args, **kwargs)
+
+            for query in queries.captured_queries:
+                sql = query["sql"]
+
+                if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    captured.append((name, sql))
+
+            return result
+
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create(
+                    first_name="Explain",
+                    last_name="Queries",
+                    email="explain-note-queries@example.com",
+                )
+
+                note = capture(
+                    "create_note",
+                    services.create_note,
+                    user,
+                    services.NoteDataClass(
+                        title="Explain",
+                        content="Explain",
+                        due_date=timezone.now() - datetime.timedelta(days=1),
+                        priority=1,
+                    ),
+                )
+                services.create_note(user, note)
+
+                page = capture("get_user_notes", services.get_user_notes, user, 1)
+                capture(
+                    "get_user_notes", services.get_user_notes, user, 1, page.next
+                )
+
+                for name in (
+                    "get_notes",
+                    "get_unfinished_note",
+                    "get_finished_note",
+                    "get_overdue_note",
+                ):
+                    page = capture(name, getattr(services, name), 1)
+                    capture(name, getattr(services, name), 1, page.next)
+
+                for name in (
+                    "get_order_by_due_date_note",
+                    "get_order_by_priority_note",
+                    "get_order_by_created_at_note",
+                ):
+                    for order_arg in ("asc", "desc"):
+                        page = capture(name, getattr(services, name), order_arg, 1)
+                        capture(
+                            name, getattr(services, name), order_arg, 1, page.next
+                        )
+
+                for ordering, filters in (
+                    (None, {}),
+                    ("-priority,due_date", {}),
+                    ("due_date", {"status": "unfinished"}),
+                    (None, {"status": "finished"}),
+                    ("due_date", {"status": "finished"}),
+                    (None, {"priority": 8}),
+                    ("due_date", {"priority": 8}),
+                    (
+                        "due_date",
+                        {"due_before": timezone.now(), "priority__gte": 8},
+                    ),
+                ):
+                    page = capture(
+                        "query_notes", services.query_notes, 1, None, ordering, **filters
+                    )
+                    capture(
+                        "query_notes",
+                        services.query_notes,
+                        1,
+                        page.next,
+                        ordering,
+                        **filters,
+                    )
+
+                capture("get_export_notes", services.get_export_notes)
+                capture(
+                    "stream_notes_csv", lambda: list(services.stream_notes_csv())
+                )
+                capture("get_user_note", services.get_user_note, str(note.id))
+                capture(
+                    "get_user_note_row",
+                    services.get_user_note_row,
+                    str(note.id),
+                    services.parse_note_fields("id,title"),
+                )
+                page = capture(
+                    "search_user_notes", services.search_user_notes, user, "explain", 1
+                )
+                capture(
+                    "search_user_notes",
+                    services.search_user_notes,
+                    user,
+                    "explain",
+                    1,
+                    page.next,
+                )
+                capture(
+                    "get_user_notes_version", services.get_user_notes_version, user
+                )
+                capture("get_note_version", services.get_note_version, str(note.id))
+                capture("get_note_stats", services.get_note_stats, user)
+                changes = capture(
+                    "get_note_changes", services.get_note_changes, user, 1
+                )
+                capture(
+                    "update_user_note",
+                    services.update_user_note,
+                    user,
+                    str(note.id),
+                    note,
+                )
+                capture("bulk_update_notes", services.bulk_update_notes, user, [note])
+                capture(
+                    "delete_user_note", services.delete_user_note, user, str(note.id)
+                )
+                # Notes and tombstones changed after the first sync
+                capture(
+                    "get_note_changes",
+                    services.get_note_changes,
+                    user,
+                    1,
+                    changes.since,
+                )
+
+                created = capture(
+                    "bulk_create_notes", services.bulk_create_notes, user, [note]
+                )
+                capture(
+                    "bulk_delete_notes",
+                    services.bulk_delete_notes,
+                    user,
+                    [result.id for result in created],
+                )
+
+                raise RollbackQueries
+
+        except RollbackQueries:
+            pass
+
+        return captured
+
+    def explain(self, sql: str) -> list[str]:
+        """Return the query plan of a statement as text lines"""
+        prefix = "EXPLAIN QUERY PLAN" if connection.vendor == "sqlite" else "EXPLAIN"
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"{prefix} {sql}")
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+
+        if connection.vendor == "mysql":
+            return [str(dict(zip(columns, row))) for row in rows]
+
+        if connection.vendor == "sqlite":
+            return [str(row[-1]) for row in rows]
+
+        return [str(row[0]) for row in rows]
+
+    def is_full_scan(self, plan: list[str]) -> bool:
+        """Check a query plan for a table scan that uses no index"""
+        for line in plan:
+            if connection.vendor == "sqlite":
+                # Virtual tables are scanned through their own (FTS5) index
+                if (
+                    line.startswith("SCAN ")
+                    and " USING " not in line
+                    and "VIRTUAL TABLE" not in line
+                    and "sqlite_master" not in line
+                ):
+                    return True
+
+            elif connection.vendor == "mysql":
+                if "'type': 'ALL'" in line:
+                    return True
+
+            elif "Seq Scan" in line:
+                return True
+
+        return False
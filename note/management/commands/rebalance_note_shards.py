@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from note import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the notes of every user whose shard is not their shard on the "
+        "hash ring of NOTE_SHARDS, e.g. after adding a shard or enabling "
+        "sharding. Users are moved one at a time, their notes in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Notes copied or deleted per statement.",
+        )
+        parser.add_argument(
+            "--limit", type=int, help="Move at most this many users in this run."
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the moves without moving anything.",
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.is_enabled():
+            raise CommandError("No note shards configured, see NOTE_SHARDS")
+
+        moves = sharding.misplaced_users()[: options["limit"]]
+
+        moved = 0
+
+        for user_id, source, target in moves:
+            if options["dry_run"]:
+                self.stdout.write(f"{user_id}: {source} -> {target}")
+                continue
+
+            notes = sharding.move_user(user_id, target, options["batch_size"])
+            moved += notes
+
+            self.stdout.write(f"{user_id}: {source} -> {target}, {notes} notes")
+
+        if options["dry_run"]:
+            self.stdout.write(f"{len(moves)} users to move")
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Moved {len(moves)} users and {moved} notes")
+        )
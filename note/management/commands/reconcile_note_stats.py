@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from note import services
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the NoteStats counters of every user from a single aggregate "
+        "query over the notes."
+    )
+
+    def handle(self, *args, **options):
+        users = services.reconcile_note_stats()
+
+        self.stdout.write(self.style.SUCCESS(f"Note stats rebuilt for {users} users"))
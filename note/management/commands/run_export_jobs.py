@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from note import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued note export jobs, once or as a polling worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the queue instead of exiting when it is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls in loop mode.",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=10,
+            help="Maximum number of jobs taken per poll.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = jobs.run_pending_export_jobs(options["batch"])
+
+            if count:
+                self.stdout.write(f"Ran {count} export job(s)")
+
+            if not options["loop"]:
+                return
+
+            if count < options["batch"]:
+                time.sleep(options["interval"])
@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary onto every SQLite replica, the local "
+        "stand-in of replication (DB_SQLITE_REPLICA=1). Replicas lag until "
+        "the next run."
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES["default"]
+
+        if "sqlite3" not in primary["ENGINE"]:
+            raise CommandError("Only SQLite databases are copied, MySQL replicates")
+
+        for alias in settings.DATABASE_REPLICAS:
+            # Open handles of this process would see a half copied file
+            connections[alias].close()
+
+            source = sqlite3.connect(primary["NAME"])
+            target = sqlite3.connect(settings.DATABASES[alias]["NAME"])
+
+            try:
+                with target:
+                    source.backup(target)
+
+            finally:
+                source.close()
+                target.close()
+
+            self.stdout.write(self.style.SUCCESS(f"{alias} synced"))
@@ -7,8 +7,12 @@ import uuid
 class Note(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
+    # No constraint, notes may live on a shard without the users table
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, verbose_name="user", on_delete=models.CASCADE
+        settings.AUTH_USER_MODEL,
+        verbose_name="user",
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
 
     title = models.CharField(
@@ -19,6 +23,8 @@ class Note(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date created")
 
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date updated")
+
     due_date = models.DateTimeField(verbose_name="due date", blank=False, null=False)
 
     is_complete = models.BooleanField(default=False, verbose_name="is complete")
@@ -29,5 +35,201 @@ class Note(models.Model):
         verbose_name="Priority",
     )
 
+    # Per user, from NoteStats.change_seq on every write of the note services,
+    # 0 for notes written before it existed
+    change_seq = models.BigIntegerField(default=0, verbose_name="change sequence")
+
+    class Meta:
+        indexes = [
+            # Per user access paths
+            models.Index(
+                fields=["user", "is_complete", "due_date"],
+                name="note_user_complete_due_idx",
+            ),
+            models.Index(fields=["user", "priority"], name="note_user_priority_idx"),
+            models.Index(fields=["user", "created_at"], name="note_user_created_idx"),
+            # Change marker of the conditional get apis
+            models.Index(fields=["user", "updated_at"], name="note_user_updated_idx"),
+            # Delta sync, changes after a cursor
+            models.Index(
+                fields=["user", "change_seq", "id"], name="note_user_change_idx"
+            ),
+            # Keyset pagination of the list apis, (sort key, id)
+            models.Index(fields=["created_at", "id"], name="note_created_idx"),
+            models.Index(fields=["due_date", "id"], name="note_due_idx"),
+            models.Index(fields=["priority", "id"], name="note_priority_idx"),
+            # Generic list engine, e.g. ordering=-priority,due_date
+            models.Index(
+                fields=["-priority", "due_date", "id"],
+                name="note_priority_due_idx",
+            ),
+            models.Index(
+                fields=["is_complete", "created_at", "id"],
+                name="note_complete_created_idx",
+            ),
+            models.Index(
+                fields=["is_complete", "due_date", "id"],
+                name="note_complete_due_idx",
+            ),
+            models.Index(
+                fields=["priority", "created_at", "id"],
+                name="note_priority_created_idx",
+            ),
+            # Open notes only, skipped on backends without partial indexes
+            models.Index(
+                fields=["due_date", "id"],
+                condition=models.Q(is_complete=False),
+                name="note_open_due_idx",
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.title
+
+
+class NoteStats(models.Model):
+    """Note counters of a user, kept in step by the note services
+
+    Rebuilt by the reconcile_note_stats command after writes that bypass the
+    services (admin, shell).
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        verbose_name="user",
+        on_delete=models.CASCADE,
+        related_name="note_stats",
+    )
+
+    total = models.IntegerField(default=0, verbose_name="total")
+
+    finished = models.IntegerField(default=0, verbose_name="finished")
+
+    # Priority 1-3, 4-7 and 8-10
+    priority_low = models.IntegerField(default=0, verbose_name="low priority")
+
+    priority_medium = models.IntegerField(default=0, verbose_name="medium priority")
+
+    priority_high = models.IntegerField(default=0, verbose_name="high priority")
+
+    # Last change sequence number given to a note write or delete of the user
+    change_seq = models.BigIntegerField(default=0, verbose_name="change sequence")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date updated")
+
+    def __str__(self) -> str:
+        return f"{self.user_id} ({self.total})"
+
+
+class NoteTombstone(models.Model):
+    """A deleted note, kept for the delta sync of offline clients
+
+    Written by the note services in the transaction of the delete, on the
+    default database with the counters. Deletes that bypass the services
+    (admin, shell) leave no tombstone.
+    """
+
+    # Id of the deleted note
+    id = models.UUIDField(primary_key=True, editable=False)
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name="user", on_delete=models.CASCADE
+    )
+
+    change_seq = models.BigIntegerField(verbose_name="change sequence")
+
+    deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Date deleted")
+
+    class Meta:
+        indexes = [
+            # Delta sync, deletes after a cursor
+            models.Index(
+                fields=["user", "change_seq", "id"], name="tombstone_user_change_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.id} ({self.change_seq})"
+
+
+class NoteShard(models.Model):
+    """Database holding the notes of a user, see note/sharding.py
+
+    Written on the first note of a user and by the rebalance_note_shards
+    command. Users without a row keep their notes on the default database.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        verbose_name="user",
+        on_delete=models.CASCADE,
+        related_name="note_shard",
+    )
+
+    alias = models.CharField(max_length=100, verbose_name="database alias")
+
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date updated")
+
+    def __str__(self) -> str:
+        return f"{self.user_id} ({self.alias})"
+
+
+class ExportJob(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name="user", on_delete=models.CASCADE
+    )
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name="status",
+    )
+
+    file_name = models.CharField(max_length=255, blank=True, verbose_name="file name")
+
+    error = models.TextField(blank=True, verbose_name="error")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date created")
+
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="started at")
+
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="finished at"
+    )
+
+    # Set while a worker holds the running job, others take it over after
+    claimed_until = models.DateTimeField(
+        null=True, blank=True, verbose_name="claimed until"
+    )
+
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Queue order of the export worker
+            models.Index(fields=["status", "created_at"], name="exportjob_queue_idx"),
+            # Running jobs of dead workers, taken over once their claim expired
+            models.Index(
+                fields=["status", "claimed_until"], name="exportjob_claim_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.id} ({self.status})"
@@ -0,0 +1,243 @@
+"""Full-text index over note title and content.
+
+MySQL uses a native FULLTEXT index, SQLite an FTS5 table keyed on the note
+id and kept in sync by triggers. Both are installed after migrate, since the
+index is backend specific and triggers do not survive SQLite table rebuilds.
+Writes through the ORM, bulk apis included, need no extra work to stay
+indexed. Searches of a database without the index (failed install, not
+migrated yet) scan instead.
+"""
+
+import logging
+import re
+
+from django.db import OperationalError, connections
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "note_note_search"
+FTS_IDS_TABLE = "note_note_search_ids"
+FULLTEXT_INDEX = "note_note_fulltext"
+
+# The FTS5 rows are keyed on their own INTEGER PRIMARY KEY, mapped to the note
+# uuid, never on the implicit rowid of note_note that VACUUM and table
+# rebuilds may renumber. The owner is an indexed column matched with the
+# words, so a search only walks the postings of that user
+SQLITE_SETUP = [
+    # Index of earlier versions, reinstalled from scratch
+    "DROP TRIGGER IF EXISTS note_note_fts_ai",
+    "DROP TRIGGER IF EXISTS note_note_fts_ad",
+    "DROP TRIGGER IF EXISTS note_note_fts_au",
+    "DROP TABLE IF EXISTS note_note_fts",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    f"DROP TABLE IF EXISTS {FTS_IDS_TABLE}",
+    f"""
+    CREATE TABLE {FTS_IDS_TABLE} (
+        id INTEGER PRIMARY KEY,
+        note_id CHAR(32) NOT NULL UNIQUE
+    )
+    """,
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, user_id)",
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON note_note BEGIN
+        INSERT INTO {FTS_IDS_TABLE}(note_id) VALUES (new.id);
+        INSERT INTO {FTS_TABLE}(rowid, title, content, user_id)
+        VALUES (
+            (SELECT id FROM {FTS_IDS_TABLE} WHERE note_id = new.id),
+            new.title,
+            new.content,
+            new.user_id
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON note_note BEGIN
+        DELETE FROM {FTS_TABLE}
+        WHERE rowid = (SELECT id FROM {FTS_IDS_TABLE} WHERE note_id = old.id);
+        DELETE FROM {FTS_IDS_TABLE} WHERE note_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au
+    AFTER UPDATE OF title, content, user_id ON note_note BEGIN
+        UPDATE {FTS_TABLE}
+        SET title = new.title, content = new.content, user_id = new.user_id
+        WHERE rowid = (SELECT id FROM {FTS_IDS_TABLE} WHERE note_id = new.id);
+    END
+    """,
+    f"INSERT INTO {FTS_IDS_TABLE}(note_id) SELECT id FROM note_note",
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, title, content, user_id)
+    SELECT {FTS_IDS_TABLE}.id, note_note.title, note_note.content, note_note.user_id
+    FROM note_note JOIN {FTS_IDS_TABLE} ON {FTS_IDS_TABLE}.note_id = note_note.id
+    """,
+]
+
+# The owner column is left out of the ranking (weight 0)
+SQLITE_SEARCH = f"""
+    SELECT id, score FROM (
+        SELECT {FTS_IDS_TABLE}.note_id AS id,
+            -bm25({FTS_TABLE}, 1.0, 1.0, 0.0) AS score
+        FROM {FTS_TABLE}
+        JOIN {FTS_IDS_TABLE} ON {FTS_IDS_TABLE}.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+    ) AS ranked
+    {{seek}}
+    ORDER BY score DESC, id ASC
+    LIMIT %s
+"""
+
+MYSQL_SEARCH = """
+    SELECT id, score FROM (
+        SELECT id, MATCH(title, content) AGAINST (%s IN NATURAL LANGUAGE MODE)
+            AS score
+        FROM note_note
+        WHERE user_id = %s
+        AND MATCH(title, content) AGAINST (%s IN NATURAL LANGUAGE MODE)
+    ) AS ranked
+    {seek}
+    ORDER BY score DESC, id ASC
+    LIMIT %s
+"""
+
+SEEK = "WHERE score < %s OR (score = %s AND id > %s)"
+
+MYSQL_INDEX_EXISTS = """
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = 'note_note'
+    AND index_name = %s
+"""
+
+SQLITE_INDEX_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s"
+
+# Database alias -> full-text index installed, looked up once per process
+_available = {}
+
+
+def install_search_index(sender=None, using="default", **kwargs) -> None:
+    """post_migrate handler creating the full-text index of the database"""
+    connection = connections[using]
+
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                for statement in SQLITE_SETUP:
+                    cursor.execute(statement)
+
+            elif connection.vendor == "mysql":
+                cursor.execute(MYSQL_INDEX_EXISTS, [FULLTEXT_INDEX])
+
+                if not cursor.fetchone()[0]:
+                    cursor.execute(
+                        f"ALTER TABLE note_note ADD FULLTEXT INDEX {FULLTEXT_INDEX} "
+                        "(title, content)"
+                    )
+
+    except OperationalError:
+        # e.g. SQLite built without FTS5, search falls back to a scan
+        logger.warning("Full-text index not installed on %s", using, exc_info=True)
+
+        # Looked up again by the next search
+        _available.pop(using, None)
+        return
+
+    _available[using] = connection.vendor in ("sqlite", "mysql")
+
+
+def _index_installed(connection) -> bool:
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute(MYSQL_INDEX_EXISTS, [FULLTEXT_INDEX])
+            return bool(cursor.fetchone()[0])
+
+        cursor.execute(SQLITE_INDEX_EXISTS, [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def is_available(using: str = "default") -> bool:
+    """True when the database has the full-text index installed
+
+    Looked up in the schema at the first search of the process, and set by
+    install_search_index when it installs the index.
+    """
+    connection = connections[using]
+
+    if connection.vendor not in ("sqlite", "mysql"):
+        return False
+
+    if using not in _available:
+        _available[using] = _index_installed(connection)
+
+    return _available[using]
+
+
+def _fts5_query(query: str, user_param: str) -> str:
+    # Quote every word, user input never reaches the FTS5 query syntax
+    words = " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+    if not words:
+        return ""
+
+    return f'user_id : "{user_param}" AND {{title content}} : ({words})'
+
+
+def search_note_ids(
+    user_id, query: str, limit: int, after: tuple = None, using: str = "default"
+) -> list[tuple]:
+    """Rank the notes of a user matching a query, best match first
+
+    Parameters
+    ----------
+    user_id : uuid
+        Owner of the notes
+
+    query : str
+        Words to look for in title and content
+
+    limit : int
+        Maximum number of ids returned
+
+    after : tuple, default None
+        (score, id) of the last note of the previous page
+
+    Return
+    ------
+     (note id, score) pairs: list
+    """
+    connection = connections[using]
+    pk = models.Note._meta.pk
+
+    user_param = models.Note._meta.get_field("user").get_db_prep_value(
+        user_id, connection
+    )
+
+    seek_params = []
+
+    if after is not None:
+        score, note_id = after
+        seek_params = [score, score, pk.get_db_prep_value(note_id, connection)]
+
+    seek = SEEK if after is not None else ""
+
+    if connection.vendor == "sqlite":
+        fts_query = _fts5_query(query, user_param)
+
+        if not fts_query:
+            return []
+
+        sql = SQLITE_SEARCH.format(seek=seek)
+        params = [fts_query, *seek_params, limit]
+
+    else:
+        sql = MYSQL_SEARCH.format(seek=seek)
+        params = [query, user_param, query, *seek_params, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+        return [(pk.to_python(note_id), score) for note_id, score in cursor.fetchall()]
@@ -1,8 +1,12 @@
+from django.conf import settings
+from django.utils import timezone
+from drf.timing import TimedSerializerMixin, timed
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from users import serializers as user_serializer
 from . import services
 
-class NoteSeralizer(serializers.Serializer):
+class NoteSeralizer(TimedSerializerMixin, serializers.Serializer):
   id = serializers.UUIDField(read_only = True)
   title = serializers.CharField()
   content = serializers.CharField()
@@ -17,3 +21,272 @@ class NoteSeralizer(serializers.Serializer):
 
     return services.NoteDataClass(**data)
 
+
+
+def note_rows_to_representation(rows, fields = None) -> list[dict]:
+  """Read only fast path of NoteSeralizer(many = True) for NOTE_ROW_COLUMNS rows
+
+  Same output as NoteSeralizer, byte for byte once rendered, without walking
+  the DRF fields of every note. Notes of one user share their user dict.
+
+  With a services.NoteFieldSet the rows hold its columns instead, only the
+  picked fields are sent and a user that is not expanded is sent as its id.
+  """
+  field_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+
+  # DRF DateTimeField, ISO 8601 in the current timezone, UTC written as Z
+  def datetime_to_representation(value):
+    if field_timezone is not None and timezone.is_aware(value):
+      value = value.astimezone(field_timezone)
+
+    value = value.isoformat()
+
+    if value.endswith("+00:00"):
+      value = value[:-6] + "Z"
+
+    return value
+
+  users = {}
+
+  def user_to_representation(user_id, first_name, last_name, email, is_email_verified):
+    user = users.get(user_id)
+
+    if user is None:
+      user = users[user_id] = {
+        "id": str(user_id),
+        "first_name": str(first_name),
+        "last_name": str(last_name),
+        "email": str(email),
+        "is_email_verified": bool(is_email_verified),
+      }
+
+    return user
+
+  if fields is not None:
+    return _sparse_rows_to_representation(
+      rows, fields, datetime_to_representation, user_to_representation
+    )
+
+  results = []
+
+  for (
+    note_id,
+    title,
+    content,
+    created_at,
+    due_date,
+    priority,
+    is_complete,
+    user_id,
+    first_name,
+    last_name,
+    email,
+    is_email_verified,
+  ) in rows:
+    # Inlined, the full payload is the hot path
+    user = users.get(user_id)
+
+    if user is None:
+      user = users[user_id] = {
+        "id": str(user_id),
+        "first_name": str(first_name),
+        "last_name": str(last_name),
+        "email": str(email),
+        "is_email_verified": bool(is_email_verified),
+      }
+
+    results.append({
+      "id": str(note_id),
+      "title": str(title),
+      "content": str(content),
+      "created_at": datetime_to_representation(created_at),
+      "due_date": datetime_to_representation(due_date),
+      "priority": int(priority),
+      "is_complete": bool(is_complete),
+      "user": user,
+    })
+
+  return results
+
+
+def _sparse_rows_to_representation(
+  rows, fields, datetime_to_representation, user_to_representation
+) -> list[dict]:
+  converters = {
+    "id": str,
+    "title": str,
+    "content": str,
+    "created_at": datetime_to_representation,
+    "due_date": datetime_to_representation,
+    "priority": int,
+    "is_complete": bool,
+    # Not expanded, the owner id
+    "user": str,
+  }
+
+  # (field, first column, column count, converter) in payload order
+  layout = []
+  column = 0
+
+  for field in fields.fields:
+    if field in fields.expand:
+      count = len(services.NOTE_EXPANDED_COLUMNS[field])
+      layout.append((field, column, count, user_to_representation))
+    else:
+      count = 1
+      layout.append((field, column, count, converters[field]))
+
+    column += count
+
+  results = []
+
+  for row in rows:
+    results.append({
+      field: (
+        to_representation(row[column])
+        if count == 1
+        else to_representation(*row[column : column + count])
+      )
+      for field, column, count, to_representation in layout
+    })
+
+  return results
+
+
+def note_row_to_representation(row, fields) -> dict:
+  """One row of fields.columns, as NoteSeralizer(note).data with the picked fields"""
+  with timed("serialize"):
+    return note_rows_to_representation([row], fields)[0]
+
+
+@extend_schema_field(NoteSeralizer(many = True))
+class NoteRowsField(serializers.Field):
+  """The rows of a services.NotePage, read from the page (source = "*")"""
+
+  def __init__(self, **kwargs):
+    kwargs["read_only"] = True
+    kwargs.setdefault("source", "*")
+    super().__init__(**kwargs)
+
+  def to_representation(self, page):
+    return note_rows_to_representation(page.results, page.fields)
+
+
+class NotePageSerializer(TimedSerializerMixin, serializers.Serializer):
+  next = serializers.CharField(read_only = True, allow_null = True)
+  previous = serializers.CharField(read_only = True, allow_null = True)
+  results = NoteRowsField()
+
+
+class NoteChangesSerializer(TimedSerializerMixin, serializers.Serializer):
+  results = NoteRowsField()
+  deleted = serializers.ListField(child = serializers.UUIDField(), read_only = True)
+  since = serializers.CharField(read_only = True, allow_null = True)
+  has_more = serializers.BooleanField(read_only = True)
+
+
+class NoteFieldsParamsSerializer(serializers.Serializer):
+  fields = serializers.CharField(
+    required = False,
+    default = None,
+    help_text = "Comma separated note fields, e.g. id,title,due_date, all when absent",
+  )
+  expand = serializers.CharField(
+    required = False,
+    default = None,
+    help_text = "user, embeds the owner of a sparse note instead of its id",
+  )
+
+  def validate(self, attrs):
+    attrs = super().validate(attrs)
+
+    # One services.NoteFieldSet, None for the full payload
+    attrs["fields"] = services.parse_note_fields(attrs["fields"], attrs.pop("expand"))
+
+    return attrs
+
+
+class PageParamsSerializer(NoteFieldsParamsSerializer):
+  limit = serializers.IntegerField(
+    min_value = 1, max_value = settings.NOTE_PAGE_MAX_SIZE, default = settings.NOTE_PAGE_SIZE
+  )
+  cursor = serializers.CharField(required = False)
+
+
+class NoteChangesParamsSerializer(NoteFieldsParamsSerializer):
+  limit = serializers.IntegerField(
+    min_value = 1,
+    max_value = settings.NOTE_CHANGES_MAX_SIZE,
+    default = settings.NOTE_CHANGES_SIZE,
+  )
+  since = serializers.CharField(
+    required = False,
+    default = None,
+    help_text = "since of the previous sync, every note when absent",
+  )
+
+
+class NoteQueryParamsSerializer(PageParamsSerializer):
+  status = serializers.ChoiceField(
+    choices = sorted(services.NOTE_STATUS_VALUES), required = False, default = None
+  )
+  priority = serializers.IntegerField(
+    min_value = 1, max_value = 10, required = False, default = None
+  )
+  priority__gte = serializers.IntegerField(
+    min_value = 1, max_value = 10, required = False, default = None
+  )
+  priority__lte = serializers.IntegerField(
+    min_value = 1, max_value = 10, required = False, default = None
+  )
+  due_before = serializers.DateTimeField(required = False, default = None)
+  due_after = serializers.DateTimeField(required = False, default = None)
+  ordering = serializers.CharField(
+    required = False,
+    default = None,
+    help_text = "Comma separated created_at, due_date, priority, - for descending",
+  )
+
+
+class NotePriorityCountSerializer(serializers.Serializer):
+  low = serializers.IntegerField(read_only = True)
+  medium = serializers.IntegerField(read_only = True)
+  high = serializers.IntegerField(read_only = True)
+
+
+class NoteStatsSerializer(TimedSerializerMixin, serializers.Serializer):
+  total = serializers.IntegerField(read_only = True)
+  finished = serializers.IntegerField(read_only = True)
+  unfinished = serializers.IntegerField(read_only = True)
+  overdue = serializers.IntegerField(read_only = True)
+  priority = NotePriorityCountSerializer(read_only = True)
+
+
+class ExportJobSerializer(TimedSerializerMixin, serializers.Serializer):
+  id = serializers.UUIDField(read_only = True)
+  status = serializers.CharField(read_only = True)
+  created_at = serializers.DateTimeField(read_only = True)
+  finished_at = serializers.DateTimeField(read_only = True)
+  error = serializers.CharField(read_only = True)
+
+
+class NoteBulkUpdateSerializer(NoteSeralizer):
+  id = serializers.UUIDField()
+
+
+class NoteBulkDeleteSerializer(serializers.Serializer):
+  ids = serializers.ListField(
+    child = serializers.UUIDField(),
+    allow_empty = False,
+    max_length = settings.NOTE_BULK_MAX_SIZE,
+  )
+
+
+class BulkResultSerializer(TimedSerializerMixin, serializers.Serializer):
+  id = serializers.UUIDField(read_only = True)
+  status = serializers.CharField(read_only = True)
+  note = NoteSeralizer(read_only = True, allow_null = True)
+
+
+class SearchParamsSerializer(PageParamsSerializer):
+  q = serializers.CharField(max_length = 200)
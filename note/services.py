@@ -1,30 +1,55 @@
+import base64
+import binascii
+import csv
 import dataclasses
 import datetime
-from rest_framework import exceptions, response, status
+import hashlib
+import json
+import uuid
+from rest_framework import exceptions
 from django.conf import settings
+from django.core import exceptions as django_exceptions
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Count, F, Max, Prefetch, Q
+from django.db.models.functions import Greatest
+from asgiref.sync import sync_to_async
+from drf import routers
+from users import outbox
 from users import services as user_services
-from . import models
+from . import models, search, sharding
 
 
 # To validate uuid passed in api
 from uuid import UUID
 
-# Email
-from django.core.mail import send_mail
+from django.utils import timezone
 
 from django.template.loader import get_template
 
-from typing import TYPE_CHECKING
+#  covert html to pdf
+from xhtml2pdf import pisa
+from io import BytesIO
+
+# Export files
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 
 if TYPE_CHECKING:
-    from note.models import Note
+    from note.models import ExportJob, Note
     from users.models import User
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class NoteDataClass:
     """Defines the data struture of the note for response.
 
+    Slotted (no per note __dict__), the user is a UserDataClass shared by
+    every note of that user.
+
     Class varibles
     ----------
     title : str
@@ -48,13 +73,16 @@ class NoteDataClass:
     is_complete : bool, default False
         To determain if not is compled or not
 
-    user : instance object,
-        The user object
+    user : UserDataClass,
+        The note owner
 
     Methods
     ------
-    from_instance(cls, note)
+    from_instance(cls, note, users)
         Returns object of class
+
+    from_row(cls, row, users)
+        Returns object of class from a NOTE_ROW_COLUMNS row
     """
 
     title: str
@@ -67,7 +95,9 @@ class NoteDataClass:
     is_complete: bool = False
 
     @classmethod
-    def from_instance(cls, note: "Note") -> "NoteDataClass":
+    def from_instance(cls, note: "Note", users: dict = None) -> "NoteDataClass":
+        user = note.user
+
         return cls(
             id=note.id,
             title=note.title,
@@ -76,392 +106,2892 @@ class NoteDataClass:
             is_complete=note.is_complete,
             priority=note.priority,
             created_at=note.created_at,
-            user=note.user,
+            user=user_services.UserDataClass.from_row(
+                (
+                    user.id,
+                    user.first_name,
+                    user.last_name,
+                    user.email,
+                    user.is_email_verified,
+                ),
+                users,
+            ),
         )
 
+    @classmethod
+    def from_row(cls, row: tuple, users: dict = None) -> "NoteDataClass":
+        (
+            note_id,
+            title,
+            content,
+            created_at,
+            due_date,
+            priority,
+            is_complete,
+            *user_row,
+        ) = row
 
-####### Helper Function #######
-def check_valid_uuid(id):
-    try:
-        UUID(id, version=4)
+        return cls(
+            id=note_id,
+            title=title,
+            content=content,
+            due_date=due_date,
+            is_complete=is_complete,
+            priority=priority,
+            created_at=created_at,
+            user=user_services.UserDataClass.from_row(user_row, users),
+        )
 
-    except:
-        raise exceptions.ValidationError("Id is not valid")
 
+@dataclasses.dataclass
+class NotePage:
+    """Defines a single page of notes returned by the list apis.
+
+    Class varibles
+    ----------
+    results : list[tuple]
+        The notes on this page, rows of note_row_columns(fields)
 
-###### Api Essentials functions ########
+    next : str, default None
+        Opaque cursor of the following page, None on the last page
 
+    previous : str, default None
+        Opaque cursor of the preceding page, None on the first page
 
-def create_note(user, note_dc: "NoteDataClass") -> "NoteDataClass":
-    """Create note
+    fields : NoteFieldSet, default None
+        The fields picked by the client, every field when None
+    """
 
-    Parameter
+    results: list[tuple]
+    next: str = None
+    previous: str = None
+    fields: "NoteFieldSet" = None
+
+
+@dataclasses.dataclass
+class NoteChanges:
+    """Defines the notes written and deleted after a delta sync cursor.
+
+    Class varibles
     ----------
-    Note : note object instance
-        The note details
+    results : list[tuple]
+        The notes created or updated, rows of note_row_columns(fields)
 
-    Returns
-    ------
-     Note Data Class
-    """
-    instance = models.Note(
-        title=note_dc.title,
-        due_date=note_dc.due_date,
-        content=note_dc.content,
-        priority=note_dc.priority,
-        user=user,
-    )
+    deleted : list[UUID]
+        Ids of the notes deleted
 
-    instance.save()
+    since : str
+        Cursor of the last change sent, the since of the next sync. The since
+        received when nothing changed
 
-    return NoteDataClass.from_instance(instance)
+    has_more : bool
+        More changes are waiting, sync again right away
+
+    fields : NoteFieldSet, default None
+        The fields picked by the client, every field when None
+    """
 
+    results: list[tuple]
+    deleted: list
+    since: str = None
+    has_more: bool = False
+    fields: "NoteFieldSet" = None
 
-def get_user_notes(user: "User") -> list["NoteDataClass"]:
-    """Get notes by user
 
-    Parameters
+@dataclasses.dataclass
+class NoteStatsDataClass:
+    """Defines the note counts of a user for response.
+
+    Class varibles
     ----------
-      user: dict
-        contains user details
+    total : int
+        Number of notes
 
-    Return
-    ------
-        Note: Note data class
-           contain  user notes details
+    finished : int
+        Number of completed notes
+
+    unfinished : int
+        Number of notes still open
+
+    overdue : int
+        Number of notes past their due date, same as the overdue api
+
+    priority : dict
+        Number of notes per priority bucket, low (1-3), medium (4-7) and
+        high (8-10)
     """
-    user_note = models.Note.objects.filter(user=user)
 
-    return [NoteDataClass.from_instance(single_note) for single_note in user_note]
+    total: int
+    finished: int
+    unfinished: int
+    overdue: int
+    priority: dict
 
 
-def get_notes() -> list["NoteDataClass"]:
-    """Get all notes
+@dataclasses.dataclass
+class BulkResultDataClass:
+    """Defines the outcome of one item of a bulk request for response.
 
-    Parameters
+    Class varibles
     ----------
-      None
+    id : str
+        The note id
 
-    Return
-    ------
-        Note: list[NoteDataClass]
-           contain all notes
+    status : str
+        One of created, updated, deleted, not_found or forbidden
+
+    note : NoteDataClass, default None
+        The note as stored, for created and updated items
     """
-    notes = models.Note.objects.all()
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
+    id: str
+    status: str
+    note: "NoteDataClass" = None
 
 
-def get_user_note(note_id: str) -> "NoteDataClass":
-    """Get  user note by id
+@dataclasses.dataclass
+class ExportJobDataClass:
+    """Defines the data struture of a background export job for response.
 
-    Parameters
+    Class varibles
     ----------
-      note_id: str
-        contains note id
+    id : str
+        The job id
 
-    Return
+    status : str
+        One of pending, running, done or failed
+
+    created_at : str
+        Time the job was submitted
+
+    finished_at : str, default None
+        Time the job finished
+
+    error : str, default ""
+        Why the job failed
+
+    Methods
     ------
-        Note: Note data class
-           contain note details
+    from_instance(cls, job)
+        Returns object of class
     """
-    check_valid_uuid(note_id)
 
-    note = models.Note.objects.filter(id=note_id).first()
+    id: str
+    status: str
+    created_at: datetime.datetime
+    finished_at: datetime.datetime = None
+    error: str = ""
 
-    if not note:
-        raise exceptions.NotFound("Note Does not exist")
+    @classmethod
+    def from_instance(cls, job: "ExportJob") -> "ExportJobDataClass":
+        return cls(
+            id=job.id,
+            status=job.status,
+            created_at=job.created_at,
+            finished_at=job.finished_at,
+            error=job.error,
+        )
 
-    return NoteDataClass.from_instance(note)
 
+####### Helper Function #######
+def check_valid_uuid(id):
+    try:
+        UUID(id, version=4)
+
+    except:
+        raise exceptions.ValidationError("Id is not valid")
 
-def delete_user_note(user: "User", note_id: str) -> None:
-    """Delete user note
+
+def encode_cursor(values: list, reverse: bool = False) -> str:
+    """Encode the sort key of a note into an opaque cursor
 
     Parameters
     ----------
-      user: dict
-        contains user details
+    values : list
+        The sort key values of the note, id last
 
-      note_id: str
-        contains note id to be delete
+    reverse : bool, default False
+        True when the cursor points backwards (previous page)
 
     Return
     ------
-        None
+     cursor: str
     """
-    check_valid_uuid(note_id)
-
-    note = models.Note.objects.filter(id=note_id).first()
-
-    if not note:
-        raise exceptions.NotFound("Note Does not exist")
-
-    if note.user.id != user.id:
-        raise exceptions.PermissionDenied("Unauthorized")
+    payload = {
+        "v": [
+            value.isoformat() if isinstance(value, datetime.datetime) else str(value)
+            for value in values
+        ],
+        "r": reverse,
+    }
 
-    note.delete()
+    return base64.urlsafe_b64encode(
+        json.dumps(payload, separators=(",", ":")).encode()
+    ).decode()
 
 
-def update_user_note(
-    user: "User", note_id: str, note_data: "NoteDataClass"
-) -> "NoteDataClass":
-    """Update user note
+def decode_cursor(cursor: str, ordering: list[tuple]) -> tuple[list, bool]:
+    """Decode an opaque cursor back into typed sort key values
 
     Parameters
     ----------
-      user: dict
-        contains user details
+    cursor : str
+        The cursor sent by the client
 
-      note_id: str
-        contains note id to be updated
+    ordering : list[tuple]
+        The (field name, descending) pairs the cursor was built from
 
-      note_data: dict
-        contains new details of note
+    Exceptions
+    ------
+      ValidationError: If the cursor is malformed
 
     Return
     ------
-        Note: Note data class
-           contain new note details
+     (values, reverse): tuple
     """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        raw_values = payload["v"]
+        reverse = bool(payload["r"])
 
-    check_valid_uuid(note_id)
+        if len(raw_values) != len(ordering):
+            raise ValueError
 
-    note = models.Note.objects.filter(id=note_id).first()
+        values = [
+            models.Note._meta.get_field(field).to_python(value)
+            for (field, _), value in zip(ordering, raw_values)
+        ]
 
-    if not note:
-        raise exceptions.NotFound("Note Does not exist")
+    except (
+        binascii.Error,
+        django_exceptions.ValidationError,
+        KeyError,
+        TypeError,
+        ValueError,
+    ):
+        raise exceptions.ValidationError("Cursor is not valid")
 
-    if note.user.id != user.id:
-        raise exceptions.PermissionDenied("Unauthorized")
+    return values, reverse
 
-    note.title = note_data.title
-    note.content = note_data.content
-    note.due_date = note_data.due_date
-    note.priority = note_data.priority
-    note.is_complete = note_data.is_complete
 
-    note.save()
+def _seek_filter(ordering: list[tuple], values: list, reverse: bool) -> Q:
+    """Build the keyset predicate selecting rows after (or before) a cursor"""
+    predicate = Q()
 
-    return NoteDataClass.from_instance(note)
+    for index, (field, descending) in enumerate(ordering):
+        # Rows after the cursor are smaller on descending keys
+        lookup = "lt" if descending != reverse else "gt"
 
+        condition = Q(**{f"{field}__{lookup}": values[index]})
 
-def get_unfinished_note() -> "NoteDataClass":
-    """Get all notes that are unfinished/not completed
+        # Every earlier key has to tie with the cursor
+        for prev_index, (prev_field, _) in enumerate(ordering[:index]):
+            condition &= Q(**{prev_field: values[prev_index]})
 
-    Parameters
-    ----------
-      None
+        predicate |= condition
 
-    Return
-    ------
-        Contains orderd noted
-    """
-    notes = models.Note.objects.filter(is_complete=False)
+    return predicate
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
 
+def paginate_notes(
+    queryset,
+    ordering: list[tuple],
+    limit: int,
+    cursor: str = None,
+    fields: "NoteFieldSet" = None,
+) -> "NotePage":
+    """Fetch one page of notes using keyset pagination
 
-def get_finished_note() -> list["NoteDataClass"]:
-    """Get all notes that are finished/completed
+    The seek predicate and LIMIT are pushed into SQL so every page costs the
+    same, no matter how deep the client pages.
 
     Parameters
     ----------
-      None
+    queryset : QuerySet
+        The filtered notes
+
+    ordering : list[tuple]
+        (field name, descending) pairs, the id tie breaker is appended
+
+    limit : int
+        Maximum number of notes on the page
+
+    cursor : str, default None
+        Cursor returned by a previous page
+
+    fields : NoteFieldSet, default None
+        Fields picked by the client, only their columns are read
 
     Return
     ------
-        Contains orderd noted
+        NotePage
     """
-    notes = models.Note.objects.filter(is_complete=True)
+    queryset, ordering, reverse, order = _page_queryset(queryset, ordering, cursor)
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
+    columns = note_row_columns(fields, [field for field, _ in ordering])
 
+    rows = fetch_note_rows(queryset, columns, limit + 1, order)
 
-def get_overdue_note() -> list["NoteDataClass"]:
-    """Get all notes that are overdue date
+    return _make_page(rows, ordering, limit, cursor, reverse, columns, fields)
 
-    Parameters
+
+async def apaginate_notes(
+    queryset,
+    ordering: list[tuple],
+    limit: int,
+    cursor: str = None,
+    fields: "NoteFieldSet" = None,
+) -> "NotePage":
+    """Async paginate_notes, the page is read with the async ORM"""
+    queryset, ordering, reverse, order = _page_queryset(queryset, ordering, cursor)
+
+    columns = note_row_columns(fields, [field for field, _ in ordering])
+
+    rows = await afetch_note_rows(queryset, columns, limit + 1, order)
+
+    return _make_page(rows, ordering, limit, cursor, reverse, columns, fields)
+
+
+def _page_queryset(queryset, ordering: list[tuple], cursor: str = None) -> tuple:
+    # Seek and order, the page is read with LIMIT + 1 (one extra row tells if
+    # there is a next page)
+    ordering = [*ordering, ("id", ordering[-1][1] if ordering else False)]
+
+    reverse = False
+
+    if cursor:
+        values, reverse = decode_cursor(cursor, ordering)
+        queryset = queryset.filter(_seek_filter(ordering, values, reverse))
+
+    order = [(field, descending != reverse) for field, descending in ordering]
+
+    queryset = queryset.order_by(
+        *[f"-{field}" if descending else field for field, descending in order]
+    )
+
+    return queryset, ordering, reverse, order
+
+
+def _make_page(
+    notes: list,
+    ordering: list[tuple],
+    limit: int,
+    cursor: str,
+    reverse: bool,
+    columns: tuple,
+    fields: "NoteFieldSet" = None,
+) -> "NotePage":
+    has_more = len(notes) > limit
+    notes = notes[:limit]
+
+    if reverse:
+        notes.reverse()
+
+    key_columns = [columns.index(field) for field, _ in ordering]
+
+    def sort_key(row):
+        return [row[column] for column in key_columns]
+
+    page = NotePage(results=notes, fields=fields)
+
+    if notes:
+        if has_more or reverse:
+            page.next = encode_cursor(sort_key(notes[-1]))
+
+        if (has_more and reverse) or (cursor and not reverse):
+            page.previous = encode_cursor(sort_key(notes[0]), reverse=True)
+
+    return page
+
+
+def _order_direction(order_arg: str) -> bool:
+    """Returns True when order argument asks for descending order"""
+    return order_arg.lower() != "asc"
+
+
+# Columns read by NoteSeralizer and saved back by update_user_note (updated_at
+# has to be loaded for auto_now to be written), the user is joined in the query
+NOTE_COLUMNS = (
+    "id",
+    "title",
+    "content",
+    "created_at",
+    "updated_at",
+    "due_date",
+    "is_complete",
+    "priority",
+    "change_seq",
+    "user",
+    "user__id",
+    "user__first_name",
+    "user__last_name",
+    "user__email",
+    "user__is_email_verified",
+)
+
+# Owner columns of NOTE_COLUMNS, read by a second query when notes are sharded
+NOTE_OWNER_FIELDS = tuple(
+    column.removeprefix("user__")
+    for column in NOTE_COLUMNS
+    if column.startswith("user__")
+)
+
+
+# Columns of the rows on a NotePage, in NoteSeralizer order. Lists are read
+# as tuples and serialized by note_serializer.NoteRowsField, no model or
+# dataclass is built per note
+NOTE_ROW_COLUMNS = (
+    "id",
+    "title",
+    "content",
+    "created_at",
+    "due_date",
+    "priority",
+    "is_complete",
+    "user__id",
+    "user__first_name",
+    "user__last_name",
+    "user__email",
+    "user__is_email_verified",
+)
+
+# Fields of a note payload, in NoteSeralizer order, a client may pick some of
+# them with ?fields= (sparse fieldsets)
+NOTE_FIELDS = (
+    "id",
+    "title",
+    "content",
+    "created_at",
+    "due_date",
+    "priority",
+    "is_complete",
+    "user",
+)
+
+# Columns read for a picked field, the owner is only joined when expanded
+NOTE_FIELD_COLUMNS = {
+    **{field: (field,) for field in NOTE_FIELDS},
+    "user": ("user__id",),
+}
+
+# Columns of a field embedded as an object with ?expand=
+NOTE_EXPANDED_COLUMNS = {
+    "user": tuple(column for column in NOTE_ROW_COLUMNS if column.startswith("user__")),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class NoteFieldSet:
+    """Defines the note fields a client asked for with ?fields= and ?expand=.
+
+    The default, every field with the user embedded, reads NOTE_ROW_COLUMNS.
+
+    Class varibles
     ----------
-      None
+    fields : tuple
+        The picked NOTE_FIELDS, in payload order
 
-    Return
-    ------
-        Contains orderd noted
+    expand : tuple
+        Fields embedded as objects, the others of NOTE_EXPANDED_COLUMNS are
+        sent as their id
     """
-    pass
 
-    current_date = datetime.datetime.now()
+    fields: tuple = NOTE_FIELDS
+    expand: tuple = tuple(NOTE_EXPANDED_COLUMNS)
 
-    notes = models.Note.objects.filter(due_date__lte=current_date)
+    @property
+    def columns(self) -> tuple:
+        """values_list columns of the picked fields, in payload order"""
+        columns = []
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
+        for field in self.fields:
+            if field in self.expand:
+                columns.extend(NOTE_EXPANDED_COLUMNS[field])
+            else:
+                columns.extend(NOTE_FIELD_COLUMNS[field])
 
+        return tuple(columns)
 
-def get_order_by_due_date_note(order_arg: str) -> list["NoteDataClass"]:
-    """Get all notes ordered by due date
+
+def _split_param(value: str) -> list[str]:
+    return list(dict.fromkeys(term.strip() for term in value.split(",")))
+
+
+def parse_note_fields(fields: str = None, expand: str = None) -> "NoteFieldSet":
+    """Parse the fields and expand params, such as "id,title" and "user"
 
     Parameters
     ----------
-     order_arg : str
-        Could be either asc (ascending) or desc (descending)
+    fields : str, default None
+        Comma separated NOTE_FIELDS, every field when None
+
+    expand : str, default None
+        Comma separated fields to embed, an expanded field is always picked
+
+    Exceptions
+    ------
+      ValidationError: If a field is unknown or cannot be expanded
 
     Return
     ------
-        Contains orderd noted
+     NoteFieldSet: None when every field is asked for, the full payload
     """
-    sort_arg_value = "due_date" if order_arg.lower() == "asc" else "-due_date"
+    expanded = _split_param(expand) if expand else []
+
+    for field in expanded:
+        if field not in NOTE_EXPANDED_COLUMNS:
+            raise exceptions.ValidationError(
+                {"expand": f"Cannot expand {field or 'nothing'}"}
+            )
+
+    # The full payload always embeds the user
+    if not fields:
+        return None
+
+    picked = _split_param(fields)
+
+    for field in picked:
+        if field not in NOTE_FIELDS:
+            raise exceptions.ValidationError(
+                {"fields": f"Unknown field {field or 'nothing'}"}
+            )
+
+    field_set = NoteFieldSet(
+        fields=tuple(
+            field for field in NOTE_FIELDS if field in picked or field in expanded
+        ),
+        expand=tuple(expanded),
+    )
 
-    notes = models.Note.objects.all().order_by(sort_arg_value)
+    return None if field_set == NoteFieldSet() else field_set
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
 
+def note_row_columns(fields: "NoteFieldSet" = None, keys: list = ()) -> tuple:
+    """values_list columns of the rows of a page
 
-def get_order_by_priority_note(order_arg: str) -> list["NoteDataClass"]:
-    """Get all notes ordered by priority
+    The columns of the picked fields, in payload order, then the sort keys
+    the cursor is built from when they were not picked.
 
     Parameters
     ----------
-     order_arg : str
-        Could be either asc (ascending) or desc (descending)
+      fields: NoteFieldSet, default None
+        fields picked by the client, NOTE_ROW_COLUMNS when None
+
+      keys: list, default ()
+        columns the page is sorted on
 
     Return
     ------
-        Contains orderd noted
+        columns: tuple
     """
-    sort_arg_value = "priority" if order_arg.lower() == "asc" else "-priority"
-
-    notes = models.Note.objects.all().order_by(sort_arg_value)
+    columns = fields.columns if fields is not None else NOTE_ROW_COLUMNS
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
+    return (*columns, *[key for key in keys if key not in columns])
 
 
-def get_order_by_created_at_note(order_arg: str) -> list["NoteDataClass"]:
-    """Get all notes ordered by created date
+def note_queryset(user_id=None):
+    """Base queryset of every note read, avoids a user lookup per note
 
     Parameters
     ----------
-     order_arg : str
-        Could be either asc (ascending) or desc (descending)
+      user_id: str, default None
+        owner of the notes, routes the query to their shard
 
     Return
     ------
-        Contains orderd noted
+        QuerySet
     """
+    notes = sharding.notes(user_id)
+
+    if sharding.is_enabled():
+        # No join across databases, the owners are read in one more query
+        return notes.only(
+            *[column for column in NOTE_COLUMNS if not column.startswith("user__")]
+        ).prefetch_related(
+            Prefetch("user", get_user_model().objects.only(*NOTE_OWNER_FIELDS))
+        )
 
-    sort_arg_value = "created_at" if order_arg.lower() == "asc" else "-created_at"
-
-    notes = models.Note.objects.all().order_by(sort_arg_value)
+    return notes.select_related("user").only(*NOTE_COLUMNS)
 
-    return [NoteDataClass.from_instance(single_note) for single_note in notes]
 
+def fetch_note_rows(
+    queryset, columns: tuple, limit: int, ordering: list[tuple] = ()
+) -> list[tuple]:
+    """Read up to limit values_list rows of a note query
 
-def generate_pdf_html() -> object:
-    """Generate context( variables) for pdf html template
+    Owner columns (user__*) are joined. On shards the query is run without
+    them, on every note database when it has no owner (merged on ordering),
+    and the owners are read from the users table in one query.
 
     Parameters
     ----------
-        None
+      queryset: QuerySet
+        the filtered and ordered notes
+
+      columns: tuple
+        values_list columns of the rows
 
+      limit: int
+        maximum number of rows
+
+      ordering: list[tuple], default ()
+        (column, descending) pairs of the queryset order
 
     Return
     ------
-     context: dict
+        rows: list[tuple]
     """
+    if not sharding.is_enabled():
+        return list(queryset.values_list(*columns)[:limit])
+
+    owner_columns = [
+        column
+        for column in columns
+        if column.startswith("user__") and column != "user__id"
+    ]
+    note_columns = [column for column in columns if column not in owner_columns]
+
+    rows = sharding.gather(
+        queryset.values_list(*note_columns, "user_id")[:limit],
+        [(note_columns.index(field), descending) for field, descending in ordering],
+    )
 
-    # Get all notes
-    notes = get_notes()
+    if not owner_columns:
+        return [row[:-1] for row in rows]
 
-    html_data = {}
+    owners = {
+        owner[0]: owner[1:]
+        for owner in get_user_model()
+        .objects.filter(id__in={row[-1] for row in rows})
+        .values_list(
+            "id", *[column.removeprefix("user__") for column in owner_columns]
+        )
+    }
 
-    for index, note in enumerate(notes):
-        html_data[index] = {
-            "id": note.id,
-            "title": note.title,
-            "content": note.content,
-            "created_at": note.created_at,
-            "due_date": note.due_date,
-            "is_complete": note.is_complete,
-            "priority": note.priority,
-            "user_id": note.user.id,
-            "first_name": note.user.first_name,
-            "last_name": note.user.last_name,
-            "email": note.user.email,
-        }
+    full_rows = []
 
-        """
-        EXAMPLE DATA
+    for row in rows:
+        # Skipped when the owner was deleted meanwhile
+        if row[-1] not in owners:
+            continue
 
-            context = {
-            0: {
-                    "id": UUID("ebfe6d73-6e7d-40e1-9e94-95d155680ebf"),
-                    "title": "New Create",
-                    "content": "New",
-                    "created_at": datetime.datetime(
-                        2023, 9, 25, 13, 26, 22, 240071, tzinfo=datetime.timezone.utc
-                    ),
-                    "due_date": datetime.datetime(
-                        2023, 9, 23, 20, 45, 37, 13440, tzinfo=datetime.timezone.utc
-                    ),
-                    "is_complete": False,
-                    "priority": 3,
-                    "user_id": UUID("49b052c8-7677-44be-88b1-6c15ebd03f9f"),
-                    "first_name": "Larry",
-                    "last_name": "Mall",
-                    "email": "michotall95@gmail.com",
+        values = dict(zip(note_columns, row))
+        values.update(zip(owner_columns, owners[row[-1]]))
 
-                },
-            }
-        """
+        full_rows.append(tuple(values[column] for column in columns))
 
-    context = {"note_lists": html_data}
+    return full_rows
 
-    return context
 
+async def afetch_note_rows(
+    queryset, columns: tuple, limit: int, ordering: list[tuple] = ()
+) -> list[tuple]:
+    """Async fetch_note_rows
 
-async def get_html_template(context):
-    """Creates html templte
+    Django 4.2 has no async database driver, aiterator() runs the query and
+    every chunk fetch in a sync_to_async thread while the event loop serves
+    other requests. The chunk holds the whole slice, one thread hop per call.
+    """
+    if sharding.is_enabled():
+        return await sync_to_async(fetch_note_rows)(queryset, columns, limit, ordering)
 
-    Parameter
+    # values_list().aiterator() runs its query on the event loop thread in
+    # Django 4.2 (SynchronousOnlyOperation), the values() rows do not
+    rows = queryset.values(*columns)[:limit]
+
+    # One row more than the slice, a full chunk would take a hop to see the end
+    return [
+        tuple(row[column] for column in columns)
+        async for row in rows.aiterator(chunk_size=limit + 1)
+    ]
+
+
+def note_listing(listing: str, user: "User" = None, order_arg: str = None) -> tuple:
+    """Get the filtered notes and ordering of a list api
+
+    Shared by the sync and async apis, so both serve the same pages.
+
+    Parameters
     ----------
-    context : dict
-        Details of variables needed in the html
+      listing: str
+        name of the list, e.g. unfinished or order_priority
+
+      user: dict, default None
+        owner of the notes, for user_notes
+
+      order_arg: str, default None
+        asc or desc, for the order_* lists
 
     Return
     ------
-     html structured tags created: str
+        (queryset, ordering): tuple
     """
-    return get_template("notes.html").render(context)
+    if listing == "user_notes":
+        return note_queryset(user.id).filter(user=user), [("created_at", False)]
 
+    notes = note_queryset()
 
-def send_email(html_template: str, email_data: dict) -> None:
-    """Send mail to user email address
+    if listing == "notes":
+        return notes, [("created_at", False)]
+
+    if listing == "unfinished":
+        return notes.filter(is_complete=False), [("created_at", False)]
+
+    if listing == "finished":
+        return notes.filter(is_complete=True), [("created_at", False)]
+
+    if listing == "overdue":
+        return notes.filter(due_date__lte=timezone.now()), [("due_date", False)]
+
+    if listing == "order_due_date":
+        return notes, [("due_date", _order_direction(order_arg))]
+
+    if listing == "order_priority":
+        return notes, [("priority", _order_direction(order_arg))]
+
+    if listing == "order_created_at":
+        return notes, [("created_at", _order_direction(order_arg))]
+
+    raise ValueError(f"Unknown note listing {listing}")
+
+
+###### Filter and sort engine ########
+
+# Query params of GET /api/notes/ -> (lookup, equality). Equality filters must
+# lead the index serving the query, range filters are checked on its scan
+NOTE_QUERY_FILTERS = {
+    "status": ("is_complete", True),
+    "priority": ("priority", True),
+    "priority__gte": ("priority__gte", False),
+    "priority__lte": ("priority__lte", False),
+    "due_before": ("due_date__lt", False),
+    "due_after": ("due_date__gte", False),
+}
+
+NOTE_STATUS_VALUES = {"finished": True, "unfinished": False}
+
+NOTE_SORT_FIELDS = ("created_at", "due_date", "priority")
+
+DEFAULT_NOTE_ORDERING = [("created_at", False)]
+
+
+def parse_ordering(ordering: str) -> list[tuple]:
+    """Parse an ordering param such as "-priority,due_date"
 
     Parameters
     ----------
-    html_template : str
-        Contains email  body (html)
+    ordering : str
+        Comma separated fields, a leading - sorts descending
 
-    data: dict
-        Contains email subject, and to (reciever)
+    Exceptions
+    ------
+      ValidationError: If a field is unknown or repeated
+
+    Return
+    ------
+     (field name, descending) pairs: list
+    """
+    parsed = []
+
+    for term in ordering.split(","):
+        term = term.strip()
+        field = term.lstrip("-")
+
+        if field not in NOTE_SORT_FIELDS or field in dict(parsed):
+            raise exceptions.ValidationError(
+                {"ordering": f"Cannot sort by {term or 'nothing'}"}
+            )
+
+        parsed.append((field, term.startswith("-")))
+
+    return parsed
+
+
+def note_access_paths() -> list[tuple]:
+    """Index access paths of the notes table, read from Note.Meta.indexes
+
+    Return
+    ------
+     ([(column, descending)], {condition column: value}): list of tuples
+    """
+    paths = []
+
+    for index in models.Note._meta.indexes:
+        columns = [
+            (field.lstrip("-"), field.startswith("-")) for field in index.fields
+        ]
+
+        condition = {}
+
+        if index.condition is not None:
+            # Never created on backends without partial indexes (MySQL)
+            if not connection.features.supports_partial_indexes:
+                continue
+
+            # Only plain equality conditions, e.g. Q(is_complete=False)
+            children = index.condition.children
+
+            if (
+                index.condition.connector != Q.AND
+                or index.condition.negated
+                or not all(isinstance(child, tuple) for child in children)
+            ):
+                continue
+
+            condition = dict(children)
+
+        paths.append((columns, condition))
+
+    return paths
+
+
+def _path_serves(path: tuple, equalities: dict, ordering: list[tuple]) -> bool:
+    columns, condition = path
+
+    # A partial index only holds the rows its condition selects
+    for field, value in condition.items():
+        if field not in equalities or equalities[field] != value:
+            return False
+
+    prefix_fields = {field for field in equalities if field not in condition}
+
+    prefix = {field for field, _ in columns[: len(prefix_fields)]}
 
+    if prefix != prefix_fields:
+        return False
+
+    rest = columns[len(prefix_fields) :]
+
+    # The keyset id tie breaker has to come out of the index too
+    wanted = [*ordering, ("id", ordering[-1][1] if ordering else False)]
+
+    if len(rest) < len(wanted):
+        return False
+
+    rest = rest[: len(wanted)]
+
+    # A b-tree is read forwards, or backwards with every direction flipped
+    return rest == wanted or rest == [(field, not desc) for field, desc in wanted]
+
+
+def compile_note_query(filters: dict, ordering: str = None) -> tuple:
+    """Compile list filters and sort into one index backed query
+
+    Parameters
+    ----------
+    filters : dict
+        Values of the NOTE_QUERY_FILTERS params, None when absent
+
+    ordering : str, default None
+        Ordering param, created_at when None
 
     Exceptions
     ------
-     Error Detals: If Eail not found
+      ValidationError: If no index serves the filter and sort combination
+
+    Return
+    ------
+     (queryset, ordering): tuple
     """
+    order_by = parse_ordering(ordering) if ordering else DEFAULT_NOTE_ORDERING
 
-    try:
-        send_mail(
-            html_message=html_template,
-            fail_silently=False,
-            subject=email_data.get("subject"),
-            recipient_list=[email_data.get("to")],
-            from_email=settings.EMAIL_HOST_USER,
-            message="html_message",
+    lookups = {}
+    equalities = {}
+
+    for param, value in filters.items():
+        if value is None:
+            continue
+
+        lookup, equality = NOTE_QUERY_FILTERS[param]
+
+        if param == "status":
+            value = NOTE_STATUS_VALUES[value]
+
+        lookups[lookup] = value
+
+        if equality:
+            equalities[lookup] = value
+
+    # Sorting on a column pinned by an equality filter is a no-op
+    order_by = [(field, desc) for field, desc in order_by if field not in equalities]
+
+    # Fully pinned, created_at when an index serves it, else the id tie breaker
+    # right after the pinned columns, e.g. (priority, id) for priority=
+    candidates = [order_by] if order_by else [DEFAULT_NOTE_ORDERING, []]
+
+    paths = note_access_paths()
+
+    for order_by in candidates:
+        if any(_path_serves(path, equalities, order_by) for path in paths):
+            return note_queryset().filter(**lookups), order_by
+
+    raise exceptions.ValidationError(
+        {"ordering": "No index serves this filter and sort combination"}
+    )
+
+
+def query_notes(
+    limit: int,
+    cursor: str = None,
+    ordering: str = None,
+    fields: "NoteFieldSet" = None,
+    **filters,
+) -> "NotePage":
+    """Get a page of notes matching any index backed filter and sort
+
+    Parameters
+    ----------
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      ordering: str, default None
+        e.g. -priority,due_date
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+      filters:
+        status, priority, priority__gte, priority__lte, due_before, due_after
+
+    Return
+    ------
+        NotePage
+    """
+    return paginate_notes(
+        *compile_note_query(filters, ordering), limit, cursor, fields
+    )
+
+
+###### List cache ########
+
+# Scope of the lists that hold every user's notes
+ALL_NOTES_SCOPE = "all"
+
+
+def _generation_key(scope) -> str:
+    return f"notes:generation:{scope}"
+
+
+def get_notes_generation(scope) -> str:
+    """Get the current cache generation of a user (or of all notes)
+
+    Generations are random tokens rather than counters, so a bump is a plain
+    set and stays safe on cache backends without an atomic incr.
+
+    Parameters
+    ----------
+      scope: str
+        user id, or ALL_NOTES_SCOPE
+
+    Return
+    ------
+        generation: str
+    """
+    key = _generation_key(scope)
+
+    generation = cache.get(key)
+
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+
+    return generation
+
+
+def _bump_notes_generation(user_id) -> None:
+    cache.set_many(
+        {
+            _generation_key(user_id): uuid.uuid4().hex,
+            _generation_key(ALL_NOTES_SCOPE): uuid.uuid4().hex,
+        },
+        None,
+    )
+
+
+def _pending_note_changes(connection) -> list:
+    return [
+        func
+        for _, func, *_ in connection.run_on_commit
+        if hasattr(func, "notes_changed_user")
+    ]
+
+
+def notes_changed(user_id) -> None:
+    """Invalidate the cached lists holding notes of a user
+
+    The generation is bumped once the transaction commits, so no other
+    worker can cache the old rows under the new generation. Several writes
+    in one transaction bump only once.
+
+    Parameters
+    ----------
+      user_id: str
+        owner of the changed notes
+    """
+    connection = transaction.get_connection()
+
+    if not connection.in_atomic_block:
+        _bump_notes_generation(user_id)
+        return
+
+    for func in _pending_note_changes(connection):
+        if func.notes_changed_user == user_id:
+            return
+
+    def bump_after_commit():
+        _bump_notes_generation(user_id)
+
+    bump_after_commit.notes_changed_user = user_id
+
+    transaction.on_commit(bump_after_commit)
+
+
+def get_cached_payload(endpoint: str, params: dict, build, user: "User" = None):
+    """Serve a serialized list payload from the cache, building it on a miss
+
+    Parameters
+    ----------
+      endpoint: str
+        name of the list
+
+      params: dict
+        everything the payload depends on besides the notes
+
+      build: callable
+        returns the serialized payload
+
+      user: dict, default None
+        owner of the notes, None for the lists of all notes
+
+    Return
+    ------
+        payload
+    """
+    # Uncommitted rows must neither be served from nor written to the cache
+    if _pending_note_changes(transaction.get_connection()):
+        return build()
+
+    scope = user.id if user is not None else ALL_NOTES_SCOPE
+
+    key = _payload_key(scope, get_notes_generation(scope), endpoint, params)
+
+    payload = cache.get(key)
+
+    if payload is None:
+        # Cached for every later reader, so never built from a lagging replica
+        with routers.primary_reads():
+            payload = build()
+
+        cache.set(key, payload, settings.NOTE_CACHE_TTL)
+
+    return payload
+
+
+async def aget_cached_payload(
+    endpoint: str, params: dict, build, user: "User" = None
+):
+    """Async get_cached_payload, build is a coroutine function
+
+    Async apis run outside of transactions, no pending change to check. A
+    miss is built from the primary as well, the routing state is shared
+    with the sync_to_async threads running the queries.
+    """
+    scope = user.id if user is not None else ALL_NOTES_SCOPE
+
+    generation_key = _generation_key(scope)
+    generation = await cache.aget(generation_key)
+
+    if generation is None:
+        await cache.aadd(generation_key, uuid.uuid4().hex, None)
+        generation = await cache.aget(generation_key)
+
+    key = _payload_key(scope, generation, endpoint, params)
+
+    payload = await cache.aget(key)
+
+    if payload is None:
+        with routers.primary_reads():
+            payload = await build()
+
+        await cache.aset(key, payload, settings.NOTE_CACHE_TTL)
+
+    return payload
+
+
+def _payload_key(scope, generation: str, endpoint: str, params: dict) -> str:
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    return f"notes:payload:{scope}:{generation}:{endpoint}:{digest}"
+
+
+###### Note stats ########
+
+# NoteStats field -> (lowest, highest) priority counted
+NOTE_PRIORITY_BUCKETS = {
+    "priority_low": (1, 3),
+    "priority_medium": (4, 7),
+    "priority_high": (8, 10),
+}
+
+NOTE_STATS_FIELDS = ("total", "finished", *NOTE_PRIORITY_BUCKETS)
+
+
+def note_stats_aggregates() -> dict:
+    """Count expressions of every NoteStats field, for one aggregate query"""
+    aggregates = {
+        "total": Count("id"),
+        "finished": Count("id", filter=Q(is_complete=True)),
+    }
+
+    for field, (lowest, highest) in NOTE_PRIORITY_BUCKETS.items():
+        aggregates[field] = Count(
+            "id", filter=Q(priority__gte=lowest, priority__lte=highest)
         )
-    except:
-        return response.Response(
-            data={"message": "SMTP Connect error"},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+
+    return aggregates
+
+
+def _note_stats_deltas(added: list, removed: list) -> dict:
+    deltas = dict.fromkeys(NOTE_STATS_FIELDS, 0)
+
+    for notes, sign in ((added, 1), (removed, -1)):
+        for is_complete, priority in notes:
+            deltas["total"] += sign
+
+            if is_complete:
+                deltas["finished"] += sign
+
+            for field, (lowest, highest) in NOTE_PRIORITY_BUCKETS.items():
+                if lowest <= priority <= highest:
+                    deltas[field] += sign
+
+    return {field: delta for field, delta in deltas.items() if delta}
+
+
+def adjust_note_stats(
+    user_id, added: list = (), removed: list = (), changes: int = 0
+) -> range:
+    """Apply the counter changes of a note write, taking its change sequence
+
+    Call inside the transaction of the write, before writing the notes. The
+    counters commit or roll back with the notes, and the counter row stays
+    locked until then, so the change sequence numbers of a user commit in
+    order.
+
+    Parameters
+    ----------
+      user_id: str
+        owner of the notes
+
+      added: list, default ()
+        (is_complete, priority) of every note created or of its new state
+
+      removed: list, default ()
+        (is_complete, priority) of every note deleted or of its old state
+
+      changes: int, default 0
+        number of notes written or deleted, one change sequence number each
+
+    Return
+    ------
+        change sequence numbers: range, empty without changes
+    """
+    deltas = _note_stats_deltas(added, removed)
+
+    if changes:
+        deltas["change_seq"] = changes
+
+    if not deltas:
+        return range(0)
+
+    stats = models.NoteStats.objects.filter(user_id=user_id)
+
+    values = {field: F(field) + delta for field, delta in deltas.items()}
+
+    if not stats.update(updated_at=timezone.now(), **values):
+        # No counters yet, counted from the notes as they are before this write
+        rebuild_note_stats(user_id)
+        stats.update(updated_at=timezone.now(), **values)
+
+    if not changes:
+        return range(0)
+
+    last = stats.values_list("change_seq", flat=True).get()
+
+    return range(last - changes + 1, last + 1)
+
+
+def rebuild_note_stats(user_id) -> "models.NoteStats":
+    """Recount the notes of a user into their counter row
+
+    The row is locked before the notes are counted, so note writes of the user
+    either committed before the count or wait until the row is rebuilt.
+
+    Parameters
+    ----------
+      user_id: str
+        owner of the notes
+
+    Return
+    ------
+        NoteStats: instance object
+    """
+    with transaction.atomic():
+        stats, _ = models.NoteStats.objects.select_for_update().get_or_create(
+            user_id=user_id
+        )
+
+        counts = (
+            sharding.notes(user_id)
+            .filter(user_id=user_id)
+            .aggregate(**note_stats_aggregates(), change_seq=Max("change_seq"))
+        )
+
+        # Never lowered, numbers already given out are not handed out again
+        counts["change_seq"] = Greatest(
+            F("change_seq"), _last_change_seq(user_id, counts["change_seq"])
+        )
+
+        models.NoteStats.objects.filter(user_id=user_id).update(
+            updated_at=timezone.now(), **counts
+        )
+
+        stats.refresh_from_db()
+
+    return stats
+
+
+def _last_change_seq(user_id, last_note_seq: int = None) -> int:
+    # Every number given out is on a note or a tombstone, the counter restarts
+    # from the highest of them
+    last_tombstone_seq = models.NoteTombstone.objects.filter(
+        user_id=user_id
+    ).aggregate(change_seq=Max("change_seq"))["change_seq"]
+
+    return max(last_note_seq or 0, last_tombstone_seq or 0)
+
+
+def lock_note_writes(user_id, alias: str) -> None:
+    """Lock the counter row of a user, first thing in a note write
+
+    Call inside sharding.atomic(alias), before any note is read for update.
+    move_user takes the same lock to switch the shard of the user, a write
+    that looked up its shard before the switch raises ShardMoved here and is
+    run again by sharding.retry_moved.
+
+    Parameters
+    ----------
+      user_id: str
+        owner of the notes
+
+      alias: str
+        database the write was opened on
+    """
+    # Users only move between shards
+    if not sharding.is_enabled():
+        return
+
+    locked = models.NoteStats.objects.select_for_update().filter(user_id=user_id)
+
+    if not locked.values_list("pk", flat=True):
+        # No counters yet, created locked
+        rebuild_note_stats(user_id)
+
+    if sharding.shard_for_user(user_id) != alias:
+        raise sharding.ShardMoved(user_id)
+
+
+def reconcile_note_stats() -> int:
+    """Rebuild the counters of every user, one locked user at a time
+
+    Users without notes lose their row, it is rebuilt (zeros) on first read,
+    unless it holds change sequence numbers no tombstone records.
+
+    Return
+    ------
+        number of users with notes: int
+    """
+    user_ids = set(models.NoteStats.objects.values_list("user", flat=True))
+
+    for alias in sharding.note_databases() if sharding.is_enabled() else [None]:
+        user_ids.update(
+            models.Note.objects.using(alias)
+            .order_by()
+            .values_list("user", flat=True)
+            .distinct()
+        )
+
+    with_notes = 0
+
+    for user_id in user_ids:
+        with transaction.atomic():
+            stats = rebuild_note_stats(user_id)
+
+            if stats.total:
+                with_notes += 1
+            elif stats.change_seq <= _last_change_seq(user_id):
+                stats.delete()
+
+    return with_notes
+
+
+def get_note_stats(user: "User") -> "NoteStatsDataClass":
+    """Get the note counts of a user
+
+    Status and priority counts come from the counter row. Notes turn overdue
+    as time passes, that count is read from the (user, is_complete, due_date)
+    index.
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+    Return
+    ------
+        NoteStatsDataClass: the note counts
+    """
+    stats = models.NoteStats.objects.filter(user_id=user.id).first()
+
+    if stats is None:
+        stats = rebuild_note_stats(user.id)
+
+    # Both statuses listed, so the index is seeked once per status
+    overdue = (
+        sharding.notes(user.id)
+        .filter(
+            user_id=user.id,
+            is_complete__in=(False, True),
+            due_date__lte=timezone.now(),
         )
+        .count()
+    )
+
+    return NoteStatsDataClass(
+        total=stats.total,
+        finished=stats.finished,
+        unfinished=stats.total - stats.finished,
+        overdue=overdue,
+        priority={
+            "low": stats.priority_low,
+            "medium": stats.priority_medium,
+            "high": stats.priority_high,
+        },
+    )
+
+
+###### Api Essentials functions ########
+
+
+@sharding.retry_moved
+def create_note(user, note_dc: "NoteDataClass") -> "NoteDataClass":
+    """Create note
+
+    Parameter
+    ----------
+    Note : note object instance
+        The note details
+
+    Returns
+    ------
+     Note Data Class
+    """
+    instance = models.Note(
+        title=note_dc.title,
+        due_date=note_dc.due_date,
+        content=note_dc.content,
+        priority=note_dc.priority,
+        user=user,
+    )
+
+    alias = sharding.assign_shard(user.id)
+
+    with sharding.atomic(alias):
+        lock_note_writes(user.id, alias)
+
+        (instance.change_seq,) = adjust_note_stats(
+            user.id, added=[(instance.is_complete, instance.priority)], changes=1
+        )
+
+        instance.save()
+
+    return NoteDataClass.from_instance(instance)
+
+
+def get_user_notes(
+    user: "User", limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get notes by user
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        NotePage
+           contain a page of user notes details
+    """
+    return paginate_notes(*note_listing("user_notes", user), limit, cursor, fields)
+
+
+def get_notes(
+    limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes
+
+    Parameters
+    ----------
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        NotePage
+           contain a page of all notes
+    """
+    return paginate_notes(*note_listing("notes"), limit, cursor, fields)
+
+
+# Delta sync order, (change_seq, id) of the notes and of the tombstones
+NOTE_CHANGES_ORDERING = [("change_seq", False), ("id", False)]
+
+
+def get_note_changes(
+    user: "User", limit: int, since: str = None, fields: "NoteFieldSet" = None
+) -> "NoteChanges":
+    """Get the notes of a user created, updated or deleted after a cursor
+
+    Notes and tombstones are read after the cursor from their (user,
+    change_seq, id) indexes, limit + 1 each, and merged. Both stop at the
+    change sequence of the counter row read first. Writers take their
+    numbers from the counter row and release it only once their notes
+    committed (sharding.atomic commits the shard first), so every change up
+    to it is visible and the next cursor never skips one. Without since every
+    note is sent and no tombstone, the client starts empty.
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      limit: int
+        maximum number of changes sent
+
+      since: str, default None
+        cursor of the last change the client has, from a previous sync
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        NoteChanges
+    """
+    # Counter, tombstones and unsharded notes read from the same database, a
+    # replica behind the counter would let the cursor skip changes
+    if sharding.is_enabled():
+        alias = DEFAULT_DB_ALIAS
+    else:
+        alias = models.NoteStats.objects.all().db
+
+    head = (
+        models.NoteStats.objects.using(alias)
+        .filter(user_id=user.id)
+        .values_list("change_seq", flat=True)
+        .first()
+    )
+
+    if head is None:
+        head = rebuild_note_stats(user.id).change_seq
+
+    notes = sharding.notes(user.id).filter(user_id=user.id, change_seq__lte=head)
+
+    if not sharding.is_enabled():
+        notes = notes.using(alias)
+
+    changes = []
+
+    if since:
+        values, _ = decode_cursor(since, NOTE_CHANGES_ORDERING)
+
+        # Nothing written since, the polling clients stop at the counter row
+        if values[0] and values[0] >= head:
+            return NoteChanges(results=[], deleted=[], since=since, fields=fields)
+
+        after = _seek_filter(NOTE_CHANGES_ORDERING, values, False)
+
+        notes = notes.filter(after)
+
+        changes.extend(
+            (change_seq, note_id, None)
+            for change_seq, note_id in models.NoteTombstone.objects.using(alias)
+            .filter(after, user_id=user.id, change_seq__lte=head)
+            .order_by("change_seq", "id")
+            .values_list("change_seq", "id")[: limit + 1]
+        )
+
+    columns = note_row_columns(fields, [field for field, _ in NOTE_CHANGES_ORDERING])
+
+    key_columns = [columns.index(field) for field, _ in NOTE_CHANGES_ORDERING]
+
+    # change_seq is not a note field, the serializers take the rows without it
+    width = len(note_row_columns(fields))
+
+    for row in fetch_note_rows(
+        notes.order_by("change_seq", "id"), columns, limit + 1, NOTE_CHANGES_ORDERING
+    ):
+        changes.append((*[row[column] for column in key_columns], row[:width]))
+
+    # (change_seq, id, note row or None when deleted)
+    changes.sort(key=lambda change: change[:2])
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    return NoteChanges(
+        results=[row for *_, row in changes if row is not None],
+        deleted=[note_id for _, note_id, row in changes if row is None],
+        since=encode_cursor(changes[-1][:2]) if changes else since,
+        has_more=has_more,
+        fields=fields,
+    )
+
+
+def get_export_notes() -> list["NoteDataClass"]:
+    """Get all notes for the csv, pdf and mail exports
+
+    Parameters
+    ----------
+      None
+
+    Return
+    ------
+        Note: list[NoteDataClass]
+           contain all notes
+    """
+    if sharding.is_enabled():
+        rows = iter_export_rows(NOTE_ROW_COLUMNS)
+    else:
+        rows = (
+            models.Note.objects.order_by("created_at", "id")
+            .values_list(*NOTE_ROW_COLUMNS)
+            .iterator(chunk_size=settings.NOTE_EXPORT_CHUNK_SIZE)
+        )
+
+    # One user record per user, shared by all of their notes
+    users = {}
+
+    return [NoteDataClass.from_row(row, users) for row in rows]
+
+
+# Header and columns of the csv export, in file order
+CSV_HEADER = (
+    "id",
+    "title",
+    "content",
+    "created_at",
+    "due_date",
+    "priority",
+    "is_complete",
+    "user_id",
+    "user_first_name",
+    "user_last_name",
+    "user_email",
+)
+
+CSV_COLUMNS = (
+    "id",
+    "title",
+    "content",
+    "created_at",
+    "due_date",
+    "priority",
+    "is_complete",
+    "user__id",
+    "user__first_name",
+    "user__last_name",
+    "user__email",
+)
+
+
+class _Echo:
+    """File like object handing back what csv.writer writes to it"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def format_datetime(value: datetime.datetime) -> str:
+    """Format a datetime the same way DRF DateTimeField does
+
+    Parameters
+    ----------
+    value : datetime
+        Aware datetime read from the db
+
+    Return
+    ------
+     ISO 8601 string, UTC written as Z: str
+    """
+    value = timezone.localtime(value).isoformat()
+
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+
+    return value
+
+
+def iter_export_rows(columns: tuple) -> Iterator[tuple]:
+    """Read every note in created order, one chunk at a time
+
+    Each chunk is a keyset query on (created_at, id), so only
+    NOTE_EXPORT_CHUNK_SIZE rows are held in memory on every db backend.
+
+    Parameters
+    ----------
+    columns : tuple
+        values_list columns of the rows
+
+    Return
+    ------
+        Iterator of row tuples
+    """
+    last_key = None
+
+    while True:
+        rows = fetch_note_rows(
+            _export_chunk(last_key),
+            ("created_at", "id", *columns),
+            settings.NOTE_EXPORT_CHUNK_SIZE,
+            EXPORT_ORDERING,
+        )
+
+        for row in rows:
+            yield row[2:]
+
+        if len(rows) < settings.NOTE_EXPORT_CHUNK_SIZE:
+            return
+
+        last_key = list(rows[-1][:2])
+
+
+# Keyset of the export chunks
+EXPORT_ORDERING = [("created_at", False), ("id", False)]
+
+
+def _export_chunk(last_key: list = None):
+    # Notes after last_key, the caller reads NOTE_EXPORT_CHUNK_SIZE of them
+    chunk = models.Note.objects.order_by("created_at", "id")
+
+    if last_key is not None:
+        chunk = chunk.filter(_seek_filter(EXPORT_ORDERING, last_key, False))
+
+    return chunk
+
+
+def stream_notes_csv() -> Iterator[str]:
+    """Generate the csv export of all notes line by line
+
+    Rows go straight from the db to csv lines without DRF serialization,
+    memory stays flat whatever the number of notes.
+
+    Return
+    ------
+        Iterator of csv lines
+    """
+    writer = csv.writer(_Echo())
+
+    yield writer.writerow(CSV_HEADER)
+
+    for row in iter_export_rows(CSV_COLUMNS):
+        yield writer.writerow(_csv_row(row))
+
+
+def _csv_row(row: tuple) -> list:
+    (
+        note_id,
+        title,
+        content,
+        created_at,
+        due_date,
+        priority,
+        is_complete,
+        user_id,
+        first_name,
+        last_name,
+        email,
+    ) = row
+
+    return [
+        str(note_id),
+        title,
+        content,
+        format_datetime(created_at),
+        format_datetime(due_date),
+        priority,
+        is_complete,
+        str(user_id),
+        first_name,
+        last_name,
+        email,
+    ]
+
+
+def get_user_notes_version(user: "User") -> tuple[int, datetime.datetime]:
+    """Get a cheap change marker of the notes of a user
+
+    Any create, update or delete changes either the count or the latest
+    update time. Read from the (user, updated_at) index without loading notes.
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+    Return
+    ------
+        (count, last updated): tuple
+    """
+    version = (
+        sharding.notes(user.id)
+        .filter(user=user)
+        .aggregate(count=Count("id"), last_updated=Max("updated_at"))
+    )
+
+    return version["count"], version["last_updated"]
+
+
+# Change marker of a note, the owner is embedded in the note payload
+NOTE_VERSION_COLUMNS = (
+    "updated_at",
+    "user__first_name",
+    "user__last_name",
+    "user__email",
+    "user__is_email_verified",
+)
+
+
+def get_note_version(note_id: str) -> tuple:
+    """Get the change marker of a single note
+
+    Parameters
+    ----------
+      note_id: str
+        contains note id
+
+    Return
+    ------
+        (last updated, owner first name, last name, email, is verified): tuple
+        None when the note does not exist
+    """
+    check_valid_uuid(note_id)
+
+    rows = fetch_note_rows(
+        models.Note.objects.filter(id=note_id), NOTE_VERSION_COLUMNS, 1
+    )
+
+    return rows[0] if rows else None
+
+
+def get_user_note(note_id: str) -> "NoteDataClass":
+    """Get  user note by id
+
+    Parameters
+    ----------
+      note_id: str
+        contains note id
+
+    Return
+    ------
+        Note: Note data class
+           contain note details
+    """
+    check_valid_uuid(note_id)
+
+    notes = note_queryset().using(sharding.note_database(note_id))
+
+    note = notes.filter(id=note_id).first()
+
+    if not note:
+        raise exceptions.NotFound("Note Does not exist")
+
+    return NoteDataClass.from_instance(note)
+
+
+def get_user_note_row(note_id: str, fields: "NoteFieldSet") -> tuple:
+    """Get the picked fields of a note, without reading the other columns
+
+    Parameters
+    ----------
+      note_id: str
+        contains note id
+
+      fields: NoteFieldSet
+        fields picked by the client
+
+    Return
+    ------
+        row: tuple of fields.columns
+    """
+    check_valid_uuid(note_id)
+
+    rows = fetch_note_rows(models.Note.objects.filter(id=note_id), fields.columns, 1)
+
+    if not rows:
+        raise exceptions.NotFound("Note Does not exist")
+
+    return rows[0]
+
+
+def _raise_missing_note(user: "User", note_id: str) -> None:
+    # Not on the shard of the user, yet maybe on the shard of another user
+    if sharding.foreign_note_ids([note_id], user.id):
+        raise exceptions.PermissionDenied("Unauthorized")
+
+    raise exceptions.NotFound("Note Does not exist")
+
+
+@sharding.retry_moved
+def delete_user_note(user: "User", note_id: str) -> None:
+    """Delete user note
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      note_id: str
+        contains note id to be delete
+
+    Return
+    ------
+        None
+    """
+    check_valid_uuid(note_id)
+
+    alias = sharding.shard_for_user(user.id)
+
+    with sharding.atomic(alias):
+        lock_note_writes(user.id, alias)
+
+        # Locked, the counters are adjusted by the values deleted
+        note = (
+            note_queryset(user.id)
+            .select_for_update(of=("self",))
+            .filter(id=note_id)
+            .first()
+        )
+
+        if not note:
+            _raise_missing_note(user, note_id)
+
+        if note.user_id != user.id:
+            raise exceptions.PermissionDenied("Unauthorized")
+
+        (change_seq,) = adjust_note_stats(
+            user.id, removed=[(note.is_complete, note.priority)], changes=1
+        )
+
+        models.NoteTombstone.objects.create(
+            id=note.id, user_id=user.id, change_seq=change_seq
+        )
+
+        note.delete()
+
+
+@sharding.retry_moved
+def update_user_note(
+    user: "User", note_id: str, note_data: "NoteDataClass"
+) -> "NoteDataClass":
+    """Update user note
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      note_id: str
+        contains note id to be updated
+
+      note_data: dict
+        contains new details of note
+
+    Return
+    ------
+        Note: Note data class
+           contain new note details
+    """
+
+    check_valid_uuid(note_id)
+
+    alias = sharding.shard_for_user(user.id)
+
+    with sharding.atomic(alias):
+        lock_note_writes(user.id, alias)
+
+        # Locked, the counters are adjusted from the values replaced
+        note = (
+            note_queryset(user.id)
+            .select_for_update(of=("self",))
+            .filter(id=note_id)
+            .first()
+        )
+
+        if not note:
+            _raise_missing_note(user, note_id)
+
+        if note.user_id != user.id:
+            raise exceptions.PermissionDenied("Unauthorized")
+
+        previous = (note.is_complete, note.priority)
+
+        note.title = note_data.title
+        note.content = note_data.content
+        note.due_date = note_data.due_date
+        note.priority = note_data.priority
+        note.is_complete = note_data.is_complete
+
+        (note.change_seq,) = adjust_note_stats(
+            user.id,
+            added=[(note.is_complete, note.priority)],
+            removed=[previous],
+            changes=1,
+        )
+
+        note.save()
+
+    return NoteDataClass.from_instance(note)
+
+
+# Columns written by the bulk update, same as update_user_note
+BULK_UPDATE_FIELDS = [
+    "title",
+    "content",
+    "due_date",
+    "priority",
+    "is_complete",
+    "updated_at",
+    "change_seq",
+]
+
+
+@sharding.retry_moved
+def bulk_create_notes(
+    user: "User", notes_dc: list["NoteDataClass"]
+) -> list["BulkResultDataClass"]:
+    """Create many notes with a single insert
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      notes_dc: list[NoteDataClass]
+        contains the new notes
+
+    Return
+    ------
+        list[BulkResultDataClass]
+           one result per note, in request order
+    """
+    instances = [
+        models.Note(
+            title=note_dc.title,
+            due_date=note_dc.due_date,
+            content=note_dc.content,
+            priority=note_dc.priority,
+            is_complete=note_dc.is_complete,
+            user=user,
+        )
+        for note_dc in notes_dc
+    ]
+
+    alias = sharding.assign_shard(user.id)
+
+    with sharding.atomic(alias):
+        lock_note_writes(user.id, alias)
+
+        change_seqs = adjust_note_stats(
+            user.id,
+            added=[(instance.is_complete, instance.priority) for instance in instances],
+            changes=len(instances),
+        )
+
+        for instance, change_seq in zip(instances, change_seqs):
+            instance.change_seq = change_seq
+
+        sharding.notes(user.id).bulk_create(
+            instances, batch_size=settings.NOTE_BULK_BATCH_SIZE
+        )
+
+        # bulk_create sends no post_save
+        notes_changed(user.id)
+
+    users = {}
+
+    return [
+        BulkResultDataClass(
+            id=instance.id,
+            status="created",
+            note=NoteDataClass.from_instance(instance, users),
+        )
+        for instance in instances
+    ]
+
+
+@sharding.retry_moved
+def bulk_update_notes(
+    user: "User", notes_dc: list["NoteDataClass"]
+) -> list["BulkResultDataClass"]:
+    """Update many user notes with one read and one bulk update
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      notes_dc: list[NoteDataClass]
+        contains the notes new details, id included
+
+    Return
+    ------
+        list[BulkResultDataClass]
+           one result per note, in request order
+    """
+    # bulk_update skips auto_now, stamp the notes ourselves
+    updated_at = timezone.now()
+
+    note_ids = [note_dc.id for note_dc in notes_dc]
+
+    alias = sharding.shard_for_user(user.id)
+
+    with sharding.atomic(alias):
+        lock_note_writes(user.id, alias)
+
+        notes = (
+            note_queryset(user.id).select_for_update(of=("self",)).in_bulk(note_ids)
+        )
+
+        # Notes of other users on other shards
+        foreign = sharding.foreign_note_ids(
+            [note_id for note_id in note_ids if note_id not in notes], user.id
+        )
+
+        results = []
+        updated = {}
+        previous = []
+
+        for note_dc in notes_dc:
+            note = notes.get(note_dc.id)
+
+            if not note and note_dc.id not in foreign:
+                results.append(BulkResultDataClass(id=note_dc.id, status="not_found"))
+                continue
+
+            if not note or note.user_id != user.id:
+                results.append(BulkResultDataClass(id=note_dc.id, status="forbidden"))
+                continue
+
+            if note.id not in updated:
+                previous.append((note.is_complete, note.priority))
+
+            note.title = note_dc.title
+            note.content = note_dc.content
+            note.due_date = note_dc.due_date
+            note.priority = note_dc.priority
+            note.is_complete = note_dc.is_complete
+            note.updated_at = updated_at
+
+            updated[note.id] = note
+            results.append(BulkResultDataClass(id=note.id, status="updated"))
+
+        change_seqs = adjust_note_stats(
+            user.id,
+            added=[(note.is_complete, note.priority) for note in updated.values()],
+            removed=previous,
+            changes=len(updated),
+        )
+
+        for note, change_seq in zip(updated.values(), change_seqs):
+            note.change_seq = change_seq
+
+        sharding.notes(user.id).bulk_update(
+            updated.values(),
+            BULK_UPDATE_FIELDS,
+            batch_size=settings.NOTE_BULK_BATCH_SIZE,
+        )
+
+        # bulk_update sends no post_save
+        notes_changed(user.id)
+
+    users = {}
+
+    for result in results:
+        if result.status == "updated":
+            result.note = NoteDataClass.from_instance(updated[result.id], users)
+
+    return results
+
+
+@sharding.retry_moved
+def bulk_delete_notes(user: "User", note_ids: list) -> list["BulkResultDataClass"]:
+    """Delete many user notes with a single filtered delete
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      note_ids: list[uuid]
+        contains the ids of the notes to delete
+
+    Return
+    ------
+        list[BulkResultDataClass]
+           one result per id, in request order
+    """
+    alias = sharding.shard_for_user(user.id)
+
+    with sharding.atomic(alias):
+        lock_note_writes(user.id, alias)
+
+        rows = (
+            sharding.notes(user.id)
+            .select_for_update()
+            .filter(id__in=note_ids)
+            .values_list("id", "user_id", "is_complete", "priority")
+        )
+
+        owners = {}
+        removed = []
+
+        for note_id, owner, is_complete, priority in rows:
+            owners[note_id] = owner
+
+            if owner == user.id:
+                removed.append((is_complete, priority))
+
+        # Notes of other users on other shards
+        for note_id in sharding.foreign_note_ids(
+            [note_id for note_id in note_ids if note_id not in owners], user.id
+        ):
+            owners[note_id] = None
+
+        owned = [note_id for note_id, owner in owners.items() if owner == user.id]
+
+        change_seqs = adjust_note_stats(user.id, removed=removed, changes=len(owned))
+
+        models.NoteTombstone.objects.bulk_create(
+            [
+                models.NoteTombstone(id=note_id, user_id=user.id, change_seq=change_seq)
+                for note_id, change_seq in zip(owned, change_seqs)
+            ],
+            batch_size=settings.NOTE_BULK_BATCH_SIZE,
+        )
+
+        sharding.notes(user.id).filter(id__in=owned, user=user).delete()
+
+    results = []
+
+    for note_id in note_ids:
+        if note_id not in owners:
+            status = "not_found"
+        elif owners[note_id] != user.id:
+            status = "forbidden"
+        else:
+            status = "deleted"
+
+        results.append(BulkResultDataClass(id=note_id, status=status))
+
+    return results
+
+
+def search_user_notes(
+    user: "User",
+    q: str,
+    limit: int,
+    cursor: str = None,
+    fields: "NoteFieldSet" = None,
+) -> "NotePage":
+    """Full-text search over the title and content of user notes
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      q: str
+        words to search for
+
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        NotePage
+           best matches first
+    """
+    using = sharding.shard_for_user(user.id)
+
+    if not search.is_available(using):
+        # No full-text index on this backend, scan instead
+        notes = note_queryset(user.id).filter(
+            Q(title__icontains=q) | Q(content__icontains=q), user=user
+        )
+
+        page = paginate_notes(
+            notes,
+            [("created_at", False)],
+            limit,
+            _decode_search_cursor(cursor, SEARCH_SCAN) if cursor else None,
+            fields,
+        )
+
+        page.next, page.previous = (
+            _encode_search_cursor(SEARCH_SCAN, value) if value else None
+            for value in (page.next, page.previous)
+        )
+
+        return page
+
+    after = None
+
+    if cursor:
+        try:
+            score, note_id = _decode_search_cursor(cursor, SEARCH_RANK)
+            after = (float(score), UUID(note_id))
+
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError("Cursor is not valid")
+
+    ranked = search.search_note_ids(user.id, q, limit + 1, after, using)
+
+    has_more = len(ranked) > limit
+    ranked = ranked[:limit]
+
+    columns = note_row_columns(fields, ["id"])
+    id_column = columns.index("id")
+
+    rows = {
+        row[id_column]: row
+        for row in fetch_note_rows(
+            sharding.notes(user.id).filter(id__in=[note_id for note_id, _ in ranked]),
+            columns,
+            len(ranked),
+        )
+    }
+
+    page = NotePage(
+        results=[rows[note_id] for note_id, _ in ranked if note_id in rows],
+        fields=fields,
+    )
+
+    if has_more:
+        note_id, score = ranked[-1]
+        page.next = _encode_search_cursor(SEARCH_RANK, [score, str(note_id)])
+
+    return page
+
+
+# Kinds of search cursor, ranked by the full-text index or a created_at keyset
+# of the scan. The index can come and go between two pages
+SEARCH_RANK = "rank"
+SEARCH_SCAN = "scan"
+
+# Kind -> type of the value it carries, (score, id) or a keyset cursor
+SEARCH_CURSOR_TYPES = {SEARCH_RANK: list, SEARCH_SCAN: str}
+
+
+def _encode_search_cursor(kind: str, value) -> str:
+    return base64.urlsafe_b64encode(
+        json.dumps({"k": kind, "c": value}, separators=(",", ":")).encode()
+    ).decode()
+
+
+def _decode_search_cursor(cursor: str, kind: str):
+    # A cursor of the other kind is refused, its page can't be found here
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        if payload["k"] != kind or not isinstance(
+            payload["c"], SEARCH_CURSOR_TYPES[kind]
+        ):
+            raise ValueError
+
+        return payload["c"]
+
+    except (binascii.Error, KeyError, TypeError, ValueError):
+        raise exceptions.ValidationError("Cursor is not valid")
+
+
+def get_unfinished_note(
+    limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes that are unfinished/not completed
+
+    Parameters
+    ----------
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        Contains orderd noted
+    """
+    return paginate_notes(*note_listing("unfinished"), limit, cursor, fields)
+
+
+def get_finished_note(
+    limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes that are finished/completed
+
+    Parameters
+    ----------
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        Contains orderd noted
+    """
+    return paginate_notes(*note_listing("finished"), limit, cursor, fields)
+
+
+def get_overdue_note(
+    limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes that are overdue date
+
+    Parameters
+    ----------
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+    Return
+    ------
+        Contains orderd noted
+    """
+    return paginate_notes(*note_listing("overdue"), limit, cursor, fields)
+
+
+def get_order_by_due_date_note(
+    order_arg: str, limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes ordered by due date
+
+    Parameters
+    ----------
+     order_arg : str
+        Could be either asc (ascending) or desc (descending)
+
+     limit : int
+        Maximum number of notes on the page
+
+     cursor : str, default None
+        Cursor of the page to fetch
+
+     fields : NoteFieldSet, default None
+        Fields picked by the client, every field when None
+
+    Return
+    ------
+        Contains orderd noted
+    """
+    return paginate_notes(
+        *note_listing("order_due_date", order_arg=order_arg), limit, cursor, fields
+    )
+
+
+def get_order_by_priority_note(
+    order_arg: str, limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes ordered by priority
+
+    Parameters
+    ----------
+     order_arg : str
+        Could be either asc (ascending) or desc (descending)
+
+     limit : int
+        Maximum number of notes on the page
+
+     cursor : str, default None
+        Cursor of the page to fetch
+
+     fields : NoteFieldSet, default None
+        Fields picked by the client, every field when None
+
+    Return
+    ------
+        Contains orderd noted
+    """
+    return paginate_notes(
+        *note_listing("order_priority", order_arg=order_arg), limit, cursor, fields
+    )
+
+
+def get_order_by_created_at_note(
+    order_arg: str, limit: int, cursor: str = None, fields: "NoteFieldSet" = None
+) -> "NotePage":
+    """Get all notes ordered by created date
+
+    Parameters
+    ----------
+     order_arg : str
+        Could be either asc (ascending) or desc (descending)
+
+     limit : int
+        Maximum number of notes on the page
+
+     cursor : str, default None
+        Cursor of the page to fetch
+
+     fields : NoteFieldSet, default None
+        Fields picked by the client, every field when None
+
+    Return
+    ------
+        Contains orderd noted
+    """
+    return paginate_notes(
+        *note_listing("order_created_at", order_arg=order_arg), limit, cursor, fields
+    )
+
+
+def generate_pdf_html() -> object:
+    """Generate context( variables) for pdf html template
+
+    Parameters
+    ----------
+        None
+
+
+    Return
+    ------
+     context: dict
+    """
+
+    # Get all notes
+    notes = get_export_notes()
+
+    html_data = {}
+
+    for index, note in enumerate(notes):
+        html_data[index] = {
+            "id": note.id,
+            "title": note.title,
+            "content": note.content,
+            "created_at": note.created_at,
+            "due_date": note.due_date,
+            "is_complete": note.is_complete,
+            "priority": note.priority,
+            "user_id": note.user.id,
+            "first_name": note.user.first_name,
+            "last_name": note.user.last_name,
+            "email": note.user.email,
+        }
+
+        """
+        EXAMPLE DATA
+
+            context = {
+            0: {
+                    "id": UUID("ebfe6d73-6e7d-40e1-9e94-95d155680ebf"),
+                    "title": "New Create",
+                    "content": "New",
+                    "created_at": datetime.datetime(
+                        2023, 9, 25, 13, 26, 22, 240071, tzinfo=datetime.timezone.utc
+                    ),
+                    "due_date": datetime.datetime(
+                        2023, 9, 23, 20, 45, 37, 13440, tzinfo=datetime.timezone.utc
+                    ),
+                    "is_complete": False,
+                    "priority": 3,
+                    "user_id": UUID("49b052c8-7677-44be-88b1-6c15ebd03f9f"),
+                    "first_name": "Larry",
+                    "last_name": "Mall",
+                    "email": "michotall95@gmail.com",
+
+                },
+            }
+        """
+
+    context = {"note_lists": html_data}
+
+    return context
+
+
+def render_notes_pdf() -> bytes:
+    """Render every note into the pdf export
+
+    Exceptions
+    ------
+      NotFound: If the pdf could not be generated
+
+    Return
+    ------
+     pdf document: bytes
+    """
+    context = generate_pdf_html()
+    html_rendered = get_template("notes.html").render(context)
+
+    result = BytesIO()
+
+    pdf = pisa.pisaDocument(BytesIO(html_rendered.encode("ISO-8859-1")), result)
+
+    if pdf.err:
+        raise exceptions.NotFound("Invalid pdf")
+
+    return result.getvalue()
+
+
+def export_storage() -> FileSystemStorage:
+    """Storage holding the files rendered by export jobs"""
+    return FileSystemStorage(location=settings.NOTE_EXPORT_ROOT)
+
+
+def create_export_job(user: "User") -> "ExportJobDataClass":
+    """Queue a pdf export of all notes
+
+    The job row is the queue entry, it is picked up by the local worker pool
+    once the transaction commits (or by the run_export_jobs command).
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+    Return
+    ------
+        ExportJobDataClass
+    """
+    from . import jobs
+
+    job = models.ExportJob.objects.create(user=user)
+
+    transaction.on_commit(lambda: jobs.schedule_export_job(job.id))
+
+    return ExportJobDataClass.from_instance(job)
+
+
+def _get_user_export_job(user: "User", job_id: str) -> "ExportJob":
+    check_valid_uuid(job_id)
+
+    job = models.ExportJob.objects.filter(id=job_id).first()
+
+    if not job:
+        raise exceptions.NotFound("Export does not exist")
+
+    if job.user_id != user.id:
+        raise exceptions.PermissionDenied("Unauthorized")
+
+    return job
+
+
+def get_export_job(user: "User", job_id: str) -> "ExportJobDataClass":
+    """Get the status of a user export job
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      job_id: str
+        contains job id
+
+    Return
+    ------
+        ExportJobDataClass
+    """
+    return ExportJobDataClass.from_instance(_get_user_export_job(user, job_id))
+
+
+def open_export_file(user: "User", job_id: str) -> "File":
+    """Open the file rendered by a finished export job
+
+    Parameters
+    ----------
+      user: dict
+        contains user details
+
+      job_id: str
+        contains job id
+
+    Exceptions
+    ------
+      NotFound: If the job is not done yet
+
+    Return
+    ------
+        File opened in binary mode
+    """
+    job = _get_user_export_job(user, job_id)
+
+    if job.status != models.ExportJob.STATUS_DONE:
+        raise exceptions.NotFound("Export is not ready")
+
+    return export_storage().open(job.file_name, "rb")
+
+
+###### Async api functions ########
+# Same reads as above through the async ORM, for the apis served under ASGI
+
+
+async def aget_note_page(
+    listing: str,
+    limit: int,
+    cursor: str = None,
+    fields: "NoteFieldSet" = None,
+    user: "User" = None,
+    order_arg: str = None,
+) -> "NotePage":
+    """Get a page of a note list
+
+    Parameters
+    ----------
+      listing: str
+        name of the list, see note_listing
+
+      limit: int
+        maximum number of notes on the page
+
+      cursor: str, default None
+        cursor of the page to fetch
+
+      fields: NoteFieldSet, default None
+        fields picked by the client, every field when None
+
+      user: dict, default None
+        owner of the notes, for user_notes
+
+      order_arg: str, default None
+        asc or desc, for the order_* lists
+
+    Return
+    ------
+        NotePage
+    """
+    queryset, ordering = note_listing(listing, user, order_arg)
+
+    return await apaginate_notes(queryset, ordering, limit, cursor, fields)
+
+
+async def aquery_notes(
+    limit: int,
+    cursor: str = None,
+    ordering: str = None,
+    fields: "NoteFieldSet" = None,
+    **filters,
+) -> "NotePage":
+    """Async query_notes"""
+    queryset, order_by = compile_note_query(filters, ordering)
+
+    return await apaginate_notes(queryset, order_by, limit, cursor, fields)
+
+
+async def aget_user_note(note_id: str) -> "NoteDataClass":
+    """Get  user note by id
+
+    Parameters
+    ----------
+      note_id: str
+        contains note id
+
+    Return
+    ------
+        Note: Note data class
+           contain note details
+    """
+    check_valid_uuid(note_id)
+
+    notes = note_queryset().using(
+        await sync_to_async(sharding.note_database)(note_id)
+    )
+
+    note = await notes.filter(id=note_id).afirst()
+
+    if not note:
+        raise exceptions.NotFound("Note Does not exist")
+
+    return NoteDataClass.from_instance(note)
+
+
+async def aget_user_note_row(note_id: str, fields: "NoteFieldSet") -> tuple:
+    """Async get_user_note_row"""
+    check_valid_uuid(note_id)
+
+    rows = await afetch_note_rows(
+        models.Note.objects.filter(id=note_id), fields.columns, 1
+    )
+
+    if not rows:
+        raise exceptions.NotFound("Note Does not exist")
+
+    return rows[0]
+
+
+async def aget_user_notes_version(user: "User") -> tuple[int, datetime.datetime]:
+    """Async get_user_notes_version"""
+    version = await (
+        sharding.notes(user.id)
+        .filter(user=user)
+        .aaggregate(count=Count("id"), last_updated=Max("updated_at"))
+    )
+
+    return version["count"], version["last_updated"]
+
+
+async def aget_note_version(note_id: str) -> tuple:
+    """Async get_note_version"""
+    check_valid_uuid(note_id)
+
+    rows = await afetch_note_rows(
+        models.Note.objects.filter(id=note_id), NOTE_VERSION_COLUMNS, 1
+    )
+
+    return rows[0] if rows else None
+
+
+async def astream_notes_csv() -> AsyncIterator[str]:
+    """Generate the csv export of all notes line by line
+
+    Chunks are read with the async ORM, the event loop is free while the db
+    and the client are slow.
+
+    Return
+    ------
+        Async iterator of csv lines
+    """
+    writer = csv.writer(_Echo())
+
+    yield writer.writerow(CSV_HEADER)
+
+    last_key = None
+
+    while True:
+        rows = await afetch_note_rows(
+            _export_chunk(last_key),
+            ("created_at", "id", *CSV_COLUMNS),
+            settings.NOTE_EXPORT_CHUNK_SIZE,
+            EXPORT_ORDERING,
+        )
+
+        for row in rows:
+            yield writer.writerow(_csv_row(row[2:]))
+
+        if len(rows) < settings.NOTE_EXPORT_CHUNK_SIZE:
+            return
+
+        last_key = list(rows[-1][:2])
+
+
+async def _aget_user_export_job(user: "User", job_id: str) -> "ExportJob":
+    check_valid_uuid(job_id)
+
+    job = await models.ExportJob.objects.filter(id=job_id).afirst()
+
+    if not job:
+        raise exceptions.NotFound("Export does not exist")
+
+    if job.user_id != user.id:
+        raise exceptions.PermissionDenied("Unauthorized")
+
+    return job
+
+
+async def aget_export_job(user: "User", job_id: str) -> "ExportJobDataClass":
+    """Async get_export_job"""
+    return ExportJobDataClass.from_instance(
+        await _aget_user_export_job(user, job_id)
+    )
+
+
+async def aopen_export_file(user: "User", job_id: str) -> "File":
+    """Async open_export_file"""
+    job = await _aget_user_export_job(user, job_id)
+
+    if job.status != models.ExportJob.STATUS_DONE:
+        raise exceptions.NotFound("Export is not ready")
+
+    return export_storage().open(job.file_name, "rb")
+
+
+def get_html_template(context):
+    """Creates html templte
+
+    Parameter
+    ----------
+    context : dict
+        Details of variables needed in the html
+
+    Return
+    ------
+     html structured tags created: str
+    """
+    return get_template("notes.html").render(context)
+
+
+def send_email(html_template: str, email_data: dict) -> None:
+    """Queue a mail to user email address, sent by the outbox dispatcher
+
+    Parameters
+    ----------
+    html_template : str
+        Contains email  body (html)
+
+    data: dict
+        Contains email subject, and to (reciever)
+    """
+
+    outbox.queue_email(
+        subject=email_data.get("subject"),
+        html_body=html_template,
+        to=email_data.get("to"),
+    )
@@ -0,0 +1,465 @@
+"""Horizontal sharding of the notes by owner.
+
+Every alias of NOTE_SHARDS (DATABASES entries named shard_N) holds a
+note_note table, the other tables stay on the default database. The shard of
+a user is recorded in the NoteShard directory on default:
+
+- a user's first note write places them on the consistent-hash ring, so
+  adding a shard only moves about 1/N of the users;
+- users without a directory row read from default, where notes written
+  before sharding was enabled stay until rebalance_note_shards moves them.
+
+NoteShardRouter sends note queries carrying the owner (notes(user_id)) and
+saves and deletes of note instances to the owner's shard. Reads of several
+users' notes (the lists of all notes, exports) run on every note database and
+are merged by gather(). Owner columns cannot be joined on a shard, they are
+read from the users table by the services instead.
+
+Without shards every function here is a no-op and the note queries are
+routed as before, to default or its read replicas.
+"""
+
+import bisect
+import contextlib
+import functools
+import hashlib
+import operator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import models
+
+
+# Attempts of a note write whose user was moved while it waited for its lock
+MOVED_WRITE_ATTEMPTS = 3
+
+
+class ShardMoved(Exception):
+    """The shard of a user changed between the lookup and the lock of a write"""
+
+
+def retry_moved(function):
+    """Run a note write again when the shard of its user moved under it
+
+    The write rolled back, the next attempt looks the shard up again.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, MOVED_WRITE_ATTEMPTS + 1):
+            try:
+                return function(*args, **kwargs)
+
+            except ShardMoved:
+                if attempt == MOVED_WRITE_ATTEMPTS:
+                    raise
+
+    return wrapper
+
+
+def is_enabled() -> bool:
+    return bool(settings.NOTE_SHARDS)
+
+
+def note_databases() -> list[str]:
+    """Every database that may hold notes, default first"""
+    return [DEFAULT_DB_ALIAS, *settings.NOTE_SHARDS]
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+@functools.lru_cache(maxsize=8)
+def _ring(shards: tuple, vnodes: int) -> tuple[list, list]:
+    # NOTE_SHARD_VNODES points per shard evens out the share of every shard
+    points = sorted(
+        (_point(f"{alias}#{index}"), alias)
+        for alias in shards
+        for index in range(vnodes)
+    )
+
+    return [point for point, _ in points], [alias for _, alias in points]
+
+
+def ring_shard(user_id) -> str:
+    """Shard of a user on the consistent-hash ring of NOTE_SHARDS
+
+    Parameters
+    ----------
+    user_id : str
+        The note owner
+
+    Return
+    ------
+     alias: str
+    """
+    points, aliases = _ring(tuple(settings.NOTE_SHARDS), settings.NOTE_SHARD_VNODES)
+
+    return aliases[bisect.bisect(points, _point(str(user_id))) % len(points)]
+
+
+def shard_for_user(user_id) -> str:
+    """Database holding the notes of a user
+
+    Parameters
+    ----------
+    user_id : str
+        The note owner
+
+    Return
+    ------
+     alias: str, default when sharding is off or the user has no shard yet
+    """
+    if not is_enabled():
+        return DEFAULT_DB_ALIAS
+
+    # Always the primary, a lagging replica would point at a stale shard
+    alias = (
+        models.NoteShard.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id)
+        .values_list("alias", flat=True)
+        .first()
+    )
+
+    return alias or DEFAULT_DB_ALIAS
+
+
+def assign_shard(user_id) -> str:
+    """Database new notes of a user go to, placing the user on first write
+
+    Parameters
+    ----------
+    user_id : str
+        The note owner
+
+    Return
+    ------
+     alias: str
+    """
+    if not is_enabled():
+        return DEFAULT_DB_ALIAS
+
+    alias = (
+        models.NoteShard.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id)
+        .values_list("alias", flat=True)
+        .first()
+    )
+
+    if alias:
+        return alias
+
+    # Notes from before sharding stay together on default until rebalanced
+    if (
+        models.Note.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id)
+        .exists()
+    ):
+        alias = DEFAULT_DB_ALIAS
+    else:
+        alias = ring_shard(user_id)
+
+    shard, _ = models.NoteShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        user_id=user_id, defaults={"alias": alias}
+    )
+
+    return shard.alias
+
+
+def notes(user_id=None):
+    """Note queryset routed to the shard of user_id
+
+    Without an owner the queryset is routed like any other model, use
+    gather() to read it from every shard.
+    """
+    if user_id is None:
+        return models.Note.objects.all()
+
+    return models.Note.objects.db_manager(hints={"user_id": user_id}).all()
+
+
+def atomic(alias: str):
+    """Transaction on the notes database and on default (counters, caches)
+
+    Default commits after the shard. The counter row of the writer stays
+    locked until then, so a change sequence read from it is on committed
+    notes, and the on_commit cache bumps run once the notes are visible. A
+    failure in between leaves the notes ahead of the counters until
+    reconcile_note_stats runs.
+    """
+    if alias == DEFAULT_DB_ALIAS:
+        return transaction.atomic()
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(transaction.atomic())
+    stack.enter_context(transaction.atomic(using=alias))
+
+    return stack
+
+
+def gather(queryset, ordering: list[tuple] = ()) -> list:
+    """Rows of a sliced values_list query, read from every note database
+
+    Each database returns at most the slice, the merged rows are sorted and
+    cut to it again. Queries with an owner run on the owner's shard only.
+
+    Parameters
+    ----------
+    queryset : QuerySet
+        Sliced values_list query
+
+    ordering : list[tuple]
+        (index in the row, descending) pairs of its ORDER BY
+
+    Return
+    ------
+     rows: list
+    """
+    if not is_enabled() or "user_id" in queryset._hints:
+        return list(queryset)
+
+    rows = []
+
+    for alias in note_databases():
+        rows.extend(queryset.using(alias))
+
+    # Stable sorts, least significant key first
+    for index, descending in reversed(ordering):
+        rows.sort(key=operator.itemgetter(index), reverse=descending)
+
+    query = queryset.query
+
+    if query.high_mark is not None:
+        rows = rows[: query.high_mark - query.low_mark]
+
+    return rows
+
+
+def note_database(note_id):
+    """Database holding a note, found by asking every note database
+
+    Return
+    ------
+     alias: str, None when sharding is off (routed as usual)
+    """
+    if not is_enabled():
+        return None
+
+    for alias in note_databases():
+        if models.Note.objects.using(alias).filter(id=note_id).exists():
+            return alias
+
+    return DEFAULT_DB_ALIAS
+
+
+def foreign_note_ids(note_ids: list, user_id) -> set:
+    """Ids of notes stored on another database than the shard of user_id
+
+    They belong to other users. Always empty when sharding is off, every note
+    is on one database then.
+    """
+    if not is_enabled() or not note_ids:
+        return set()
+
+    own = shard_for_user(user_id)
+    found = set()
+
+    for alias in note_databases():
+        if alias != own:
+            found.update(
+                models.Note.objects.using(alias)
+                .filter(id__in=note_ids)
+                .values_list("id", flat=True)
+            )
+
+    return found
+
+
+def delete_user_notes(user_id) -> None:
+    """Delete the notes of a user from their shard, before the user goes"""
+    alias = shard_for_user(user_id)
+
+    # Notes on default go with the cascade of the user delete
+    if alias != DEFAULT_DB_ALIAS:
+        models.Note.objects.using(alias).filter(user_id=user_id).delete()
+
+
+###### Rebalancing ########
+
+
+def misplaced_users() -> list[tuple]:
+    """Users whose notes are not on their ring shard
+
+    Return
+    ------
+     (user id, current alias, ring alias): list of tuples
+    """
+    moves = []
+    placed = set()
+
+    for user_id, alias in models.NoteShard.objects.using(
+        DEFAULT_DB_ALIAS
+    ).values_list("user_id", "alias"):
+        placed.add(user_id)
+
+        if alias != ring_shard(user_id):
+            moves.append((user_id, alias, ring_shard(user_id)))
+
+    # Notes written before sharding was enabled
+    unplaced = (
+        models.Note.objects.using(DEFAULT_DB_ALIAS)
+        .order_by()
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+
+    for user_id in unplaced:
+        if user_id not in placed:
+            moves.append((user_id, DEFAULT_DB_ALIAS, ring_shard(user_id)))
+
+    return moves
+
+
+def _copy_notes(notes: list, target: str) -> None:
+    with transaction.atomic(using=target):
+        for note in notes:
+            # Raw, created_at and updated_at are kept as stored
+            note.save_base(raw=True, force_insert=True, using=target)
+
+
+def move_user(user_id, target: str, batch_size: int) -> int:
+    """Move the notes of a user to another database
+
+    Notes are copied in batches while the user keeps writing to the source.
+    A last pass, holding the user's NoteStats row lock that note writes take
+    first, copies what changed meanwhile and switches the directory. Then the
+    source rows are deleted in batches.
+
+    Parameters
+    ----------
+    user_id : str
+        The note owner
+
+    target : str
+        Database alias the notes move to
+
+    batch_size : int
+        Notes copied or deleted per statement
+
+    Return
+    ------
+     number of notes moved: int
+    """
+    source = shard_for_user(user_id)
+
+    if source == target:
+        return 0
+
+    # Leftovers of an interrupted move, the directory still says source
+    models.Note.objects.using(target).filter(user_id=user_id).delete()
+
+    last_id = None
+
+    while True:
+        batch = models.Note.objects.using(source).filter(user_id=user_id)
+
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+
+        batch = list(batch.order_by("id")[:batch_size])
+
+        if batch:
+            _copy_notes(batch, target)
+            last_id = batch[-1].id
+
+        if len(batch) < batch_size:
+            break
+
+    # Imported here, the services import this module
+    from . import services
+
+    # Commits target, then the directory, then releases the source locks
+    with transaction.atomic(using=source), transaction.atomic(), transaction.atomic(
+        using=target
+    ):
+        # The counter row every note write of the user locks first. Writes
+        # that looked up the source wait here, then find the new shard
+        services.rebuild_note_stats(user_id)
+
+        current = dict(
+            models.Note.objects.using(source)
+            .select_for_update()
+            .filter(user_id=user_id)
+            .values_list("id", "updated_at")
+        )
+
+        copied = dict(
+            models.Note.objects.using(target)
+            .filter(user_id=user_id)
+            .values_list("id", "updated_at")
+        )
+
+        stale = [
+            note_id
+            for note_id, updated_at in copied.items()
+            if current.get(note_id) != updated_at
+        ]
+        changed = [
+            note_id
+            for note_id, updated_at in current.items()
+            if copied.get(note_id) != updated_at
+        ]
+
+        models.Note.objects.using(target).filter(id__in=stale).delete()
+        _copy_notes(
+            list(models.Note.objects.using(source).filter(id__in=changed)), target
+        )
+
+        models.NoteShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            user_id=user_id, defaults={"alias": target}
+        )
+
+    note_ids = list(current)
+
+    for start in range(0, len(note_ids), batch_size):
+        models.Note.objects.using(source).filter(
+            id__in=note_ids[start : start + batch_size]
+        ).delete()
+
+    return len(note_ids)
+
+
+class NoteShardRouter:
+    """Routes notes to the shard of their owner, other models fall through"""
+
+    def _shard(self, model, hints):
+        if model is not models.Note or not is_enabled():
+            return None
+
+        instance = hints.get("instance")
+
+        if isinstance(instance, models.Note):
+            if instance._state.adding:
+                return shard_for_user(instance.user_id)
+
+            return instance._state.db
+
+        if "user_id" in hints:
+            return shard_for_user(hints["user_id"])
+
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards only hold notes
+        if db in settings.NOTE_SHARDS:
+            return app_label == "note" and model_name == "note"
+
+        return None
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import models, services, sharding
+
+
+@receiver(post_save, sender=models.Note)
+@receiver(post_delete, sender=models.Note)
+def invalidate_note_lists(sender, instance, **kwargs):
+    # Any write through the ORM (services, admin, shell) drops the cached lists
+    services.notes_changed(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_owner_note_lists(sender, instance, created, **kwargs):
+    # Notes embed their owner, a renamed user changes the payloads too
+    if not created:
+        services.notes_changed(instance.id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_note_stats(sender, instance, created, **kwargs):
+    # Counters start at zero, so note writes only ever update them
+    if created:
+        models.NoteStats.objects.create(user=instance)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def delete_sharded_notes(sender, instance, **kwargs):
+    # The cascade only reaches notes on the users database
+    sharding.delete_user_notes(instance.id)
@@ -5,11 +5,22 @@ from . import views as apis
 urlpatterns = [
     path("create/", apis.NoteApi.as_view(), name="create note"),
     path("", apis.NotesApi.as_view(), name="all notes"),
+    path("bulk/", apis.NoteBulkApi.as_view(), name="bulk notes"),
+    path("search/", apis.SearchNoteApi.as_view(), name="search notes"),
+    path("stats/", apis.NoteStatsApi.as_view(), name="note stats"),
+    path("changes/", apis.NoteChangesApi.as_view(), name="note changes"),
     path("unfinished/", apis.UnfinishedNoteApi.as_view(), name="unfinished"),
     path("finished/", apis.FinishedNoteApi.as_view(), name="finished"),
     path("overdue/", apis.OverDueNoteApi.as_view(), name="overdue"),
     path("generate-csv/", apis.GenerateCSVApi.as_view(), name="Generate csv"),
     path("generate-pdf/", apis.GeneratePDFApi.as_view(), name="Generate pdf"),
+    path("exports/pdf/", apis.ExportPDFJobApi.as_view(), name="export pdf"),
+    path("exports/<str:job_id>/", apis.ExportJobApi.as_view(), name="export job"),
+    path(
+        "exports/<str:job_id>/download/",
+        apis.ExportJobDownloadApi.as_view(),
+        name="export download",
+    ),
     path("mail-notes/", apis.SendNotesToMail.as_view(), name="mail notes"),
     path(
         "order-duedate/<str:order_arg>/",
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.shortcuts import render
+from django.utils import timezone
 from rest_framework import response, status, exceptions, views, status as rest_status
 from users import permission, authentication as user_auth
 from . import serializers as note_serializer
@@ -8,21 +10,78 @@ from . import models
 
 
 # For Http response Typing
-from django.http import HttpResponse
-import csv
-
-#  covert html to pdf
-from django.template.loader import get_template, render_to_string
-from xhtml2pdf import pisa
-from io import BytesIO
-
-# Async
-import asyncio
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 
 
 # For api docs
 from drf_spectacular.utils import extend_schema
 
+# Conditional get
+import hashlib
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+
+def user_notes_etag(request, *args, **kwargs):
+    """Strong ETag of the user notes page, from the per user change marker"""
+    version = services.get_user_notes_version(request.user)
+
+    return user_notes_version_etag(request, version)
+
+
+def user_notes_version_etag(request, version: tuple) -> str:
+    """ETag of the user notes page for a (count, last updated) marker"""
+    count, last_updated = version
+
+    user = request.user
+
+    marker = ":".join(
+        str(part)
+        for part in (
+            user.id,
+            user.first_name,
+            user.last_name,
+            user.email,
+            user.is_email_verified,
+            count,
+            last_updated.isoformat() if last_updated else "",
+            request.GET.urlencode(),
+        )
+    )
+
+    return hashlib.sha1(marker.encode()).hexdigest()
+
+
+def _note_version(request, note_id):
+    # Shared by the ETag and Last-Modified callbacks, one query per request
+    if not hasattr(request, "note_version"):
+        request.note_version = services.get_note_version(note_id)
+
+    return request.note_version
+
+
+def note_etag(request, note_id, *args, **kwargs):
+    """Strong ETag of a single note, None when it does not exist"""
+    return note_version_etag(
+        note_id, _note_version(request, note_id), request.GET.urlencode()
+    )
+
+
+def note_version_etag(note_id: str, version: tuple, query: str = "") -> str:
+    """ETag of a single note for its change marker and the fields asked for"""
+    if version is None:
+        return None
+
+    marker = ":".join(str(part) for part in (note_id, *version, query))
+
+    return hashlib.sha1(marker.encode()).hexdigest()
+
+
+def note_last_modified(request, note_id, *args, **kwargs):
+    version = _note_version(request, note_id)
+
+    return version[0] if version else None
+
 
 # Create and Get user notes
 class NoteApi(views.APIView):
@@ -42,12 +101,27 @@ class NoteApi(views.APIView):
 
         return response.Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
+    @method_decorator(condition(etag_func=user_notes_etag))
     def get(self, request):
-        user_note_collection = services.get_user_notes(request.user)
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        serializer = note_serializer.NoteSeralizer(user_note_collection, many=True)
+        def build():
+            user_note_page = services.get_user_notes(
+                request.user, **params.validated_data
+            )
 
-        return response.Response(data=serializer.data, status=status.HTTP_200_OK)
+            return note_serializer.NotePageSerializer(user_note_page).data
+
+        data = services.get_cached_payload(
+            "user_notes", params.validated_data, build, user=request.user
+        )
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
 
 
 # Get all notes
@@ -55,19 +129,113 @@ class NotesApi(views.APIView):
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.NoteQueryParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
     def get(self, request):
-        note_collection = services.get_notes()
+        params = note_serializer.NoteQueryParamsSerializer(
+            data=request.query_params
+        )
+        params.is_valid(raise_exception=True)
 
-        serializer = note_serializer.NoteSeralizer(note_collection, many=True)
+        def build():
+            note_page = services.query_notes(**params.validated_data)
+
+            return note_serializer.NotePageSerializer(note_page).data
+
+        data = services.get_cached_payload("notes", params.validated_data, build)
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
 
-        return response.Response(data=serializer.data, status=status.HTTP_200_OK)
+
+class NoteBulkApi(views.APIView):
+    """Create, update and delete many notes in one request
+
+    Return
+    ------
+     per item results: list, in request order
+    """
+
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    @extend_schema(
+        request=note_serializer.NoteSeralizer(many=True),
+        responses=note_serializer.BulkResultSerializer(many=True),
+    )
+    def post(self, request):
+        serializer = note_serializer.NoteSeralizer(
+            data=request.data, many=True, max_length=settings.NOTE_BULK_MAX_SIZE
+        )
+        serializer.is_valid(raise_exception=True)
+
+        results = services.bulk_create_notes(request.user, serializer.validated_data)
+
+        result_serializer = note_serializer.BulkResultSerializer(results, many=True)
+
+        return response.Response(
+            data=result_serializer.data, status=status.HTTP_201_CREATED
+        )
+
+    @extend_schema(
+        request=note_serializer.NoteBulkUpdateSerializer(many=True),
+        responses=note_serializer.BulkResultSerializer(many=True),
+    )
+    def put(self, request):
+        serializer = note_serializer.NoteBulkUpdateSerializer(
+            data=request.data, many=True, max_length=settings.NOTE_BULK_MAX_SIZE
+        )
+        serializer.is_valid(raise_exception=True)
+
+        results = services.bulk_update_notes(request.user, serializer.validated_data)
+
+        result_serializer = note_serializer.BulkResultSerializer(results, many=True)
+
+        return response.Response(data=result_serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        request=note_serializer.NoteBulkDeleteSerializer(),
+        responses=note_serializer.BulkResultSerializer(many=True),
+    )
+    def delete(self, request):
+        serializer = note_serializer.NoteBulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = services.bulk_delete_notes(
+            request.user, serializer.validated_data["ids"]
+        )
+
+        result_serializer = note_serializer.BulkResultSerializer(results, many=True)
+
+        return response.Response(data=result_serializer.data, status=status.HTTP_200_OK)
 
 
 class NoteRetreiveUpdateDelete(views.APIView):
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.NoteFieldsParamsSerializer],
+        responses=note_serializer.NoteSeralizer,
+    )
+    @method_decorator(
+        condition(etag_func=note_etag, last_modified_func=note_last_modified)
+    )
     def get(self, request, note_id):
+        params = note_serializer.NoteFieldsParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        fields = params.validated_data["fields"]
+
+        if fields is not None:
+            # Sparse fieldset, only the picked columns are read
+            row = services.get_user_note_row(note_id, fields)
+
+            data = note_serializer.note_row_to_representation(row, fields)
+
+            return response.Response(data=data, status=status.HTTP_200_OK)
+
         # Retreive note with id equal note_id
         note = services.get_user_note(note_id)
 
@@ -99,42 +267,153 @@ class NoteRetreiveUpdateDelete(views.APIView):
         return response.Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
-class UnfinishedNoteApi(views.APIView):
+class SearchNoteApi(views.APIView):
+    """Full-text search over the user notes, best matches first
+
+    Parameter
+    ----------
+    q : str
+        Words to look for in note title and content
+
+    Return
+    ------
+     matching notes: page of notes
+    """
+
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.SearchParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
     def get(self, request):
-        notes = services.get_unfinished_note()
+        params = note_serializer.SearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        notes = services.search_user_notes(request.user, **params.validated_data)
 
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
+        serializer = note_serializer.NotePageSerializer(notes)
 
         return response.Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
-class FinishedNoteApi(views.APIView):
+class NoteChangesApi(views.APIView):
+    """Delta sync, the notes created, updated and deleted after a cursor
+
+    Parameter
+    ----------
+    since : str
+        since of the previous response, every note when absent
+
+    Return
+    ------
+     changes: notes written, ids deleted, since of the next sync and has_more
+    """
+
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.NoteChangesParamsSerializer],
+        responses=note_serializer.NoteChangesSerializer,
+    )
     def get(self, request):
-        notes = services.get_finished_note()
+        params = note_serializer.NoteChangesParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
+        changes = services.get_note_changes(request.user, **params.validated_data)
+
+        serializer = note_serializer.NoteChangesSerializer(changes)
 
         return response.Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
-class OverDueNoteApi(views.APIView):
+class NoteStatsApi(views.APIView):
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(responses=note_serializer.NoteStatsSerializer)
     def get(self, request):
-        notes = services.get_overdue_note()
+        stats = services.get_note_stats(request.user)
 
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
+        serializer = note_serializer.NoteStatsSerializer(stats)
 
         return response.Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
+class UnfinishedNoteApi(views.APIView):
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
+    def get(self, request):
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        def build():
+            notes = services.get_unfinished_note(**params.validated_data)
+
+            return note_serializer.NotePageSerializer(notes).data
+
+        data = services.get_cached_payload("unfinished", params.validated_data, build)
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+
+class FinishedNoteApi(views.APIView):
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
+    def get(self, request):
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        def build():
+            notes = services.get_finished_note(**params.validated_data)
+
+            return note_serializer.NotePageSerializer(notes).data
+
+        data = services.get_cached_payload("finished", params.validated_data, build)
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+
+class OverDueNoteApi(views.APIView):
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
+    def get(self, request):
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        def build():
+            notes = services.get_overdue_note(**params.validated_data)
+
+            return note_serializer.NotePageSerializer(notes).data
+
+        # Notes turn overdue as time passes, cache per minute
+        cache_params = {
+            **params.validated_data,
+            "minute": timezone.now().strftime("%Y%m%d%H%M"),
+        }
+
+        data = services.get_cached_payload("overdue", cache_params, build)
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+
 class OrderNoteDueDateApi(views.APIView):
     """Order note due date in ascending and descending
 
@@ -148,18 +427,30 @@ class OrderNoteDueDateApi(views.APIView):
 
     Return
     ------
-     ordered notes: list
+     ordered notes: page of notes
     """
 
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
     def get(self, request, order_arg):
-        notes = services.get_order_by_due_date_note(order_arg)
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
+        def build():
+            notes = services.get_order_by_due_date_note(order_arg, **params.validated_data)
 
-        return response.Response(data=serializer.data, status=status.HTTP_200_OK)
+            return note_serializer.NotePageSerializer(notes).data
+
+        data = services.get_cached_payload(
+            "order_due_date", {**params.validated_data, "order_arg": order_arg}, build
+        )
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
 
 
 class OrderNotePriorityApi(views.APIView):
@@ -175,18 +466,30 @@ class OrderNotePriorityApi(views.APIView):
 
     Return
     ------
-     ordered notes: list
+     ordered notes: page of notes
     """
 
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
     def get(self, request, order_arg):
-        notes = services.get_order_by_priority_note(order_arg)
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
+        def build():
+            notes = services.get_order_by_priority_note(order_arg, **params.validated_data)
 
-        return response.Response(data=serializer.data, status=status.HTTP_200_OK)
+            return note_serializer.NotePageSerializer(notes).data
+
+        data = services.get_cached_payload(
+            "order_priority", {**params.validated_data, "order_arg": order_arg}, build
+        )
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
 
 
 class OrderNoteCreatedAtApi(views.APIView):
@@ -202,18 +505,30 @@ class OrderNoteCreatedAtApi(views.APIView):
 
     Return
     ------
-    ordered notes: list
+    ordered notes: page of notes
     """
 
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
 
+    @extend_schema(
+        parameters=[note_serializer.PageParamsSerializer],
+        responses=note_serializer.NotePageSerializer,
+    )
     def get(self, request, order_arg):
-        notes = services.get_order_by_created_at_note(order_arg)
+        params = note_serializer.PageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
+        def build():
+            notes = services.get_order_by_created_at_note(order_arg, **params.validated_data)
 
-        return response.Response(data=serializer.data, status=status.HTTP_200_OK)
+            return note_serializer.NotePageSerializer(notes).data
+
+        data = services.get_cached_payload(
+            "order_created_at", {**params.validated_data, "order_arg": order_arg}, build
+        )
+
+        return response.Response(data=data, status=status.HTTP_200_OK)
 
 
 class GenerateCSVApi(views.APIView):
@@ -222,51 +537,14 @@ class GenerateCSVApi(views.APIView):
 
     @extend_schema(responses=note_serializer.NoteSeralizer)
     def get(self, request):
-        notes = services.get_notes()
-
-        serializer = note_serializer.NoteSeralizer(notes, many=True)
-
-        response = HttpResponse(
-            content="text/csv",
+        # Stream rows from the db in chunks instead of building the whole file
+        response = StreamingHttpResponse(
+            services.stream_notes_csv(),
+            content_type="text/csv",
         )
 
         response["Content-Disposition"] = 'attachment; filename="notes.csv"'
 
-        writer = csv.writer(response)
-
-        writer.writerow(
-            [
-                "id",
-                "title",
-                "content",
-                "created_at",
-                "due_date",
-                "priority",
-                "is_complete",
-                "user_id",
-                "user_first_name",
-                "user_last_name",
-                "user_email",
-            ]
-        )
-
-        for note in serializer.data:
-            writer.writerow(
-                [
-                    note.get("id"),
-                    note.get("title"),
-                    note.get("content"),
-                    note.get("created_at"),
-                    note.get("due_date"),
-                    note.get("priority"),
-                    note.get("is_complete"),
-                    note.get("user").get("user_id"),
-                    note.get("user").get("first_name"),
-                    note.get("user").get("last_name"),
-                    note.get("user").get("email"),
-                ]
-            )
-
         return response
 
 
@@ -275,23 +553,10 @@ class GeneratePDFApi(views.APIView):
     permission_classes = (permission.CustomPermision,)
 
     def get(self, request):
-        context = services.generate_pdf_html()
-        html_template = get_template("notes.html")
-        html_rendered = html_template.render(context)
-
-        result = BytesIO()
-
-        pdf = pisa.pisaDocument(BytesIO(html_rendered.encode("ISO-8859-1")), result)
-
-        if pdf.err:
-            return HttpResponse(
-                "Invalid pdf",
-                status_code=status.HTTP_404_NOT_FOUND,
-                content_type="text/plain",
-            )
+        pdf = services.render_notes_pdf()
 
         response = HttpResponse(
-            result.getvalue(),
+            pdf,
             content_type="application/pdf",
         )
 
@@ -300,6 +565,54 @@ class GeneratePDFApi(views.APIView):
         return response
 
 
+class ExportPDFJobApi(views.APIView):
+    """Queue a pdf export rendered in the background
+
+    Return
+    ------
+     export job: json, poll exports/<id>/ until status is done
+    """
+
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    @extend_schema(request=None, responses=note_serializer.ExportJobSerializer)
+    def post(self, request):
+        job = services.create_export_job(request.user)
+
+        serializer = note_serializer.ExportJobSerializer(job)
+
+        return response.Response(data=serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class ExportJobApi(views.APIView):
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    @extend_schema(responses=note_serializer.ExportJobSerializer)
+    def get(self, request, job_id):
+        job = services.get_export_job(request.user, job_id)
+
+        serializer = note_serializer.ExportJobSerializer(job)
+
+        return response.Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+class ExportJobDownloadApi(views.APIView):
+    authentication_classes = (user_auth.CustomUserAuthentication,)
+    permission_classes = (permission.CustomPermision,)
+
+    def get(self, request, job_id):
+        export_file = services.open_export_file(request.user, job_id)
+
+        return FileResponse(
+            export_file,
+            as_attachment=True,
+            filename="notes.pdf",
+            content_type="application/pdf",
+        )
+
+
 class SendNotesToMail(views.APIView):
     authentication_classes = (user_auth.CustomUserAuthentication,)
     permission_classes = (permission.CustomPermision,)
@@ -307,8 +620,7 @@ class SendNotesToMail(views.APIView):
     def post(self, request):
         context = services.generate_pdf_html()
 
-        # To make email html template creation  async
-        html_template = asyncio.run(services.get_html_template(context))
+        html_template = services.get_html_template(context)
 
         email_data = {
             "subject": "List of all Note",
@@ -2,20 +2,81 @@ import pytest
 
 from note import services
 
-from users import services as user_services
+from users import authentication as user_auth, services as user_services
 
+from rest_framework.renderers import JSONRenderer
+from rest_framework import parsers as rest_parsers, renderers as rest_renderers
+from rest_framework import exceptions
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+from rest_framework.views import APIView
+
+from django.utils.translation import gettext_lazy
 from rest_framework.test import APIClient
 
-from note import models
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+
+from django.http import HttpResponse
+
+from django.test import AsyncClient, RequestFactory
+
+from note import benchmarks, jobs, models, search, serializers as note_serializer
+from note import sharding
+
+from drf import compression, middleware, profiling, renderers, routers
+
+import brotli
+
+import asyncio
+
+import dataclasses
 
 import datetime
 
+import json
+
+import collections
+
+import decimal
+
+import io
+
+import uuid
+
+import gzip
+
+import zlib
+
 import time
 
+import pstats
+
+import threading
+
+import os
+
+import subprocess
+
+import sys
+
 import pytz
 
+from django.contrib.auth import get_user_model
+
 from django.utils import timezone
 
+from django.conf import settings as django_settings
+
+from django.core.management import call_command
+
+from django.db import connection, connections, transaction
+
+from django.db.models import F
+
+from django.test.utils import CaptureQueriesContext
+
+from io import StringIO
+
 # initialize client
 client = APIClient()
 
@@ -57,7 +118,7 @@ def test_note_get_user_note(user, auth_client):
 
     note_response = auth_client.get("/api/notes/create/")
 
-    assert len(note_response.data) == 2
+    assert len(note_response.data["results"]) == 2
     assert note_response.status_code == 200
 
 
@@ -65,7 +126,7 @@ def test_note_get_user_note(user, auth_client):
 def test_note_all(user, auth_client, note):
     note_response = auth_client.get("/api/notes/")
 
-    assert len(note_response.data) == 1
+    assert len(note_response.data["results"]) == 1
     assert note_response.status_code == 200
 
 
@@ -77,6 +138,57 @@ def test_note_get_by_id(user, note, auth_client):
     assert note_response.status_code == 200
 
 
+@pytest.mark.django_db
+def test_note_user_notes_not_modified(user, note, auth_client):
+    first_response = auth_client.get("/api/notes/create/")
+
+    etag = first_response["ETag"]
+
+    with CaptureQueriesContext(connection) as queries:
+        cached_response = auth_client.get(
+            "/api/notes/create/", HTTP_IF_NONE_MATCH=etag
+        )
+
+    assert cached_response.status_code == 304
+    assert len(queries) == 1
+
+    auth_client.put(
+        f"/api/notes/note/{note.id}/",
+        {
+            "title": "Changed",
+            "content": "Changed",
+            "due_date": "2023-09-23T20:45:37.127325Z",
+            "is_complete": True,
+            "priority": 3,
+        },
+    )
+
+    changed_response = auth_client.get("/api/notes/create/", HTTP_IF_NONE_MATCH=etag)
+
+    assert changed_response.status_code == 200
+    assert changed_response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_note_get_by_id_not_modified(user, note, auth_client):
+    first_response = auth_client.get(f"/api/notes/note/{note.id}/")
+
+    assert first_response.has_header("Last-Modified")
+
+    etag_response = auth_client.get(
+        f"/api/notes/note/{note.id}/", HTTP_IF_NONE_MATCH=first_response["ETag"]
+    )
+
+    assert etag_response.status_code == 304
+
+    date_response = auth_client.get(
+        f"/api/notes/note/{note.id}/",
+        HTTP_IF_MODIFIED_SINCE=first_response["Last-Modified"],
+    )
+
+    assert date_response.status_code == 304
+
+
 @pytest.mark.django_db
 def test_note_get_by_id_400(user, note, auth_client):
     note_response = auth_client.get(f"/api/notes/note/33/")
@@ -114,6 +226,289 @@ def test_note_get_by_id_update(user, note, auth_client):
     assert note_response["priority"] == 3
 
 
+@pytest.mark.django_db
+def test_note_bulk_create(user, auth_client):
+    note_payload = [
+        {
+            "title": f"Bulk {index}",
+            "content": "Created in bulk",
+            "due_date": "2023-09-23T20:45:37.127325Z",
+            "is_complete": False,
+            "priority": 3,
+        }
+        for index in range(3)
+    ]
+
+    note_response = auth_client.post("/api/notes/bulk/", note_payload, format="json")
+
+    assert note_response.status_code == 201
+    assert [item["status"] for item in note_response.data] == ["created"] * 3
+    assert note_response.data[0]["note"]["title"] == "Bulk 0"
+    assert models.Note.objects.filter(user_id=user.id).count() == 3
+
+
+@pytest.mark.django_db
+def test_note_bulk_update(user, note, auth_client):
+    missing_id = "2f3b9d2e-8d3c-4f0e-9e38-0d7e5e1f6a11"
+
+    with CaptureQueriesContext(connection) as queries:
+        note_response = auth_client.put(
+            "/api/notes/bulk/",
+            [
+                {
+                    "id": str(note.id),
+                    "title": "Bulk updated",
+                    "content": "Updated in bulk",
+                    "due_date": "2023-09-23T20:45:37.127325Z",
+                    "is_complete": True,
+                    "priority": 5,
+                },
+                {
+                    "id": missing_id,
+                    "title": "Missing",
+                    "content": "Missing",
+                    "due_date": "2023-09-23T20:45:37.127325Z",
+                    "is_complete": True,
+                    "priority": 5,
+                },
+            ],
+            format="json",
+        )
+
+    assert note_response.status_code == 200
+    assert note_response.data[0]["status"] == "updated"
+    assert note_response.data[0]["note"]["title"] == "Bulk updated"
+    assert note_response.data[1]["status"] == "not_found"
+    assert models.Note.objects.get(id=note.id).priority == 5
+    # The change sequence numbers taken are read back, one query per write
+    assert len(queries) <= 7
+
+
+@pytest.mark.django_db
+def test_note_bulk_delete(user, note, auth_client):
+    other_user = user_services.create_user(
+        user_services.UserDataClass(
+            first_name="Other",
+            last_name="User",
+            email="other@example.com",
+            password="password",
+        )
+    )
+
+    other_note = models.Note.objects.create(
+        title="Not mine",
+        content="Owned by someone else",
+        due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+        priority=3,
+        user_id=other_user.id,
+    )
+
+    note_response = auth_client.delete(
+        "/api/notes/bulk/",
+        {"ids": [str(note.id), str(other_note.id)]},
+        format="json",
+    )
+
+    assert note_response.status_code == 200
+    assert [item["status"] for item in note_response.data] == [
+        "deleted",
+        "forbidden",
+    ]
+    assert not models.Note.objects.filter(id=note.id).exists()
+    assert models.Note.objects.filter(id=other_note.id).exists()
+
+
+@pytest.mark.django_db
+def test_note_search(user, auth_client):
+    for title, content in [
+        ("Deploy api", "Deploy the api to aws, then deploy the docs"),
+        ("Groceries", "Milk and bread"),
+        ("Deploy docs", "Publish swagger"),
+    ]:
+        models.Note.objects.create(
+            title=title,
+            content=content,
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            priority=3,
+            user_id=user.id,
+        )
+
+    note_response = auth_client.get("/api/notes/search/", {"q": "deploy"})
+
+    assert note_response.status_code == 200
+    assert [note["title"] for note in note_response.data["results"]] == [
+        "Deploy api",
+        "Deploy docs",
+    ]
+
+    first_page = auth_client.get("/api/notes/search/", {"q": "deploy", "limit": 1})
+    second_page = auth_client.get(
+        "/api/notes/search/",
+        {"q": "deploy", "limit": 1, "cursor": first_page.data["next"]},
+    )
+
+    assert first_page.data["results"][0]["title"] == "Deploy api"
+    assert second_page.data["results"][0]["title"] == "Deploy docs"
+    assert second_page.data["next"] is None
+
+
+@pytest.mark.django_db
+def test_note_search_only_walks_the_user_notes(user, auth_client):
+    other_user = user_services.create_user(
+        user_services.UserDataClass(
+            first_name="Other",
+            last_name="User",
+            email="other@example.com",
+            password="password",
+        )
+    )
+
+    for owner, title in [(user, "Deploy api"), (other_user, "Deploy docs")]:
+        models.Note.objects.create(
+            title=title,
+            content="Deploy it",
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            priority=3,
+            user_id=owner.id,
+        )
+
+    with CaptureQueriesContext(connection) as queries:
+        note_response = auth_client.get("/api/notes/search/", {"q": "deploy"})
+
+    assert [note["title"] for note in note_response.data["results"]] == ["Deploy api"]
+
+    # The owner is matched by the full-text index itself
+    if connection.vendor == "sqlite":
+        assert any(
+            "MATCH" in query["sql"] and user.id.hex in query["sql"]
+            for query in queries
+        )
+
+
+@pytest.mark.django_db
+def test_note_search_cursor_kinds(user, auth_client, monkeypatch):
+    for title in ("Deploy api", "Deploy docs"):
+        models.Note.objects.create(
+            title=title,
+            content="Deploy it",
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            priority=3,
+            user_id=user.id,
+        )
+
+    ranked = auth_client.get("/api/notes/search/", {"q": "deploy", "limit": 1})
+
+    # The index went away between two pages, scanned instead
+    monkeypatch.setattr(search, "is_available", lambda using="default": False)
+
+    scanned = auth_client.get("/api/notes/search/", {"q": "deploy", "limit": 1})
+    next_scanned = auth_client.get(
+        "/api/notes/search/",
+        {"q": "deploy", "limit": 1, "cursor": scanned.data["next"]},
+    )
+
+    assert [
+        note["title"]
+        for note in [*scanned.data["results"], *next_scanned.data["results"]]
+    ] == ["Deploy api", "Deploy docs"]
+
+    mismatched = auth_client.get(
+        "/api/notes/search/",
+        {"q": "deploy", "limit": 1, "cursor": ranked.data["next"]},
+    )
+
+    assert mismatched.status_code == 400
+
+    monkeypatch.undo()
+
+    mismatched = auth_client.get(
+        "/api/notes/search/",
+        {"q": "deploy", "limit": 1, "cursor": scanned.data["next"]},
+    )
+
+    assert mismatched.status_code == 400
+
+
+@pytest.mark.django_db
+def test_note_search_without_index(user, note, auth_client, monkeypatch):
+    monkeypatch.setattr(search, "_available", {})
+
+    # A database the index was never installed on (SQLite DDL rolls back)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {search.FTS_TABLE}")
+
+    assert not search.is_available()
+
+    note_response = auth_client.get("/api/notes/search/", {"q": "bug"})
+
+    # Scanned instead of failing on the missing index
+    assert [result["id"] for result in note_response.data["results"]] == [
+        str(note.id)
+    ]
+
+    search.install_search_index()
+
+    with CaptureQueriesContext(connection) as queries:
+        assert search.is_available()
+
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_note_search_index_follows_writes(user, note, auth_client):
+    assert len(auth_client.get("/api/notes/search/", {"q": "bug"}).data["results"]) == 1
+
+    auth_client.put(
+        f"/api/notes/note/{note.id}/",
+        {
+            "title": "Release",
+            "content": "Ship version two",
+            "due_date": "2023-09-23T20:45:37.127325Z",
+            "is_complete": False,
+            "priority": 3,
+        },
+    )
+
+    assert auth_client.get("/api/notes/search/", {"q": "bug"}).data["results"] == []
+    assert len(auth_client.get("/api/notes/search/", {"q": "ship"}).data["results"]) == 1
+
+    auth_client.delete(f"/api/notes/note/{note.id}/")
+
+    assert auth_client.get("/api/notes/search/", {"q": "ship"}).data["results"] == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_note_search_survives_vacuum(user, auth_client):
+    notes = [
+        models.Note.objects.create(
+            title=title,
+            content=content,
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            priority=3,
+            user_id=user.id,
+        )
+        for title, content in [
+            ("Groceries", "Milk and bread"),
+            ("Deploy api", "Push the release"),
+            ("Gym", "Leg day"),
+        ]
+    ]
+
+    notes[0].delete()
+
+    # VACUUM may renumber the implicit rowids of note_note, done by hand too
+    # since recent SQLite versions mostly keep them
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM")
+            cursor.execute("UPDATE note_note SET rowid = -rowid")
+
+    for q, title in [("release", "Deploy api"), ("leg", "Gym"), ("milk", None)]:
+        results = auth_client.get("/api/notes/search/", {"q": q}).data["results"]
+
+        assert [note["title"] for note in results] == ([title] if title else [])
+
+
 @pytest.mark.django_db
 def test_note_unfinished(user, auth_client):
     instance = models.Note.objects.create(
@@ -136,7 +531,7 @@ def test_note_unfinished(user, auth_client):
 
     note_response = auth_client.get("/api/notes/unfinished/")
 
-    assert len(note_response.data) == 1
+    assert len(note_response.data["results"]) == 1
     assert note_response.status_code == 200
 
 
@@ -162,7 +557,7 @@ def test_note_finished(user, auth_client):
 
     note_response = auth_client.get("/api/notes/finished/")
 
-    assert len(note_response.data) == 2
+    assert len(note_response.data["results"]) == 2
     assert note_response.status_code == 200
 
 
@@ -188,9 +583,9 @@ def test_note_overdue(user, auth_client):
 
     note_response = auth_client.get("/api/notes/overdue/")
 
-    assert len(note_response.data) == 1
+    assert len(note_response.data["results"]) == 1
     assert note_response.status_code == 200
-    assert note_response.data[len(note_response.data) - 1]["title"] == "Hot Fix"
+    assert note_response.data["results"][-1]["title"] == "Hot Fix"
 
 
 @pytest.mark.django_db
@@ -215,7 +610,7 @@ def test_note_order_duedate_ascending(user, auth_client):
 
     note_response = auth_client.get("/api/notes/order-duedate/asc/")
 
-    assert note_response.data[0]["title"] == "Hot Fix"
+    assert note_response.data["results"][0]["title"] == "Hot Fix"
     assert note_response.status_code == 200
 
 
@@ -241,7 +636,7 @@ def test_note_order_duedate_descending(user, auth_client):
 
     note_response = auth_client.get("/api/notes/order-duedate/desc/")
 
-    assert note_response.data[0]["title"] == "Fix bug"
+    assert note_response.data["results"][0]["title"] == "Fix bug"
     assert note_response.status_code == 200
 
 
@@ -267,7 +662,7 @@ def test_note_order_priority_ascending(user, auth_client):
 
     note_response = auth_client.get("/api/notes/order-priority/asc/")
 
-    assert note_response.data[0]["title"] == "Hot Fix"
+    assert note_response.data["results"][0]["title"] == "Hot Fix"
     assert note_response.status_code == 200
 
 
@@ -293,7 +688,7 @@ def test_note_order_priority_descending(user, auth_client):
 
     note_response = auth_client.get("/api/notes/order-priority/desc/")
 
-    assert note_response.data[0]["title"] == "Fix bug"
+    assert note_response.data["results"][0]["title"] == "Fix bug"
     assert note_response.status_code == 200
 
 
@@ -322,7 +717,7 @@ def test_note_order_created_date_ascending(user, auth_client):
 
     note_response = auth_client.get("/api/notes/order-created-at/asc/")
 
-    assert note_response.data[0]["title"] == "Hot Fix"
+    assert note_response.data["results"][0]["title"] == "Hot Fix"
     assert note_response.status_code == 200
 
 
@@ -351,10 +746,85 @@ def test_note_order_created_date_descending(user, auth_client):
 
     note_response = auth_client.get("/api/notes/order-created-at/desc/")
 
-    assert note_response.data[0]["title"] == "Fix bug"
+    assert note_response.data["results"][0]["title"] == "Fix bug"
     assert note_response.status_code == 200
 
 
+@pytest.mark.django_db
+def test_note_pagination_next_and_previous(user, auth_client):
+    for priority in range(1, 6):
+        models.Note.objects.create(
+            title=f"Note {priority}",
+            content="Paged note",
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            is_complete=False,
+            priority=priority,
+            user_id=user.id,
+        )
+
+    first_page = auth_client.get("/api/notes/order-priority/desc/?limit=2").data
+
+    assert [note["priority"] for note in first_page["results"]] == [5, 4]
+    assert first_page["previous"] is None
+
+    second_page = auth_client.get(
+        "/api/notes/order-priority/desc/",
+        {"limit": 2, "cursor": first_page["next"]},
+    ).data
+
+    assert [note["priority"] for note in second_page["results"]] == [3, 2]
+
+    last_page = auth_client.get(
+        "/api/notes/order-priority/desc/",
+        {"limit": 2, "cursor": second_page["next"]},
+    ).data
+
+    assert [note["priority"] for note in last_page["results"]] == [1]
+    assert last_page["next"] is None
+
+    previous_page = auth_client.get(
+        "/api/notes/order-priority/desc/",
+        {"limit": 2, "cursor": last_page["previous"]},
+    ).data
+
+    assert [note["priority"] for note in previous_page["results"]] == [3, 2]
+
+
+@pytest.mark.django_db
+def test_note_pagination_ties_on_sort_key(user, auth_client):
+    for index in range(5):
+        models.Note.objects.create(
+            title=f"Note {index}",
+            content="Same priority",
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            is_complete=False,
+            priority=3,
+            user_id=user.id,
+        )
+
+    seen = []
+    params = {"limit": 2}
+
+    while True:
+        page = auth_client.get("/api/notes/order-priority/asc/", params).data
+        seen += [note["id"] for note in page["results"]]
+
+        if page["next"] is None:
+            break
+
+        params["cursor"] = page["next"]
+
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+
+@pytest.mark.django_db
+def test_note_pagination_invalid_cursor(user, auth_client):
+    note_response = auth_client.get("/api/notes/", {"cursor": "not-a-cursor"})
+
+    assert note_response.status_code == 400
+
+
 @pytest.mark.django_db
 def test_note_generate_csv(user, auth_client):
     instance = models.Note.objects.create(
@@ -371,6 +841,34 @@ def test_note_generate_csv(user, auth_client):
     assert note_response.status_code == 200
 
 
+@pytest.mark.django_db
+def test_note_generate_csv_streams_every_chunk(user, auth_client, settings):
+    settings.NOTE_EXPORT_CHUNK_SIZE = 2
+
+    for index in range(5):
+        models.Note.objects.create(
+            title=f"Note {index}",
+            content="Streamed",
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC),
+            is_complete=False,
+            priority=3,
+            user_id=user.id,
+        )
+
+    note_response = auth_client.get("/api/notes/generate-csv/")
+
+    assert note_response.streaming
+    assert note_response["Content-Type"] == "text/csv"
+
+    lines = b"".join(note_response.streaming_content).decode().splitlines()
+
+    assert lines[0].startswith("id,title,content,created_at,due_date")
+    assert len(lines) == 6
+    assert len({line.split(",")[0] for line in lines[1:]}) == 5
+    assert "2023-09-23T20:45:37.127325Z" in lines[1]
+    assert str(user.id) in lines[1]
+
+
 @pytest.mark.django_db
 def test_note_generate_pdf(user, auth_client):
     instance = models.Note.objects.create(
@@ -387,9 +885,1909 @@ def test_note_generate_pdf(user, auth_client):
     assert note_response.status_code == 200
 
 
+@pytest.mark.django_db
+def test_note_export_pdf_job(
+    user, note, auth_client, settings, tmp_path, django_capture_on_commit_callbacks
+):
+    settings.NOTE_EXPORT_RUN_INLINE = True
+    settings.NOTE_EXPORT_ROOT = str(tmp_path)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        submit_response = auth_client.post("/api/notes/exports/pdf/")
+
+    assert submit_response.status_code == 202
+    assert submit_response.data["status"] == "pending"
+
+    job_id = submit_response.data["id"]
+
+    status_response = auth_client.get(f"/api/notes/exports/{job_id}/")
+
+    assert status_response.status_code == 200
+    assert status_response.data["status"] == "done"
+
+    download_response = auth_client.get(f"/api/notes/exports/{job_id}/download/")
+
+    assert download_response.status_code == 200
+    assert download_response["Content-Type"] == "application/pdf"
+    assert b"".join(download_response.streaming_content).startswith(b"%PDF")
+
+
+@pytest.mark.django_db
+def test_note_export_job_takes_over_expired_claims(user, note, settings, tmp_path):
+    settings.NOTE_EXPORT_ROOT = str(tmp_path)
+
+    now = timezone.now()
+
+    # A worker died holding the first job, the second one is still worked on
+    abandoned, held = [
+        models.ExportJob.objects.create(
+            user_id=user.id,
+            status=models.ExportJob.STATUS_RUNNING,
+            claimed_until=now + datetime.timedelta(seconds=seconds),
+            claim_token=uuid.uuid4(),
+        )
+        for seconds in (-1, settings.NOTE_EXPORT_LEASE)
+    ]
+
+    assert jobs.claim_export_job(held.id) is None
+
+    output = StringIO()
+
+    call_command("run_export_jobs", stdout=output)
+
+    assert "Ran 1 export job(s)" in output.getvalue()
+
+    abandoned.refresh_from_db()
+    held.refresh_from_db()
+
+    assert abandoned.status == models.ExportJob.STATUS_DONE
+    assert abandoned.claim_token is None
+    assert held.status == models.ExportJob.STATUS_RUNNING
+
+
+@pytest.mark.django_db
+def test_note_export_pdf_job_not_ready(user, auth_client):
+    submit_response = auth_client.post("/api/notes/exports/pdf/")
+
+    job_id = submit_response.data["id"]
+
+    download_response = auth_client.get(f"/api/notes/exports/{job_id}/download/")
+
+    assert download_response.status_code == 404
+
+
 @pytest.mark.django_db
 def test_note_send_note_via_email(user, note, auth_client):
     note_response = auth_client.post("/api/notes/mail-notes/")
 
     assert note_response.data["message"] == "Note sent to mail Successfully!!"
     assert note_response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_note_queries_use_indexes():
+    output = StringIO()
+
+    call_command("explain_note_queries", verbosity=2, stdout=output)
+
+    assert "FULL SCAN" not in output.getvalue()
+    assert "queries checked" in output.getvalue()
+    assert "OK        get_user_note_row" in output.getvalue()
+    assert "OK        get_note_changes" in output.getvalue()
+    # The delta sync range scans of the notes and of the tombstones
+    assert 'FROM "note_notetombstone"' in output.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/api/notes/create/",
+        "/api/notes/",
+        "/api/notes/unfinished/",
+        "/api/notes/finished/",
+        "/api/notes/overdue/",
+        "/api/notes/order-duedate/asc/",
+        "/api/notes/order-priority/desc/",
+        "/api/notes/order-created-at/asc/",
+        "/api/notes/generate-csv/",
+        "/api/notes/generate-pdf/",
+    ],
+)
+def test_note_list_query_count_is_constant(user, auth_client, url):
+    def create_notes(count, is_complete):
+        for _ in range(count):
+            models.Note.objects.create(
+                title="Fix bug",
+                content="This is bug Fixed over here",
+                due_date=datetime.datetime(
+                    2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC
+                ),
+                is_complete=is_complete,
+                priority=3,
+                user_id=user.id,
+            )
+
+    create_notes(1, True)
+    create_notes(1, False)
+
+    # Warm the authenticated user cache
+    auth_client.get(url)
+
+    with CaptureQueriesContext(connection) as few_notes:
+        assert auth_client.get(url).status_code == 200
+
+    create_notes(5, True)
+    create_notes(5, False)
+
+    with CaptureQueriesContext(connection) as many_notes:
+        assert auth_client.get(url).status_code == 200
+
+    assert len(many_notes) == len(few_notes)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_note_list_served_from_cache(user, note, auth_client):
+    assert auth_client.get("/api/notes/").status_code == 200
+
+    with CaptureQueriesContext(connection) as cached:
+        note_response = auth_client.get("/api/notes/")
+
+    assert note_response.status_code == 200
+    assert len(note_response.data["results"]) == 1
+    assert not any("note_note" in query["sql"] for query in cached)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_note_list_cache_follows_writes(user, note, auth_client):
+    assert len(auth_client.get("/api/notes/").data["results"]) == 1
+    assert len(auth_client.get("/api/notes/create/").data["results"]) == 1
+
+    auth_client.post(
+        "/api/notes/create/",
+        {
+            "title": "Fix bug",
+            "content": "This is bug Fixed over here",
+            "due_date": datetime.datetime(
+                2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC
+            ),
+            "is_complete": False,
+            "priority": 3,
+        },
+        format="json",
+    )
+
+    assert len(auth_client.get("/api/notes/").data["results"]) == 2
+    assert len(auth_client.get("/api/notes/create/").data["results"]) == 2
+
+    auth_client.delete(f"/api/notes/note/{note.id}/")
+
+    assert len(auth_client.get("/api/notes/").data["results"]) == 1
+    assert len(auth_client.get("/api/notes/create/").data["results"]) == 1
+
+
+def async_get(auth_client, url, **extra):
+    async def get():
+        async_client = AsyncClient()
+        async_client.cookies = auth_client.cookies
+
+        response = await async_client.get(url, **extra)
+
+        # Read streamed bodies while the event loop is still running
+        if response.streaming:
+            response.body = b"".join(
+                [chunk async for chunk in response.streaming_content]
+            )
+
+        return response
+
+    return async_to_sync(get)()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url",
+    [
+        "create/",
+        "",
+        "unfinished/",
+        "finished/",
+        "overdue/",
+        "order-duedate/asc/",
+        "order-priority/desc/",
+        "order-created-at/asc/?limit=1",
+        "generate-csv/",
+    ],
+)
+def test_note_async_apis_match_sync(user, note, auth_client, url):
+    sync_response = auth_client.get(f"/api/notes/{url}")
+    async_response = async_get(auth_client, f"/api/async/notes/{url}")
+
+    assert async_response.status_code == 200
+    assert async_response["Content-Type"] == sync_response["Content-Type"]
+
+    if url == "generate-csv/":
+        assert async_response.body == b"".join(sync_response.streaming_content)
+    else:
+        assert async_response.content == sync_response.content
+
+
+@pytest.mark.django_db
+def test_note_async_retreive(user, note, auth_client):
+    note_response = async_get(auth_client, f"/api/async/notes/note/{note.id}/")
+
+    assert note_response.status_code == 200
+    assert note_response.json()["id"] == str(note.id)
+
+    not_modified = async_get(
+        auth_client,
+        f"/api/async/notes/note/{note.id}/",
+        headers={"If-None-Match": note_response["ETag"]},
+    )
+
+    assert not_modified.status_code == 304
+
+    missing = async_get(
+        auth_client, "/api/async/notes/note/b0c5ed8e-3e44-4c07-a6c4-0c1ef3d0d8b9/"
+    )
+
+    assert missing.status_code == 404
+    assert missing.json() == {"detail": "Note Does not exist"}
+
+
+@pytest.mark.django_db
+def test_note_async_rows_are_fetched_off_the_loop(note):
+    query_threads = []
+
+    def record(execute, sql, params, many, context):
+        query_threads.append(threading.get_ident())
+
+        return execute(sql, params, many, context)
+
+    async def fetch():
+        rows = await services.afetch_note_rows(
+            models.Note.objects.filter(id=note.id), ("id", "title"), 1
+        )
+
+        return threading.get_ident(), rows
+
+    with connection.execute_wrapper(record):
+        loop_thread, rows = async_to_sync(fetch)()
+
+    assert rows == [(note.id, note.title)]
+    assert query_threads and loop_thread not in query_threads
+
+
+@pytest.mark.django_db
+def test_note_async_requires_auth(note):
+    note_response = async_get(APIClient(), "/api/async/notes/")
+
+    assert note_response.status_code == 403
+    assert note_response.json() == {"detail": "Unauthorized"}
+
+
+@pytest.mark.django_db
+def test_note_rows_match_note_serializer(user, note):
+    models.Note.objects.create(
+        title="Fix bug",
+        content="This is bug Fixed over here",
+        due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, tzinfo=pytz.UTC),
+        is_complete=True,
+        priority=10,
+        user_id=user.id,
+    )
+
+    queryset = models.Note.objects.order_by("created_at", "id")
+
+    notes = [services.NoteDataClass.from_instance(instance) for instance in queryset]
+    rows = list(queryset.values_list(*services.NOTE_ROW_COLUMNS))
+
+    renderer = JSONRenderer()
+
+    for zone in ("UTC", "Africa/Lagos"):
+        with timezone.override(zone):
+            expected = note_serializer.NoteSeralizer(notes, many=True).data
+
+            assert renderer.render(
+                note_serializer.note_rows_to_representation(rows)
+            ) == renderer.render(expected)
+
+
+def test_note_serializer_benchmark():
+    output = StringIO()
+
+    call_command("bench_note_serializer", rows=50, repeat=1, stdout=output)
+
+    assert "speedup" in output.getvalue()
+
+
+@pytest.mark.django_db
+def test_note_data_class_from_row_shares_user(user, note):
+    models.Note.objects.create(
+        title="Fix bug",
+        content="This is bug Fixed over here",
+        due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, tzinfo=pytz.UTC),
+        priority=3,
+        user_id=user.id,
+    )
+
+    notes = services.get_export_notes()
+
+    assert len(notes) == 2
+    assert notes[0].user is notes[1].user
+    assert notes[0].user.email == user.email
+    assert not hasattr(notes[0], "__dict__")
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        notes[0].user.email = "other@example.com"
+
+
+def test_note_memory_benchmark():
+    output = StringIO()
+
+    call_command("bench_note_memory", rows=50, stdout=output)
+
+    assert "bytes/note" in output.getvalue()
+
+
+@pytest.mark.django_db
+def test_note_query_engine_combines_filters(user, auth_client):
+    now = timezone.now()
+
+    def create_note(title, days, priority, is_complete=False):
+        models.Note.objects.create(
+            title=title,
+            content="This is bug Fixed over here",
+            due_date=now + datetime.timedelta(days=days),
+            is_complete=is_complete,
+            priority=priority,
+            user_id=user.id,
+        )
+
+    create_note("Late urgent", -2, 9)
+    create_note("Later urgent", -1, 8)
+    create_note("Late minor", -3, 2)
+    create_note("Future urgent", 3, 9)
+    create_note("Done urgent", -4, 10, is_complete=True)
+
+    note_response = auth_client.get(
+        "/api/notes/",
+        {"due_before": now.isoformat(), "priority__gte": 8, "ordering": "due_date"},
+    )
+
+    assert note_response.status_code == 200
+    assert [note["title"] for note in note_response.data["results"]] == [
+        "Done urgent",
+        "Late urgent",
+        "Later urgent",
+    ]
+
+    note_response = auth_client.get(
+        "/api/notes/", {"ordering": "-priority,due_date", "limit": 2}
+    )
+
+    assert [note["title"] for note in note_response.data["results"]] == [
+        "Done urgent",
+        "Late urgent",
+    ]
+
+    next_page = auth_client.get(
+        "/api/notes/",
+        {
+            "ordering": "-priority,due_date",
+            "limit": 2,
+            "cursor": note_response.data["next"],
+        },
+    )
+
+    assert [note["title"] for note in next_page.data["results"]] == [
+        "Future urgent",
+        "Later urgent",
+    ]
+
+    note_response = auth_client.get(
+        "/api/notes/",
+        {
+            "due_before": now.isoformat(),
+            "priority__gte": 8,
+            "status": "unfinished",
+            "ordering": "due_date",
+        },
+    )
+
+    assert [note["title"] for note in note_response.data["results"]] == [
+        "Late urgent",
+        "Later urgent",
+    ]
+
+
+@pytest.mark.django_db
+def test_note_query_engine_without_partial_indexes(user, auth_client, monkeypatch):
+    # As on MySQL, the partial index of open notes is never created
+    monkeypatch.setattr(connection.features, "supports_partial_indexes", False)
+
+    now = timezone.now()
+
+    for title, days, priority in (
+        ("Later urgent", -1, 8),
+        ("Late urgent", -2, 9),
+        ("Late minor", -3, 2),
+        ("Future urgent", 3, 9),
+    ):
+        models.Note.objects.create(
+            title=title,
+            content="This is bug Fixed over here",
+            due_date=now + datetime.timedelta(days=days),
+            priority=priority,
+            user_id=user.id,
+        )
+
+    note_response = auth_client.get(
+        "/api/notes/",
+        {
+            "due_before": now.isoformat(),
+            "priority__gte": 8,
+            "status": "unfinished",
+            "ordering": "due_date",
+        },
+    )
+
+    assert note_response.status_code == 200
+    assert [note["title"] for note in note_response.data["results"]] == [
+        "Late urgent",
+        "Later urgent",
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"priority": 8},
+        {"priority": 8, "ordering": "priority"},
+        {"priority": 8, "ordering": "-priority"},
+        {"status": "finished", "ordering": "due_date"},
+        {"status": "finished", "ordering": "-due_date"},
+    ],
+)
+def test_note_query_engine_serves_pinned_filters(user, auth_client, params):
+    now = timezone.now()
+
+    for days in (2, -1, 1, 3):
+        models.Note.objects.create(
+            title=f"Due in {days}",
+            content="This is bug Fixed over here",
+            due_date=now + datetime.timedelta(days=days),
+            is_complete=True,
+            priority=8,
+            user_id=user.id,
+        )
+
+    models.Note.objects.create(
+        title="Other",
+        content="This is bug Fixed over here",
+        due_date=now,
+        priority=3,
+        user_id=user.id,
+    )
+
+    first_page = auth_client.get("/api/notes/", {**params, "limit": 2})
+
+    assert first_page.status_code == 200
+
+    next_page = auth_client.get(
+        "/api/notes/", {**params, "limit": 2, "cursor": first_page.data["next"]}
+    )
+
+    titles = [
+        note["title"]
+        for note in [*first_page.data["results"], *next_page.data["results"]]
+    ]
+
+    assert sorted(titles) == ["Due in -1", "Due in 1", "Due in 2", "Due in 3"]
+
+    if "due_date" in params.get("ordering", ""):
+        expected = ["Due in -1", "Due in 1", "Due in 2", "Due in 3"]
+
+        if params["ordering"].startswith("-"):
+            expected.reverse()
+
+        assert titles == expected
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"ordering": "title"},
+        {"ordering": "priority,priority"},
+        {"ordering": "due_date,priority"},
+        {"status": "finished", "ordering": "priority"},
+    ],
+)
+def test_note_query_engine_rejects_unindexed(user, auth_client, params):
+    note_response = auth_client.get("/api/notes/", params)
+
+    assert note_response.status_code == 400
+    assert "ordering" in note_response.data
+
+
+@pytest.mark.django_db
+def test_note_sparse_fieldsets(user, note, auth_client):
+    models.Note.objects.create(
+        title="Fix bug",
+        content="This is bug Fixed over here",
+        due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, tzinfo=pytz.UTC),
+        priority=3,
+        user_id=user.id,
+    )
+
+    full = auth_client.get("/api/notes/create/").json()["results"]
+
+    with CaptureQueriesContext(connection) as queries:
+        note_response = auth_client.get(
+            "/api/notes/create/", {"fields": "due_date,id,title"}
+        )
+
+    assert note_response.status_code == 200
+    assert note_response.json()["results"] == [
+        {"id": item["id"], "title": item["title"], "due_date": item["due_date"]}
+        for item in full
+    ]
+
+    # Neither the content nor the owner is read
+    note_sql = [query["sql"] for query in queries if "note_note" in query["sql"]]
+
+    assert note_sql
+    assert not any('"content"' in sql or "JOIN" in sql for sql in note_sql)
+
+    owner_id = auth_client.get("/api/notes/", {"fields": "title,user"}).json()
+    expanded = auth_client.get("/api/notes/", {"fields": "title", "expand": "user"})
+
+    assert owner_id["results"][0] == {"title": full[0]["title"], "user": str(user.id)}
+    assert expanded.json()["results"][0] == {
+        "title": full[0]["title"],
+        "user": full[0]["user"],
+    }
+
+    # The cursor is built from created_at and id, even when not picked
+    first_page = auth_client.get("/api/notes/", {"fields": "title", "limit": 1})
+    second_page = auth_client.get(
+        "/api/notes/",
+        {"fields": "title", "limit": 1, "cursor": first_page.json()["next"]},
+    )
+
+    assert [
+        *first_page.json()["results"],
+        *second_page.json()["results"],
+    ] == [{"title": item["title"]} for item in full]
+
+    assert auth_client.get("/api/notes/", {"fields": "body"}).status_code == 400
+    assert auth_client.get("/api/notes/", {"expand": "title"}).status_code == 400
+
+    # Every field with the user expanded is the full payload
+    every_field = {"fields": ",".join(services.NOTE_FIELDS), "expand": "user"}
+
+    assert auth_client.get("/api/notes/create/", every_field).json()["results"] == full
+
+
+@pytest.mark.django_db
+def test_note_sparse_fieldsets_retreive(user, note, auth_client):
+    url = f"/api/notes/note/{note.id}/"
+
+    full = auth_client.get(url)
+    sparse = auth_client.get(url, {"fields": "title,priority"})
+
+    assert sparse.status_code == 200
+    assert sparse.json() == {
+        "title": full.json()["title"],
+        "priority": full.json()["priority"],
+    }
+    assert sparse["ETag"] != full["ETag"]
+
+    async_sparse = async_get(
+        auth_client, f"/api/async/notes/note/{note.id}/?fields=title,priority"
+    )
+
+    assert async_sparse.content == sparse.content
+    assert async_sparse["ETag"] == sparse["ETag"]
+
+    async_list = async_get(auth_client, "/api/async/notes/?fields=id,due_date")
+
+    assert (
+        async_list.content
+        == auth_client.get("/api/notes/", {"fields": "id,due_date"}).content
+    )
+
+    missing = auth_client.get(
+        "/api/notes/note/b0c5ed8e-3e44-4c07-a6c4-0c1ef3d0d8b9/", {"fields": "title"}
+    )
+
+    assert missing.status_code == 404
+
+
+def note_stats_from_notes(user) -> dict:
+    notes = models.Note.objects.filter(user_id=user.id)
+    now = timezone.now()
+
+    return {
+        "total": notes.count(),
+        "finished": notes.filter(is_complete=True).count(),
+        "unfinished": notes.filter(is_complete=False).count(),
+        "overdue": notes.filter(due_date__lte=now).count(),
+        "priority": {
+            "low": notes.filter(priority__lte=3).count(),
+            "medium": notes.filter(priority__gte=4, priority__lte=7).count(),
+            "high": notes.filter(priority__gte=8).count(),
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_note_stats(user, auth_client):
+    now = timezone.now()
+
+    for index in range(4):
+        auth_client.post(
+            "/api/notes/create/",
+            {
+                "title": f"Stats {index}",
+                "content": "Counted",
+                "due_date": now + datetime.timedelta(days=index * 2 - 3),
+                "is_complete": False,
+                "priority": index * 3 + 1,
+            },
+        )
+
+    auth_client.post(
+        "/api/notes/bulk/",
+        [
+            {
+                "title": f"Bulk stats {index}",
+                "content": "Counted",
+                "due_date": "2023-09-23T20:45:37.127325Z",
+                "is_complete": index == 0,
+                "priority": 9,
+            }
+            for index in range(2)
+        ],
+        format="json",
+    )
+
+    notes = list(models.Note.objects.filter(user_id=user.id).order_by("priority"))
+
+    auth_client.put(
+        f"/api/notes/note/{notes[0].id}/",
+        {
+            "title": "Stats done",
+            "content": "Counted",
+            "due_date": notes[0].due_date,
+            "is_complete": True,
+            "priority": 5,
+        },
+    )
+    auth_client.delete(f"/api/notes/note/{notes[-1].id}/")
+    auth_client.delete("/api/notes/bulk/", {"ids": [str(notes[1].id)]}, format="json")
+
+    # The counter row and one indexed count
+    with CaptureQueriesContext(connection) as queries:
+        services.get_note_stats(user)
+
+    assert len(queries) == 2
+
+    note_response = auth_client.get("/api/notes/stats/")
+
+    assert note_response.status_code == 200
+    assert note_response.data == note_stats_from_notes(user)
+    assert note_response.data["total"] == 4
+
+
+@pytest.mark.django_db
+def test_note_stats_reconcile(user, note, auth_client):
+    # Written through the ORM, the counters missed it
+    assert services.get_note_stats(user).total == 0
+
+    output = StringIO()
+    call_command("reconcile_note_stats", stdout=output)
+
+    assert "rebuilt for 1 users" in output.getvalue()
+    assert auth_client.get("/api/notes/stats/").data == note_stats_from_notes(user)
+
+
+@pytest.mark.django_db
+def test_note_stats_reconcile_per_user(user, note, auth_client):
+    other_user = user_services.create_user(
+        user_services.UserDataClass(
+            first_name="Other",
+            last_name="User",
+            email="other@example.com",
+            password="password",
+        )
+    )
+
+    # Counted, then every note of the user removed behind the services
+    services.get_note_stats(other_user)
+
+    with CaptureQueriesContext(connection) as queries:
+        assert services.reconcile_note_stats() == 1
+
+    # Each counter row is recounted on its own, the table is never emptied
+    assert all(
+        "WHERE" in query["sql"]
+        for query in queries
+        if query["sql"].startswith("DELETE")
+    )
+
+    assert not models.NoteStats.objects.filter(user_id=other_user.id).exists()
+    assert auth_client.get("/api/notes/stats/").data == note_stats_from_notes(user)
+
+
+def note_payload(title: str, **fields) -> dict:
+    return {
+        "title": title,
+        "content": "Synced offline",
+        "due_date": "2023-09-23T20:45:37.127325Z",
+        "is_complete": False,
+        "priority": 3,
+        **fields,
+    }
+
+
+@pytest.mark.django_db
+def test_note_changes(user, note, auth_client):
+    first_sync = auth_client.get("/api/notes/changes/").data
+
+    # Written before change sequences, the legacy note is sent too
+    assert [change["id"] for change in first_sync["results"]] == [str(note.id)]
+    assert first_sync["results"][0] == auth_client.get(
+        f"/api/notes/note/{note.id}/"
+    ).data
+    assert first_sync["deleted"] == []
+    assert first_sync["has_more"] is False
+
+    created = [
+        auth_client.post("/api/notes/create/", note_payload(f"Offline {index}")).data
+        for index in range(3)
+    ]
+
+    auth_client.put(
+        f"/api/notes/note/{created[0]['id']}/", note_payload("Edited", priority=9)
+    )
+    auth_client.delete(f"/api/notes/note/{created[1]['id']}/")
+
+    changes = auth_client.get(
+        "/api/notes/changes/", {"since": first_sync["since"]}
+    ).data
+
+    # Change order, the deleted note is only a tombstone
+    assert [change["id"] for change in changes["results"]] == [
+        created[2]["id"],
+        created[0]["id"],
+    ]
+    assert changes["results"][1]["title"] == "Edited"
+    assert changes["deleted"] == [created[1]["id"]]
+    assert changes["has_more"] is False
+
+    # Nothing written since, answered from the counter row
+    with CaptureQueriesContext(connection) as queries:
+        no_changes = auth_client.get(
+            "/api/notes/changes/", {"since": changes["since"]}
+        ).data
+
+    assert no_changes == {
+        "results": [],
+        "deleted": [],
+        "since": changes["since"],
+        "has_more": False,
+    }
+    assert len(queries) <= 2
+
+    sparse = auth_client.get(
+        "/api/notes/changes/", {"since": first_sync["since"], "fields": "id,title"}
+    ).data
+
+    assert sparse["results"][0] == {"id": created[2]["id"], "title": "Offline 2"}
+    assert sparse["since"] == changes["since"]
+
+    assert auth_client.get("/api/notes/changes/", {"since": "nope"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_note_changes_batches(user, auth_client):
+    # Legacy notes share change_seq 0, the cursor breaks the tie on the id
+    legacy = [
+        models.Note.objects.create(
+            title=f"Legacy {index}",
+            content="Before delta sync",
+            due_date=datetime.datetime(2023, 9, 23, tzinfo=pytz.UTC),
+            user_id=user.id,
+        )
+        for index in range(3)
+    ]
+
+    bulk = auth_client.post(
+        "/api/notes/bulk/",
+        [note_payload(f"Bulk {index}") for index in range(4)],
+        format="json",
+    ).data
+
+    auth_client.put(
+        "/api/notes/bulk/",
+        [{"id": str(legacy[0].id), **note_payload("Legacy edited")}],
+        format="json",
+    )
+    auth_client.delete(
+        "/api/notes/bulk/",
+        {"ids": [bulk[1]["id"], bulk[2]["id"]]},
+        format="json",
+    )
+
+    stats = models.NoteStats.objects.get(user_id=user.id)
+    change_seqs = list(
+        models.Note.objects.filter(user_id=user.id)
+        .order_by("change_seq")
+        .values_list("change_seq", flat=True)
+    )
+    tombstones = list(
+        models.NoteTombstone.objects.order_by("change_seq").values_list(
+            "change_seq", flat=True
+        )
+    )
+
+    # One number per write, 4 created, 1 updated, 2 deleted
+    assert stats.change_seq == 7
+    assert change_seqs == [0, 0, 1, 4, 5]
+    assert tombstones == [6, 7]
+
+    synced = []
+    since = None
+
+    while True:
+        params = {"limit": 2, **({"since": since} if since else {})}
+        batch = auth_client.get("/api/notes/changes/", params).data
+
+        assert len(batch["results"]) + len(batch["deleted"]) <= 2
+
+        synced.extend(change["id"] for change in batch["results"])
+        since = batch["since"]
+
+        if not batch["has_more"]:
+            break
+
+    assert sorted(synced) == sorted(
+        str(note_id)
+        for note_id in models.Note.objects.filter(user_id=user.id).values_list(
+            "id", flat=True
+        )
+    )
+
+    # The counter never goes back, the tombstones hold the last numbers given
+    services.reconcile_note_stats()
+
+    assert models.NoteStats.objects.get(user_id=user.id).change_seq == 7
+
+    models.Note.objects.filter(user_id=user.id).delete()
+
+    assert services.rebuild_note_stats(user.id).change_seq == 7
+
+
+@pytest.mark.django_db
+def test_note_change_seq_survives_reconcile(user, auth_client):
+    auth_client.post("/api/notes/create/", note_payload("First"))
+    second = auth_client.post("/api/notes/create/", note_payload("Second")).data
+
+    since = auth_client.get("/api/notes/changes/").data["since"]
+
+    # Gone behind the services, no note or tombstone holds the last number
+    models.Note.objects.filter(id=second["id"]).delete()
+
+    services.reconcile_note_stats()
+
+    third = auth_client.post("/api/notes/create/", note_payload("Third")).data
+
+    assert models.Note.objects.get(id=third["id"]).change_seq == 3
+
+    # A client synced up to the deleted note still sees the next change
+    changes = auth_client.get("/api/notes/changes/", {"since": since}).data
+
+    assert [change["id"] for change in changes["results"]] == [third["id"]]
+
+
+def test_note_benchmarks_cover_every_url():
+    assert benchmarks.uncovered_urls() == []
+
+
+def test_note_bench_endpoints_command(tmp_path):
+    output = tmp_path / "results.json"
+
+    files = set(os.listdir(django_settings.BASE_DIR))
+
+    # Own process, the command sets up and tears down its test databases.
+    # A replica and shards are configured, none of their files is created
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "manage.py",
+            "bench_endpoints",
+            *("--users", "2", "--notes", "12", "--repeat", "1"),
+            *("--output", str(output)),
+        ],
+        cwd=django_settings.BASE_DIR,
+        env={
+            **os.environ,
+            "DB_SQLITE": "1",
+            "DB_SQLITE_REPLICA": "1",
+            "DB_SQLITE_SHARDS": "2",
+        },
+        capture_output=True,
+        text=True,
+        timeout=600,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert set(os.listdir(django_settings.BASE_DIR)) == files
+
+    report = json.loads(output.read_text())
+
+    assert report["endpoints"]
+    assert all(result["status"] < 400 for result in report["endpoints"])
+
+
+@pytest.mark.django_db
+def test_note_benchmarks_seed_and_measure(settings, tmp_path):
+    settings.NOTE_EXPORT_ROOT = str(tmp_path)
+
+    dataset = benchmarks.seed(users=3, notes=30, seed=7)
+
+    assert models.Note.objects.count() == 30
+    assert services.get_note_stats(dataset.user).total == 10
+
+    # Same seed, same notes
+    titles = list(models.Note.objects.order_by("id").values_list("title", flat=True))
+    models.Note.objects.all().delete()
+    get_user_model().objects.all().delete()
+    dataset = benchmarks.seed(users=3, notes=30, seed=7)
+
+    assert (
+        list(models.Note.objects.order_by("id").values_list("title", flat=True))
+        == titles
+    )
+
+    endpoints = [
+        endpoint
+        for endpoint in benchmarks.ENDPOINTS
+        if endpoint.name in ("all notes", "bulk notes", "export download")
+    ]
+
+    results = benchmarks.run(dataset, repeat=3, endpoints=endpoints)
+
+    assert [(result["method"], result["name"]) for result in results] == [
+        ("GET", "all notes"),
+        ("GET", "all notes [filtered]"),
+        ("GET", "all notes [sparse]"),
+        ("GET", "export download"),
+        ("POST", "bulk notes"),
+        ("PUT", "bulk notes"),
+        ("DELETE", "bulk notes"),
+    ]
+
+    for result in results:
+        assert 200 <= result["status"] < 300
+        assert result["runs"] == 3
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["peak_memory_kb"] > 0
+        assert result["payload_bytes"] > 0
+
+    assert results[4]["queries"] >= 1
+
+    [reduction] = benchmarks.reductions(results)
+
+    assert reduction["name"] == "all notes [sparse]"
+    assert reduction["payload"] > 0
+
+    # The notes written above are behind the delta cursor, the first sync
+    # sends every note of the user
+    full_sync, delta_sync = benchmarks.run(
+        dataset,
+        repeat=1,
+        endpoints=[
+            endpoint
+            for endpoint in benchmarks.ENDPOINTS
+            if endpoint.name == "note changes"
+        ],
+    )
+
+    assert delta_sync["name"] == "note changes [delta]"
+    assert delta_sync["payload_bytes"] < full_sync["payload_bytes"]
+
+
+def server_timing(response) -> dict:
+    metrics = {}
+
+    for metric in response["Server-Timing"].split(", "):
+        name, value = metric.split(";")
+        metrics[name] = float(value.split("=")[1].strip('"'))
+
+    return metrics
+
+
+@pytest.mark.django_db
+def test_note_server_timing(user, note, auth_client):
+    note_response = auth_client.get("/api/notes/")
+
+    assert note_response.status_code == 200
+
+    metrics = server_timing(note_response)
+
+    assert set(metrics) == {"db", "db-count", "serialize", "render", "total"}
+    # Page read and authentication, at least
+    assert metrics["db-count"] >= 1
+    assert metrics["serialize"] > 0
+    assert metrics["render"] > 0
+    assert metrics["total"] >= metrics["db"]
+
+
+@pytest.mark.django_db
+def test_note_server_timing_async(user, note, auth_client):
+    note_response = async_get(auth_client, "/api/async/notes/")
+
+    metrics = server_timing(note_response)
+
+    # Run in sync_to_async threads, the queries are counted all the same
+    assert metrics["db-count"] >= 1
+    assert metrics["db"] > 0
+
+
+def slow_async_view(seconds: float):
+    async def view(request):
+        await asyncio.sleep(seconds)
+
+        return HttpResponse("slow")
+
+    return view
+
+
+def concurrent_seconds(handler, count: int = 6) -> float:
+    """Wall time of count concurrent requests through an async handler"""
+
+    async def send():
+        started = time.perf_counter()
+
+        await asyncio.gather(
+            *[handler(RequestFactory().get("/api/async/notes/")) for _ in range(count)]
+        )
+
+        return time.perf_counter() - started
+
+    return async_to_sync(send)()
+
+
+def test_note_middlewares_implement_both_paths():
+    class SyncOnlyMiddleware(middleware.AsyncCapableMiddleware):
+        def call(self, request):
+            return self.get_response(request)
+
+    # Refused when the chain is built, not on the first async request
+    with pytest.raises(TypeError):
+        SyncOnlyMiddleware(slow_async_view(0))
+
+
+def test_note_server_timing_middleware_async():
+    timing_middleware = middleware.ServerTimingMiddleware(slow_async_view(0.2))
+
+    assert iscoroutinefunction(timing_middleware)
+    # One at a time takes 6 x 0.2s
+    assert concurrent_seconds(timing_middleware) < 0.6
+
+
+@pytest.mark.django_db
+def test_note_slow_request_log(user, note, auth_client, settings, caplog):
+    settings.SLOW_REQUEST_MS = 0
+
+    with caplog.at_level("WARNING", logger="drf.middleware"):
+        auth_client.get("/api/notes/create/")
+
+    entry = json.loads(caplog.records[-1].getMessage())
+
+    assert entry["event"] == "slow_request"
+    assert entry["path"] == "/api/notes/create/"
+    assert entry["status"] == 200
+    assert entry["db_count"] == sum(sql["count"] for sql in entry["top_sql"])
+    assert entry["top_sql"][0]["sql"].startswith("SELECT")
+
+
+@pytest.mark.django_db
+def test_note_profile_request(user, note, auth_client, settings, tmp_path):
+    settings.PROFILE_ROOT = str(tmp_path)
+
+    get_user_model().objects.filter(id=user.id).update(is_staff=True)
+    token = profiling.make_token(user.id)
+
+    note_response = auth_client.get(
+        "/api/notes/", HTTP_X_PROFILE=token, HTTP_X_PROFILE_FORMAT="prof"
+    )
+
+    assert note_response.status_code == 200
+    assert note_response["X-Profile"].startswith("NotesApi/")
+    assert note_response["X-Profile"].endswith(".prof")
+
+    stats = pstats.Stats(str(tmp_path / note_response["X-Profile"]))
+    assert stats.total_calls > 0
+
+    note_response = auth_client.get(f"/api/notes/generate-csv/?profile={token}")
+
+    assert note_response["X-Profile"].startswith("GenerateCSVApi/")
+
+    # Saved once the body was streamed
+    b"".join(note_response.streaming_content)
+    assert (tmp_path / note_response["X-Profile"]).exists()
+
+
+@pytest.mark.django_db
+def test_note_profile_async_request(user, note, auth_client, settings, tmp_path):
+    settings.PROFILE_ROOT = str(tmp_path)
+
+    get_user_model().objects.filter(id=user.id).update(is_staff=True)
+    token = profiling.make_token(user.id)
+
+    note_response = async_get(
+        auth_client,
+        "/api/async/notes/",
+        headers={"X-Profile": token, "X-Profile-Format": "prof"},
+    )
+
+    assert note_response.status_code == 200
+    assert note_response["X-Profile"].startswith("AsyncNotesApi/")
+    assert pstats.Stats(str(tmp_path / note_response["X-Profile"])).total_calls > 0
+
+    # No token, straight through on the event loop
+    profiler_middleware = middleware.ProfilerMiddleware(slow_async_view(0.2))
+
+    assert iscoroutinefunction(profiler_middleware)
+    assert concurrent_seconds(profiler_middleware) < 0.6
+
+
+@pytest.mark.django_db
+def test_note_profile_request_staff_only(user, note, auth_client, settings, tmp_path):
+    settings.PROFILE_ROOT = str(tmp_path)
+
+    # Not staff, then not signed by us
+    for token in (profiling.make_token(user.id), "forged"):
+        note_response = auth_client.get("/api/notes/", HTTP_X_PROFILE=token)
+
+        assert note_response.status_code == 200
+        assert not note_response.has_header("X-Profile")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_note_sampling_profiler_collapsed_stacks():
+    def busy_loop():
+        deadline = time.perf_counter() + 0.05
+
+        while time.perf_counter() < deadline:
+            pass
+
+    sampler = profiling.SamplingProfiler(threading.get_ident(), 0.001)
+    sampler.start()
+    busy_loop()
+    sampler.stop()
+
+    lines = sampler.collapsed().splitlines()
+
+    assert lines
+    assert any("busy_loop (tests/api/test_note.py:" in line for line in lines)
+
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert stack.split(";")[-1]
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip;q=1.0, br;q=0.5", "gzip"),
+        ("br;q=0, *", "gzip"),
+        ("*", "br"),
+        ("deflate, identity", None),
+        ("", None),
+    ],
+)
+def test_note_compression_negotiate(accept_encoding, encoding):
+    assert compression.negotiate(accept_encoding) == encoding
+
+
+@pytest.mark.django_db
+def test_note_response_compression(user, note, auth_client, settings):
+    settings.COMPRESSION_MIN_SIZE = 100
+
+    plain = auth_client.get("/api/notes/")
+
+    assert "Content-Encoding" not in plain
+    assert "Accept-Encoding" in plain["Vary"]
+
+    br_response = auth_client.get("/api/notes/", HTTP_ACCEPT_ENCODING="gzip, br")
+
+    assert br_response["Content-Encoding"] == "br"
+    assert brotli.decompress(br_response.content) == plain.content
+    assert br_response["Content-Length"] == str(len(br_response.content))
+
+    gzip_response = auth_client.get(
+        f"/api/notes/note/{note.id}/", HTTP_ACCEPT_ENCODING="gzip"
+    )
+
+    assert gzip_response["Content-Encoding"] == "gzip"
+    assert gzip.decompress(gzip_response.content) == auth_client.get(
+        f"/api/notes/note/{note.id}/"
+    ).content
+
+    # Other bytes, weak ETag, still matched by conditional gets
+    assert gzip_response["ETag"].startswith('W/"')
+
+    not_modified = auth_client.get(
+        f"/api/notes/note/{note.id}/",
+        HTTP_ACCEPT_ENCODING="gzip",
+        HTTP_IF_NONE_MATCH=gzip_response["ETag"],
+    )
+
+    assert not_modified.status_code == 304
+
+    # Too small
+    settings.COMPRESSION_MIN_SIZE = 10**6
+
+    small = auth_client.get("/api/notes/", HTTP_ACCEPT_ENCODING="br")
+
+    assert "Content-Encoding" not in small
+
+
+def test_note_asgi_middlewares_serve_concurrently(monkeypatch):
+    async def slow_authenticate(request):
+        # A slow cache or db read, awaited on the event loop
+        await asyncio.sleep(0.3)
+
+        raise exceptions.NotAuthenticated()
+
+    monkeypatch.setattr(user_auth, "authenticate_async", slow_authenticate)
+
+    async def send():
+        async_client = AsyncClient()
+        started = time.perf_counter()
+
+        responses = await asyncio.gather(
+            *[async_client.get("/api/async/notes/") for _ in range(6)]
+        )
+
+        return responses, time.perf_counter() - started
+
+    responses, elapsed = async_to_sync(send)()
+
+    assert [note_response.status_code for note_response in responses] == [403] * 6
+    assert "Server-Timing" in responses[0]
+    # The whole MIDDLEWARE stack, one request at a time takes 6 x 0.3s
+    assert elapsed < 0.9
+
+    compression_middleware = middleware.CompressionMiddleware(slow_async_view(0.2))
+
+    assert iscoroutinefunction(compression_middleware)
+
+
+@pytest.mark.django_db
+def test_note_streamed_response_compression(user, note, auth_client, settings):
+    settings.COMPRESSION_STREAM_FLUSH_BYTES = 64
+
+    for index in range(5):
+        models.Note.objects.create(
+            title=f"Note {index}",
+            content="Streamed and compressed",
+            due_date=timezone.now(),
+            priority=3,
+            user_id=user.id,
+        )
+
+    plain = b"".join(auth_client.get("/api/notes/generate-csv/").streaming_content)
+
+    csv_response = auth_client.get(
+        "/api/notes/generate-csv/", HTTP_ACCEPT_ENCODING="gzip"
+    )
+
+    assert csv_response["Content-Encoding"] == "gzip"
+
+    chunks = list(csv_response.streaming_content)
+    decompressor = zlib.decompressobj(31)
+
+    # Every chunk sent is decodable on arrival
+    received = b""
+
+    for chunk in chunks[:-1]:
+        received += decompressor.decompress(chunk)
+
+        assert received and plain.startswith(received)
+
+    assert len(chunks) > 2
+    assert received + decompressor.decompress(chunks[-1]) == plain
+
+    async_csv = async_get(
+        auth_client, "/api/async/notes/generate-csv/", headers={"Accept-Encoding": "br"}
+    )
+
+    assert async_csv["Content-Encoding"] == "br"
+    assert brotli.decompress(async_csv.body) == plain
+
+    pdf_response = auth_client.get(
+        "/api/notes/generate-pdf/", HTTP_ACCEPT_ENCODING="gzip, br"
+    )
+
+    assert pdf_response.status_code == 200
+    assert "Content-Encoding" not in pdf_response
+
+
+def test_note_compression_benchmark():
+    output = StringIO()
+
+    call_command("bench_compression", rows=50, repeat=1, stdout=output)
+
+    assert "gzip" in output.getvalue()
+    assert "br" in output.getvalue()
+
+
+JSON_PAYLOADS = [
+    {"detail": "Note Does not exist"},
+    [1, 2.5, True, False, None, "café", "line\u2028paragraph\u2029end"],
+    {
+        "id": uuid.UUID("b0c5ed8e-3e44-4c07-a6c4-0c1ef3d0d8b9"),
+        "created_at": datetime.datetime(
+            2023, 9, 23, 20, 45, 37, 127325, tzinfo=pytz.UTC
+        ),
+        "naive": datetime.datetime(2023, 9, 23, 20, 45, 37),
+        "date": datetime.date(2023, 9, 23),
+        "time": datetime.time(20, 45, 37, 127325),
+        "duration": datetime.timedelta(hours=1),
+        "price": decimal.Decimal("1.50"),
+        "tuple": (1, "two"),
+        1: "int key",
+    },
+    collections.OrderedDict([("b", ReturnList([{"a": 1}], serializer=None))]),
+    ReturnDict({"errors": [ErrorDetail("Cursor is not valid")]}, serializer=None),
+    {"lazy": gettext_lazy("Unauthorized"), "big": 2**70},
+    "",
+]
+
+
+@pytest.mark.parametrize("payload", JSON_PAYLOADS)
+def test_note_json_renderer_matches_drf(payload):
+    drf_renderer = rest_renderers.JSONRenderer()
+    renderer = renderers.JSONRenderer()
+
+    assert renderer.render(payload) == drf_renderer.render(payload)
+
+    indented = "application/json; indent=4"
+
+    assert renderer.render(payload, indented) == drf_renderer.render(
+        payload, indented
+    )
+
+    content = drf_renderer.render(payload)
+
+    assert renderers.JSONParser().parse(
+        io.BytesIO(content)
+    ) == rest_parsers.JSONParser().parse(io.BytesIO(content))
+
+
+def test_note_json_parser_errors_match_drf():
+    for content in (b'{"title": ', b"NaN", b"\xef\xbb\xbf{}"):
+        with pytest.raises(ParseError) as drf_error:
+            rest_parsers.JSONParser().parse(io.BytesIO(content))
+
+        with pytest.raises(ParseError) as error:
+            renderers.JSONParser().parse(io.BytesIO(content))
+
+        assert str(error.value) == str(drf_error.value)
+
+
+@pytest.mark.django_db
+def test_note_api_json_matches_drf_renderer(user, note, auth_client):
+    assert renderers.JSONRenderer in APIView().renderer_classes
+
+    for url in ("/api/notes/", f"/api/notes/note/{note.id}/", "/api/notes/stats/"):
+        note_response = auth_client.get(url)
+
+        assert note_response.content == rest_renderers.JSONRenderer().render(
+            note_response.data
+        )
+
+    bulk_response = auth_client.post(
+        "/api/notes/bulk/",
+        [
+            {
+                "title": "Café \u2028 line",
+                "content": "Parsed by orjson",
+                "due_date": "2023-09-23T20:45:37.127325Z",
+                "is_complete": False,
+                "priority": 3,
+            }
+        ],
+        format="json",
+    )
+
+    assert bulk_response.status_code == 201
+    assert bulk_response.data[0]["note"]["title"] == "Café \u2028 line"
+    assert b"\\u2028" in bulk_response.content
+
+
+def test_note_json_renderer_benchmark():
+    output = StringIO()
+
+    call_command("bench_json_renderer", rows=50, repeat=1, stdout=output)
+
+    assert "per 10k notes" in output.getvalue()
+
+
+def test_note_sqlite_replica_is_opt_in():
+    def replicas(**env) -> list:
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "from django.conf import settings; "
+                "print(','.join(settings.DATABASE_REPLICAS))",
+            ],
+            cwd=django_settings.BASE_DIR,
+            env={
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": "drf.settings",
+                "DB_REPLICA_HOSTNAMES": "",
+                "DB_SQLITE": "1",
+                **env,
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        return completed.stdout.split()
+
+    assert replicas(DB_SQLITE_REPLICA="") == []
+    assert replicas(DB_SQLITE_REPLICA="1") == ["replica_1"]
+
+
+def test_note_replica_router(settings):
+    settings.DATABASE_REPLICAS = ["replica_1", "replica_2"]
+
+    router = routers.ReplicaRouter()
+
+    # Outside a request (commands, workers) everything stays on the primary
+    assert router.db_for_read(models.Note) == "default"
+
+    with routers.replica_reads():
+        assert router.db_for_read(models.Note) in settings.DATABASE_REPLICAS
+
+        # Read your writes, the rest of the request uses the primary
+        assert router.db_for_write(models.Note) == "default"
+        assert router.db_for_read(models.Note) == "default"
+
+    with routers.replica_reads(allowed=False):
+        assert router.db_for_read(models.Note) == "default"
+
+    assert not router.allow_migrate("replica_1", "note")
+    assert router.allow_migrate("default", "note")
+
+
+def test_note_replica_routing_pins_writers(settings):
+    settings.DATABASE_REPLICAS = ["replica_1"]
+
+    routed = []
+
+    def serve(request):
+        def view(request):
+            routed.append(routers.ReplicaRouter().db_for_read(models.Note))
+
+            if request.method == "POST":
+                routers.ReplicaRouter().db_for_write(models.Note)
+
+            return HttpResponse()
+
+        return middleware.ReplicaRoutingMiddleware(view)(request)
+
+    factory = RequestFactory()
+
+    assert not serve(factory.get("/api/notes/")).cookies
+    response = serve(factory.post("/api/notes/create/"))
+    pinned = factory.get("/api/notes/")
+    pinned.COOKIES = {settings.REPLICA_PIN_COOKIE: "1"}
+    serve(pinned)
+
+    assert routed == ["replica_1", "default", "default"]
+    assert response.cookies[settings.REPLICA_PIN_COOKIE]["max-age"] == (
+        settings.REPLICA_PIN_SECONDS
+    )
+
+
+def test_note_replica_routing_async(settings):
+    settings.DATABASE_REPLICAS = ["replica_1"]
+
+    routed = []
+
+    def route(method: str) -> None:
+        # In a sync_to_async thread, as the queries of async views run
+        routed.append(routers.ReplicaRouter().db_for_read(models.Note))
+
+        if method == "POST":
+            routers.ReplicaRouter().db_for_write(models.Note)
+
+    async def view(request):
+        await sync_to_async(route)(request.method)
+
+        return HttpResponse()
+
+    replica_middleware = middleware.ReplicaRoutingMiddleware(view)
+
+    assert iscoroutinefunction(replica_middleware)
+
+    factory = RequestFactory()
+
+    get_response = async_to_sync(replica_middleware)(factory.get("/api/notes/"))
+    post_response = async_to_sync(replica_middleware)(
+        factory.post("/api/notes/create/")
+    )
+
+    assert routed == ["replica_1", "default"]
+    assert not get_response.cookies
+    assert settings.REPLICA_PIN_COOKIE in post_response.cookies
+
+    slow_middleware = middleware.ReplicaRoutingMiddleware(slow_async_view(0.2))
+
+    assert concurrent_seconds(slow_middleware) < 0.6
+
+
+@pytest.mark.django_db
+def test_note_write_sets_replica_pin(user, auth_client, settings):
+    note_response = auth_client.post(
+        "/api/notes/create/",
+        {
+            "title": "Pinned",
+            "content": "Read back from the primary",
+            "due_date": "2023-09-23T20:45:37.127325Z",
+            "priority": 3,
+        },
+    )
+
+    assert note_response.status_code == 201
+    assert settings.REPLICA_PIN_COOKIE in note_response.cookies
+
+
+def test_note_shard_ring(settings):
+    settings.NOTE_SHARDS = ["shard_1", "shard_2"]
+
+    user_ids = [f"user-{index}" for index in range(300)]
+    placed = {user_id: sharding.ring_shard(user_id) for user_id in user_ids}
+
+    assert set(placed.values()) == {"shard_1", "shard_2"}
+
+    # A new shard only takes users over, about its share of them
+    settings.NOTE_SHARDS = ["shard_1", "shard_2", "shard_3"]
+
+    moved = [
+        user_id
+        for user_id in user_ids
+        if sharding.ring_shard(user_id) != placed[user_id]
+    ]
+
+    assert all(sharding.ring_shard(user_id) == "shard_3" for user_id in moved)
+    assert 0 < len(moved) < len(user_ids) / 2
+
+    router = sharding.NoteShardRouter()
+
+    assert router.allow_migrate("shard_1", "note", "note")
+    assert not router.allow_migrate("shard_1", "note", "notestats")
+    assert not router.allow_migrate("shard_1", "users", "user")
+    assert router.allow_migrate("default", "note", "note") is None
+
+
+SHARD_DATABASES = ["default", "shard_1", "shard_2"]
+
+
+# Outside of a test transaction, the router keeps transactions on the primary
+@pytest.mark.django_db(transaction=True, databases=SHARD_DATABASES)
+def test_note_cache_skips_lagging_replica(user, note, settings):
+    # shard_1 holds a notes table but none of the rows, a replica far behind
+    settings.DATABASE_REPLICAS = ["shard_1"]
+
+    def build():
+        return list(
+            models.Note.objects.filter(user_id=user.id).values_list("id", flat=True)
+        )
+
+    async def abuild():
+        return await sync_to_async(build)()
+
+    with routers.replica_reads():
+        assert build() == []
+
+        payload = services.get_cached_payload("notes", {}, build, user)
+
+        # Later requests reading the replica still get the primary's rows
+        assert build() == []
+        assert services.get_cached_payload("notes", {}, build, user) == payload
+
+    assert payload == [note.id]
+
+    async def read_async():
+        with routers.replica_reads():
+            return await services.aget_cached_payload("async", {}, abuild, user)
+
+    assert async_to_sync(read_async)() == [note.id]
+
+
+@pytest.mark.django_db(databases=SHARD_DATABASES)
+def test_note_sharded_user_notes(user, auth_client, sharded):
+    note_response = auth_client.post(
+        "/api/notes/create/",
+        {
+            "title": "Sharded",
+            "content": "Stored with its owner",
+            "due_date": "2023-09-23T20:45:37.127325Z",
+            "priority": 3,
+        },
+    )
+
+    assert note_response.status_code == 201
+
+    note_id = note_response.data["id"]
+    alias = sharding.shard_for_user(user.id)
+
+    assert alias == sharding.ring_shard(user.id)
+    assert models.Note.objects.using(alias).filter(id=note_id).exists()
+    assert not models.Note.objects.using("default").exists()
+
+    user_notes = auth_client.get("/api/notes/create/").data["results"]
+
+    assert [note["id"] for note in user_notes] == [note_id]
+    assert user_notes[0]["user"]["email"] == user.email
+    assert auth_client.get(f"/api/notes/note/{note_id}/").data["title"] == "Sharded"
+
+    assert auth_client.put(
+        f"/api/notes/note/{note_id}/",
+        {
+            "title": "Sharded deploy",
+            "content": "Stored with its owner",
+            "due_date": "2023-09-23T20:45:37.127325Z",
+            "is_complete": True,
+            "priority": 3,
+        },
+    ).data["title"] == "Sharded deploy"
+
+    search_results = auth_client.get("/api/notes/search/", {"q": "deploy"}).data
+    stats = auth_client.get("/api/notes/stats/").data
+
+    assert [note["id"] for note in search_results["results"]] == [note_id]
+    assert (stats["total"], stats["finished"], stats["overdue"]) == (1, 1, 1)
+
+    assert auth_client.delete(f"/api/notes/note/{note_id}/").status_code == 204
+    assert not models.Note.objects.using(alias).exists()
+
+
+@pytest.mark.django_db(databases=SHARD_DATABASES)
+def test_note_sharded_changes(user, auth_client, sharded):
+    kept, deleted = [
+        auth_client.post("/api/notes/create/", note_payload(title)).data["id"]
+        for title in ("Kept", "Deleted")
+    ]
+
+    first_sync = auth_client.get("/api/notes/changes/").data
+
+    assert [change["id"] for change in first_sync["results"]] == [kept, deleted]
+    assert first_sync["results"][0]["user"]["email"] == user.email
+
+    auth_client.put(f"/api/notes/note/{kept}/", note_payload("Kept and edited"))
+    auth_client.delete(f"/api/notes/note/{deleted}/")
+
+    changes = auth_client.get(
+        "/api/notes/changes/", {"since": first_sync["since"]}
+    ).data
+
+    # Tombstones stay on default with the counters
+    assert models.NoteTombstone.objects.using("default").filter(id=deleted).exists()
+    assert [change["title"] for change in changes["results"]] == ["Kept and edited"]
+    assert changes["deleted"] == [deleted]
+
+
+@pytest.mark.django_db(transaction=True, databases=SHARD_DATABASES)
+def test_note_sharded_changes_wait_for_the_counter(user, auth_client, sharded):
+    note_id = auth_client.post("/api/notes/create/", note_payload("Synced")).data[
+        "id"
+    ]
+    alias = sharding.shard_for_user(user.id)
+
+    commits = []
+
+    with sharding.atomic(alias):
+        transaction.on_commit(
+            lambda: commits.append((alias, connections["default"].in_atomic_block)),
+            using=alias,
+        )
+        transaction.on_commit(lambda: commits.append(("default", False)))
+
+    # The counter row commits last, default is still open when the shard commits
+    assert commits == [(alias, True), ("default", False)]
+
+    since = services.get_note_changes(user, 10).since
+    head = models.NoteStats.objects.get(user_id=user.id).change_seq
+
+    # Between the two commits of a write: the note is on the shard, the counter
+    # row taking its change sequence is not committed yet
+    sharding.notes(user.id).filter(id=note_id).update(
+        title="Edited", change_seq=head + 1
+    )
+
+    waiting = services.get_note_changes(user, 10, since)
+
+    assert waiting.results == [] and waiting.since == since
+
+    models.NoteStats.objects.filter(user_id=user.id).update(
+        change_seq=F("change_seq") + 1
+    )
+
+    changes = services.get_note_changes(user, 10, waiting.since)
+
+    assert [row[0] for row in changes.results] == [uuid.UUID(note_id)]
+    assert services.get_note_changes(user, 10, changes.since).results == []
+
+
+@pytest.mark.django_db(databases=SHARD_DATABASES)
+def test_note_sharded_lists_gather_every_shard(user, auth_client, sharded):
+    other = user_services.create_user(
+        user_services.UserDataClass(
+            first_name="Ada",
+            last_name="Shard",
+            email="ada@example.com",
+            password="password",
+        )
+    )
+
+    models.NoteShard.objects.create(user_id=user.id, alias="shard_1")
+    models.NoteShard.objects.create(user_id=other.id, alias="shard_2")
+
+    for priority, owner in enumerate([user, other, user, other], 1):
+        sharding.notes(owner.id).create(
+            title=f"Priority {priority}",
+            content="Spread over the shards",
+            due_date=datetime.datetime(2023, 9, 23, tzinfo=pytz.UTC),
+            priority=priority,
+            user_id=owner.id,
+        )
+
+    assert models.Note.objects.using("shard_1").count() == 2
+    assert models.Note.objects.using("shard_2").count() == 2
+
+    first_page = auth_client.get("/api/notes/order-priority/desc/?limit=3").data
+    second_page = auth_client.get(
+        "/api/notes/order-priority/desc/", {"limit": 3, "cursor": first_page["next"]}
+    ).data
+
+    assert [note["priority"] for note in first_page["results"]] == [4, 3, 2]
+    assert [note["priority"] for note in second_page["results"]] == [1]
+    assert first_page["results"][0]["user"]["email"] == "ada@example.com"
+
+    assert len(auth_client.get("/api/notes/").data["results"]) == 4
+    assert len(async_get(auth_client, "/api/async/notes/").json()["results"]) == 4
+
+    sparse_page = auth_client.get(
+        "/api/notes/order-priority/desc/", {"fields": "priority", "expand": "user"}
+    ).json()
+
+    assert [note["priority"] for note in sparse_page["results"]] == [4, 3, 2, 1]
+    assert sparse_page["results"][0]["user"]["email"] == "ada@example.com"
+    assert auth_client.get(
+        f"/api/notes/note/{first_page['results'][0]['id']}/", {"fields": "title"}
+    ).json() == {"title": "Priority 4"}
+
+    csv_response = auth_client.get("/api/notes/generate-csv/")
+    lines = b"".join(csv_response.streaming_content).decode().splitlines()
+
+    assert len(lines) == 5
+
+    # Notes of another shard are found, and refused
+    other_note = models.Note.objects.using("shard_2").first()
+
+    assert auth_client.get(f"/api/notes/note/{other_note.id}/").status_code == 200
+    assert auth_client.delete(f"/api/notes/note/{other_note.id}/").status_code == 403
+
+    bulk_response = auth_client.delete(
+        "/api/notes/bulk/", {"ids": [str(other_note.id)]}, format="json"
+    )
+
+    assert bulk_response.data[0]["status"] == "forbidden"
+    assert services.reconcile_note_stats() == 2
+
+    get_user_model().objects.get(id=other.id).delete()
+
+    assert not models.Note.objects.using("shard_2").exists()
+
+
+@pytest.mark.django_db(databases=SHARD_DATABASES)
+def test_note_writes_during_a_move(user, note, settings, monkeypatch):
+    settings.NOTE_SHARDS = ["shard_1", "shard_2"]
+
+    atomic = sharding.atomic
+    moves = []
+
+    def move_during_next_write(target):
+        def move_then_atomic(alias):
+            # The write looked its shard up, the move commits before it locks
+            if not moves:
+                moves.append(sharding.move_user(user.id, target, batch_size=1))
+
+            return atomic(alias)
+
+        moves.clear()
+        monkeypatch.setattr(sharding, "atomic", move_then_atomic)
+
+    first, second = settings.NOTE_SHARDS
+    owner = get_user_model().objects.get(id=user.id)
+
+    # Placed on default next to its old note, moved to first meanwhile
+    move_during_next_write(first)
+
+    created = services.create_note(
+        owner,
+        services.NoteDataClass(
+            title="Written during the move",
+            content="Lands on the new shard",
+            due_date=datetime.datetime(2023, 9, 23, 20, 45, 37, tzinfo=pytz.UTC),
+            priority=3,
+        ),
+    )
+
+    assert moves == [1]
+    assert sharding.shard_for_user(user.id) == first
+    assert not models.Note.objects.using("default").exists()
+    assert set(
+        models.Note.objects.using(first).values_list("id", flat=True)
+    ) == {note.id, created.id}
+
+    move_during_next_write(second)
+
+    services.update_user_note(
+        owner,
+        str(note.id),
+        services.NoteDataClass(
+            title="Updated during the move",
+            content=note.content,
+            due_date=note.due_date,
+            priority=9,
+        ),
+    )
+
+    assert moves == [2]
+    assert not models.Note.objects.using(first).exists()
+    assert models.Note.objects.using(second).get(id=note.id).priority == 9
+
+    stats = services.get_note_stats(owner)
+
+    assert (stats.total, stats.priority["high"]) == (2, 1)
+
+
+@pytest.mark.django_db(databases=SHARD_DATABASES)
+def test_note_rebalance_note_shards(user, note, auth_client, settings):
+    # Written before sharding was enabled, served from default until moved
+    settings.NOTE_SHARDS = ["shard_1", "shard_2"]
+
+    assert auth_client.get(f"/api/notes/note/{note.id}/").status_code == 200
+
+    output = StringIO()
+    call_command("rebalance_note_shards", batch_size=1, stdout=output)
+
+    alias = sharding.ring_shard(user.id)
+    moved = models.Note.objects.using(alias).get(id=note.id)
+
+    assert "Moved 1 users and 1 notes" in output.getvalue()
+    assert sharding.shard_for_user(user.id) == alias
+    assert not models.Note.objects.using("default").exists()
+    assert (moved.created_at, moved.updated_at) == (note.created_at, note.updated_at)
+    assert len(auth_client.get("/api/notes/create/").data["results"]) == 1
+
+    call_command("rebalance_note_shards", stdout=output)
+
+    assert "Moved 0 users and 0 notes" in output.getvalue()
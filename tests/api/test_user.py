@@ -1,12 +1,25 @@
 import pytest
 from rest_framework.test import APIClient
-from users import services
+from users import authentication, models, outbox, services
+from drf import profiling
 
 # password rerest
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from io import StringIO
+
+import datetime
+import threading
+
 
 # Allows to use http methods
 client = APIClient()
@@ -160,3 +173,222 @@ def test_user_fail_confirm_password_email_reset():
     ).status_code
 
     password_confirm_response == 401
+
+
+@pytest.mark.django_db
+def test_user_auth_warm_cache_runs_no_query(user):
+    token = services.create_token(user.id)
+
+    client.post(f"/api/users/verify-email/{token}")
+
+    client.get("/api/users/me/")
+
+    with CaptureQueriesContext(connection) as queries:
+        cur_user_response = client.get("/api/users/me/")
+
+    assert cur_user_response.status_code == 200
+    assert len(queries) == 0
+
+
+@pytest.mark.django_db
+def test_user_auth_cache_invalidated_on_save(user):
+    token = services.create_token(user.id)
+
+    client.post(f"/api/users/verify-email/{token}")
+
+    assert client.get("/api/users/me/").data["first_name"] == "Johnny"
+
+    user_instance = services.check_user_email(user.email)
+    user_instance.first_name = "John"
+    user_instance.save()
+
+    assert client.get("/api/users/me/").data["first_name"] == "John"
+
+
+@pytest.mark.django_db
+def test_user_auth_cache_holds_no_password(user):
+    token = services.create_token(user.id)
+
+    client.post(f"/api/users/verify-email/{token}")
+    client.get("/api/users/me/")
+
+    cached = cache.get(f"users:principal:{user.id}")
+
+    assert cached == services.UserDataClass(
+        first_name="Johnny",
+        last_name="Gray",
+        email="royalcodemate@gmail.com",
+        is_email_verified=True,
+        id=user.id,
+    )
+    assert cached.password is None
+
+    # Password change
+    user_instance = services.check_user_email(user.email)
+    uidb64 = urlsafe_base64_encode(force_bytes(user_instance.id))
+    password_token = PasswordResetTokenGenerator().make_token(user_instance)
+
+    client.patch(
+        f"/api/users/reset_password_confirm/{uidb64}/{password_token}/",
+        {"password": "smartpass"},
+    )
+
+    assert cache.get(f"users:principal:{user.id}") is None
+
+    client.get("/api/users/me/")
+
+    # Deactivation
+    user_instance.refresh_from_db()
+    user_instance.is_active = False
+    user_instance.save()
+
+    assert client.get("/api/users/me/").status_code == 403
+    assert cache.get(f"users:principal:{user.id}") is None
+
+
+@pytest.mark.django_db
+def test_user_principal_keeps_flags_and_refuses_save(user, rf):
+    user_instance = services.check_user_email(user.email)
+    user_instance.is_staff = True
+    user_instance.is_superuser = True
+    user_instance.save()
+
+    request = rf.get("/api/users/me/")
+    request.COOKIES["jwt"] = services.create_token(user.id)
+
+    for _ in range(2):
+        # Cold, then warm cache
+        principal, _ = authentication.CustomUserAuthentication().authenticate(
+            request
+        )
+
+        assert principal.is_active and principal.is_staff and principal.is_superuser
+        assert principal.has_perm("note.delete_note")
+        assert not principal.password
+
+        with pytest.raises(TypeError):
+            principal.save()
+
+    user_instance.refresh_from_db()
+
+    assert user_instance.check_password("password")
+
+
+@pytest.mark.django_db
+def test_register_user_queues_email():
+    reg_payload = {
+        "first_name": "Johnny",
+        "last_name": "Gray",
+        "email": "royalcodemate@gmail.com",
+        "password": "password",
+    }
+
+    assert client.post("/api/users/register/", reg_payload).status_code == 201
+
+    # Nothing is sent while the request runs
+    assert len(mail.outbox) == 0
+
+    email = models.OutboxEmail.objects.get()
+
+    assert email.to == reg_payload["email"]
+    assert email.subject == "Verify your email"
+    assert email.status == models.OutboxEmail.STATUS_PENDING
+
+    assert outbox.dispatch_outbox() == 1
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == [reg_payload["email"]]
+
+    email.refresh_from_db()
+
+    assert email.status == models.OutboxEmail.STATUS_SENT
+    assert email.attempts == 1
+
+
+@pytest.mark.django_db
+def test_outbox_reuses_one_smtp_session(smtp_server):
+    for index in range(3):
+        outbox.queue_email("Subject", "<p>Body</p>", f"user{index}@example.com")
+
+    assert outbox.dispatch_outbox() == 3
+
+    assert smtp_server.sessions == 1
+    assert len(smtp_server.messages) == 3
+    assert not models.OutboxEmail.objects.exclude(
+        status=models.OutboxEmail.STATUS_SENT
+    ).exists()
+
+
+@pytest.mark.django_db
+def test_outbox_retries_with_backoff(smtp_server, settings):
+    email = outbox.queue_email("Subject", "<p>Body</p>", "user@example.com")
+
+    # Relay down
+    settings.EMAIL_PORT = 1
+    settings.EMAIL_OUTBOX_MAX_ATTEMPTS = 2
+
+    assert outbox.dispatch_outbox() == 0
+
+    email.refresh_from_db()
+
+    assert email.status == models.OutboxEmail.STATUS_PENDING
+    assert email.attempts == 1
+    assert email.last_error
+    assert email.next_attempt_at > email.created_at
+
+    # Not due again before the backoff ran out
+    assert outbox.dispatch_outbox() == 0
+
+    models.OutboxEmail.objects.update(next_attempt_at=email.created_at)
+
+    assert outbox.dispatch_outbox() == 0
+
+    email.refresh_from_db()
+
+    assert email.status == models.OutboxEmail.STATUS_FAILED
+    assert email.attempts == 2
+
+    # Relay back, a failed email is not picked up again
+    settings.EMAIL_PORT = smtp_server.server_address[1]
+
+    assert outbox.dispatch_outbox() == 0
+    assert smtp_server.messages == []
+
+
+@pytest.mark.django_db
+def test_outbox_wakes_up_for_retries(monkeypatch):
+    woken = threading.Event()
+
+    monkeypatch.setattr(outbox, "schedule_dispatch", woken.set)
+
+    email = outbox.queue_email("Subject", "<p>Body</p>", "user@example.com")
+
+    # A failed email waiting for its backoff, nothing else queued
+    models.OutboxEmail.objects.filter(id=email.id).update(
+        next_attempt_at=timezone.now() + datetime.timedelta(seconds=0.3)
+    )
+
+    outbox.schedule_retry()
+
+    assert not woken.is_set()
+    assert woken.wait(5)
+
+    models.OutboxEmail.objects.filter(id=email.id).update(
+        status=models.OutboxEmail.STATUS_SENT
+    )
+
+    outbox.schedule_retry()
+
+    assert outbox._retry_timer is None
+
+
+@pytest.mark.django_db
+def test_user_profile_token(user):
+    with pytest.raises(CommandError):
+        call_command("profile_token", user.email)
+
+    models.User.objects.filter(id=user.id).update(is_staff=True)
+
+    output = StringIO()
+    call_command("profile_token", user.email, stdout=output)
+
+    assert profiling.check_token(output.getvalue().strip())
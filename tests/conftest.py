@@ -5,12 +5,48 @@ from note import models
 
 from rest_framework.test import APIClient
 
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import connections
+
 import datetime
 import pytz
+import socketserver
+import threading
 
 client = APIClient()
 
 
+# Local note shards of the sharding tests, next to whatever default is. Notes
+# are only routed to them by tests setting NOTE_SHARDS
+TEST_NOTE_SHARDS = ["shard_1", "shard_2"]
+
+
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    for alias in TEST_NOTE_SHARDS:
+        django_settings.DATABASES.setdefault(
+            alias,
+            {"ENGINE": "django.db.backends.sqlite3", "NAME": f"{alias}.sqlite3"},
+        )
+
+    # Fill in the defaults of the added aliases
+    connections.configure_settings(django_settings.DATABASES)
+
+
+@pytest.fixture
+def sharded(settings):
+    settings.NOTE_SHARDS = TEST_NOTE_SHARDS
+
+    return TEST_NOTE_SHARDS
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # The db is rolled back after every test, the cache has to follow
+    cache.clear()
+
+
 @pytest.fixture
 def user():
     user_dc = user_services.UserDataClass(
@@ -47,3 +83,70 @@ def note(user):
     )
 
     return instance
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Local debugging SMTP server recording sessions and messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.sessions = 0
+        self.messages = []
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.sessions += 1
+        self.reply("220 localhost ready")
+
+        for raw in self.rfile:
+            command = raw.decode().strip().upper()
+
+            if command.startswith("EHLO"):
+                self.reply("250-localhost")
+                self.reply("250 8BITMIME")
+
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+
+                lines = []
+
+                for data in self.rfile:
+                    if data.rstrip(b"\r\n") == b".":
+                        break
+
+                    lines.append(data)
+
+                self.server.messages.append(b"".join(lines))
+                self.reply("250 OK")
+
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server(settings):
+    server = SMTPStandIn()
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    settings.EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    settings.EMAIL_HOST = "127.0.0.1"
+    settings.EMAIL_PORT = server.server_address[1]
+    settings.EMAIL_USE_TLS = False
+    settings.EMAIL_HOST_PASSWORD = ""
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
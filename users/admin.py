@@ -13,3 +13,18 @@ class UserAdmin(admin.ModelAdmin):
 
 
 admin.site.register(models.User, UserAdmin)
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+  list_display = (
+    "subject",
+    "to",
+    "status",
+    "attempts",
+    "next_attempt_at",
+    "sent_at"
+  )
+  list_filter = ("status",)
+
+
+admin.site.register(models.OutboxEmail, OutboxEmailAdmin)
@@ -3,26 +3,39 @@ from django.conf import settings
 from rest_framework import authentication, exceptions
 import jwt
 
-from . import models
+from . import services
 
 class CustomUserAuthentication(authentication.BaseAuthentication):
 
   def authenticate(self, request):
-    token = request.COOKIES.get('jwt')
+    payload = decode_token(request)
 
-    if not token:
-      raise exceptions.AuthenticationFailed('Unauthorized')
+    # Cached principal, no query on a warm cache
+    user = services.get_cached_user(payload['id'])
 
+    # Decoded claims are kept on request.auth for the permission check
+    return (user, payload)
 
-    try:
-      payload = jwt.decode(token, settings.JWT_KEY, algorithms=['HS256'])
 
-    except:
-      raise exceptions.AuthenticationFailed('Unauthorized')
+def decode_token(request) -> dict:
+  """Decode the jwt cookie of a request, AuthenticationFailed when invalid"""
+  token = request.COOKIES.get('jwt')
 
-    user = models.User.objects.filter(id=payload['id']).first()
+  if not token:
+    raise exceptions.AuthenticationFailed('Unauthorized')
 
-    return (user, None)
+  try:
+    return jwt.decode(token, settings.JWT_KEY, algorithms=['HS256'])
 
+  except:
+    raise exceptions.AuthenticationFailed('Unauthorized')
 
 
+async def authenticate_async(request) -> tuple:
+  """CustomUserAuthentication for the async apis, the user is read with the
+  async ORM"""
+  payload = decode_token(request)
+
+  user = await services.aget_cached_user(payload['id'])
+
+  return (user, payload)
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import outbox
+
+
+class Command(BaseCommand):
+    help = "Send due emails of the outbox, once or as a polling worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting when it is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between polls in loop mode.",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=None,
+            help="Emails sent per SMTP session, EMAIL_OUTBOX_BATCH_SIZE by default.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = outbox.dispatch_outbox(options["batch"])
+
+            if count:
+                self.stdout.write(f"Sent {count} email(s)")
+
+            if not options["loop"]:
+                return
+
+            time.sleep(options["interval"])
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from drf import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "Print a signed token that profiles the requests it is sent with, "
+        "as the X-Profile header or the profile query param. Staff only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Email of a staff user.")
+
+    def handle(self, *args, **options):
+        user = (
+            get_user_model()
+            .objects.filter(email=options["email"], is_staff=True, is_active=True)
+            .first()
+        )
+
+        if user is None:
+            raise CommandError(f"No active staff user {options['email']}")
+
+        self.stdout.write(profiling.make_token(user.id))
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 import uuid
 
@@ -67,3 +68,62 @@ class User(AbstractUser):
 
     def __str__(self):
         return f"{self.email}"
+
+
+class Principal(User):
+    """Authenticated user of a request, rebuilt from the principal cache
+
+    Carries the authorization flags but not the password hash, so it is never
+    written back. Load the user with User.objects to change it.
+    """
+
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise TypeError("The authenticated principal cannot be saved")
+
+    def delete(self, *args, **kwargs):
+        raise TypeError("The authenticated principal cannot be deleted")
+
+
+class OutboxEmail(models.Model):
+    """Email waiting to be sent by the outbox dispatcher"""
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    subject = models.CharField(max_length=255)
+    html_body = models.TextField()
+    from_email = models.CharField(max_length=250)
+    to = models.EmailField(max_length=250)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Set while a dispatcher holds the email
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The dispatcher polls for due pending emails
+            models.Index(
+                fields=["status", "next_attempt_at"], name="outbox_due_idx"
+            ),
+            models.Index(fields=["claim_token"], name="outbox_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to}"
@@ -0,0 +1,294 @@
+"""Transactional email outbox.
+
+Apis only insert an OutboxEmail row, in the same transaction as the change
+that needs the email. The dispatcher sends due emails in batches over one
+reused SMTP session and reschedules failures with an exponential backoff, so
+a slow or down relay never holds a request. After every run the in process
+dispatcher sets a timer for the next pending email, retries go out once their
+backoff ran out even when nothing else is queued.
+"""
+
+import datetime
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+_retry_timer = None
+_retry_lock = threading.Lock()
+
+
+def queue_email(
+    subject: str, html_body: str, to: str, from_email: str = None
+) -> "models.OutboxEmail":
+    """Store an email in the outbox, dispatched once the transaction commits
+
+    Parameters
+    ----------
+    subject : str
+        The email subject
+
+    html_body : str
+        The email body (html)
+
+    to : str
+        The reciever email address
+
+    from_email : str, default None
+        The sender, EMAIL_HOST_USER when None
+
+    Return
+    ------
+     OutboxEmail: instance object
+    """
+    email = models.OutboxEmail.objects.create(
+        subject=subject,
+        html_body=html_body,
+        to=to,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+    )
+
+    transaction.on_commit(schedule_dispatch)
+
+    return email
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Lazily start the process wide dispatcher thread"""
+    global _executor
+
+    if _executor is None:
+        # One thread, so a process never holds more than one SMTP session
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="email-outbox"
+        )
+
+    return _executor
+
+
+def schedule_dispatch() -> None:
+    """Wake the dispatcher after new emails were committed"""
+    if settings.EMAIL_OUTBOX_RUN_INLINE:
+        dispatch_outbox()
+        return
+
+    get_executor().submit(_dispatch_in_worker)
+
+
+def _dispatch_in_worker() -> None:
+    # The worker thread owns its db connection, drop it once the queue is empty
+    close_old_connections()
+
+    try:
+        dispatch_outbox()
+        schedule_retry()
+
+    except Exception:
+        logger.exception("Email outbox dispatch crashed")
+
+    finally:
+        close_old_connections()
+
+
+def schedule_retry() -> None:
+    """Wake the dispatcher when the next pending email is due
+
+    The process keeps one timer, replaced on every call and dropped once no
+    email is pending. Emails leased by a dead worker are due at the end of
+    their lease.
+    """
+    global _retry_timer
+
+    next_attempt_at = (
+        models.OutboxEmail.objects.filter(status=models.OutboxEmail.STATUS_PENDING)
+        .order_by("next_attempt_at")
+        .values_list("next_attempt_at", flat=True)
+        .first()
+    )
+
+    with _retry_lock:
+        if _retry_timer is not None:
+            _retry_timer.cancel()
+            _retry_timer = None
+
+        if next_attempt_at is None:
+            return
+
+        delay = max((next_attempt_at - timezone.now()).total_seconds(), 0)
+
+        _retry_timer = threading.Timer(delay, schedule_dispatch)
+        # Never keeps the process alive, the outbox rows outlive it
+        _retry_timer.daemon = True
+        _retry_timer.start()
+
+
+def claim_due_emails(limit: int) -> list["models.OutboxEmail"]:
+    """Lease a batch of due emails to the calling worker
+
+    The lease pushes next_attempt_at forward, so emails of a worker that dies
+    mid batch are picked up again once it runs out.
+
+    Parameters
+    ----------
+    limit : int
+        Maximum number of emails claimed
+
+    Return
+    ------
+     claimed emails: list
+    """
+    now = timezone.now()
+
+    due = models.OutboxEmail.objects.filter(
+        status=models.OutboxEmail.STATUS_PENDING, next_attempt_at__lte=now
+    )
+
+    email_ids = list(
+        due.order_by("next_attempt_at").values_list("id", flat=True)[:limit]
+    )
+
+    if not email_ids:
+        return []
+
+    claim_token = uuid.uuid4()
+
+    # Conditions are checked again by the update, a row leased by another
+    # worker in between is skipped
+    due.filter(id__in=email_ids).update(
+        claim_token=claim_token,
+        attempts=F("attempts") + 1,
+        next_attempt_at=now
+        + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE),
+    )
+
+    return list(models.OutboxEmail.objects.filter(claim_token=claim_token))
+
+
+def build_message(email: "models.OutboxEmail", connection) -> EmailMultiAlternatives:
+    """Turn an outbox row into a multipart (text and html) message"""
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=strip_tags(email.html_body),
+        from_email=email.from_email,
+        to=[email.to],
+        connection=connection,
+    )
+    message.attach_alternative(email.html_body, "text/html")
+
+    return message
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    """Backoff before the next attempt, doubling on every failure"""
+    return datetime.timedelta(
+        seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    )
+
+
+def _mark_failed(email: "models.OutboxEmail", error: Exception) -> None:
+    gave_up = email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+
+    models.OutboxEmail.objects.filter(id=email.id).update(
+        status=(
+            models.OutboxEmail.STATUS_FAILED
+            if gave_up
+            else models.OutboxEmail.STATUS_PENDING
+        ),
+        next_attempt_at=timezone.now() + retry_delay(email.attempts),
+        last_error=str(error),
+        claim_token=None,
+    )
+
+    if gave_up:
+        logger.error("Gave up on email %s: %s", email.id, error)
+
+
+def _close(connection) -> None:
+    try:
+        connection.close()
+
+    except Exception:
+        logger.warning("Closing the SMTP session failed", exc_info=True)
+
+
+def send_batch(emails: list["models.OutboxEmail"]) -> int:
+    """Send emails over a single SMTP session
+
+    Parameters
+    ----------
+    emails : list
+        Claimed outbox emails
+
+    Return
+    ------
+     number of emails sent: int
+    """
+    connection = get_connection(fail_silently=False)
+
+    sent_ids = []
+
+    try:
+        for email in emails:
+            try:
+                # No-op while the session is open, reconnects after an error
+                connection.open()
+                build_message(email, connection).send()
+
+            except Exception as error:
+                _mark_failed(email, error)
+
+                # Start the next email on a fresh session
+                _close(connection)
+                continue
+
+            sent_ids.append(email.id)
+
+    finally:
+        _close(connection)
+
+        models.OutboxEmail.objects.filter(id__in=sent_ids).update(
+            status=models.OutboxEmail.STATUS_SENT,
+            sent_at=timezone.now(),
+            last_error="",
+            claim_token=None,
+        )
+
+    return len(sent_ids)
+
+
+def dispatch_outbox(batch_size: int = None) -> int:
+    """Send every due email, one SMTP session per batch
+
+    Parameters
+    ----------
+    batch_size : int, default None
+        Emails per batch, EMAIL_OUTBOX_BATCH_SIZE when None
+
+    Return
+    ------
+     number of emails sent: int
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+
+    sent = 0
+
+    while True:
+        emails = claim_due_emails(batch_size)
+
+        if not emails:
+            return sent
+
+        sent += send_batch(emails)
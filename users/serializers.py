@@ -1,8 +1,9 @@
+from drf.timing import TimedSerializerMixin
 from rest_framework import serializers
 from . import services
 
 
-class UserSerializer(serializers.Serializer):
+class UserSerializer(TimedSerializerMixin, serializers.Serializer):
     id = serializers.UUIDField(read_only=True)
     first_name = serializers.CharField()
     last_name = serializers.CharField()
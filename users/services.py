@@ -1,10 +1,7 @@
 import dataclasses
-from . import models
+from . import models, outbox
 from rest_framework import exceptions
 
-# Email
-from django.core.mail import send_mail
-
 # For jwt
 import datetime
 import jwt
@@ -12,6 +9,9 @@ import jwt
 # setting
 from django.conf import settings
 
+# Authenticated principal cache
+from django.core.cache import cache
+
 # Generated password token
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 
@@ -26,10 +26,12 @@ if TYPE_CHECKING:
 from django.template.loader import get_template
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True, frozen=True)
 class UserDataClass:
     """Defines the data struture of the user for response.
 
+    Slotted and frozen, one record is shared by every note of a user.
+
     Class varibles
     ----------
     first_name : str
@@ -50,10 +52,19 @@ class UserDataClass:
     id : str, default None
         The user id
 
+    is_active, is_staff, is_superuser : bool
+        Authorization flags, carried into the authenticated principal
+
+    last_login : datetime, default None
+        Last login of the user
+
     Methods
     ------
     from_instance(cls, user)
         Returns object of class
+
+    from_row(cls, row, users)
+        Returns object of class, shared through users
     """
 
     first_name: str
@@ -62,6 +73,10 @@ class UserDataClass:
     is_email_verified: bool = None
     password: str = None
     id: str = None
+    is_active: bool = True
+    is_staff: bool = False
+    is_superuser: bool = False
+    last_login: datetime.datetime = None
 
     @classmethod
     def from_instance(cls, user: "User") -> "UserDataClass":
@@ -73,6 +88,30 @@ class UserDataClass:
             id=user.id,
         )
 
+    @classmethod
+    def from_row(cls, row: tuple, users: dict = None) -> "UserDataClass":
+        """Build from an (id, first_name, last_name, email, is_email_verified)
+        row, optionally followed by the PRINCIPAL_ACCESS_COLUMNS, reusing the
+        record already in users for the same id"""
+        if users is not None and row[0] in users:
+            return users[row[0]]
+
+        user_id, first_name, last_name, email, is_email_verified, *access = row
+
+        user = cls(
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            is_email_verified=is_email_verified,
+            id=user_id,
+            **dict(zip(PRINCIPAL_ACCESS_COLUMNS, access)),
+        )
+
+        if users is not None:
+            users[user_id] = user
+
+        return user
+
 
 @dataclasses.dataclass
 class LoginDataClass:
@@ -153,31 +192,127 @@ def create_token(user_id: str) -> str:
     return token
 
 
+def _user_cache_key(user_id: str) -> str:
+    return f"users:principal:{user_id}"
+
+
+# Authorization fields of the principal, read after the owner columns
+PRINCIPAL_ACCESS_COLUMNS = ("is_active", "is_staff", "is_superuser", "last_login")
+
+# UserDataClass.from_row columns, the password hash is never read nor cached
+PRINCIPAL_COLUMNS = (
+    "id",
+    "first_name",
+    "last_name",
+    "email",
+    "is_email_verified",
+    *PRINCIPAL_ACCESS_COLUMNS,
+)
+
+
+def _active_user_row(user_id: str):
+    return models.User.objects.filter(id=user_id, is_active=True).values_list(
+        *PRINCIPAL_COLUMNS
+    )
+
+
+def _principal(user_dc: "UserDataClass") -> "User":
+    # Stand-in of the row without the password hash, refuses to be saved
+    return models.Principal(
+        id=user_dc.id,
+        first_name=user_dc.first_name,
+        last_name=user_dc.last_name,
+        email=user_dc.email,
+        is_email_verified=user_dc.is_email_verified,
+        is_active=user_dc.is_active,
+        is_staff=user_dc.is_staff,
+        is_superuser=user_dc.is_superuser,
+        last_login=user_dc.last_login,
+    )
+
+
+def get_cached_user(user_id: str) -> "User":
+    """Get the authenticated user, served from cache when warm
+
+    Only the UserDataClass fields are cached, the user is rebuilt from them.
+    Inactive users are not authenticated.
+
+    Parameter
+    ----------
+    user id : str
+        The user id from the token claims
+
+    Return
+    ------
+     User: instance object, None if the user does not exist or is inactive
+    """
+    key = _user_cache_key(user_id)
+
+    user_dc = cache.get(key)
+
+    if user_dc is None:
+        row = _active_user_row(user_id).first()
+
+        if row is None:
+            return None
+
+        user_dc = UserDataClass.from_row(row)
+
+        cache.set(key, user_dc, settings.AUTH_USER_CACHE_TTL)
+
+    return _principal(user_dc)
+
+
+async def aget_cached_user(user_id: str) -> "User":
+    """Async get_cached_user, for the apis served under ASGI"""
+    key = _user_cache_key(user_id)
+
+    user_dc = await cache.aget(key)
+
+    if user_dc is None:
+        row = await _active_user_row(user_id).afirst()
+
+        if row is None:
+            return None
+
+        user_dc = UserDataClass.from_row(row)
+
+        await cache.aset(key, user_dc, settings.AUTH_USER_CACHE_TTL)
+
+    return _principal(user_dc)
+
+
+def invalidate_cached_user(user_id: str) -> None:
+    """Drop a cached user, called whenever the user row changes
+
+    Saves (password change, deactivation) go through the users signals, code
+    updating users with QuerySet.update() has to call it itself.
+
+    Parameter
+    ----------
+    user id : str
+        The user id
+    """
+    cache.delete(_user_cache_key(user_id))
+
+
 def send_email(data: dict) -> None:
-    """Send mail to user email address
+    """Queue a mail to user email address, sent by the outbox dispatcher
 
     Parameters
     ----------
     data : dict
-        Contains email subject , body , from and to
-
-
-    Exceptions
-    ------
-     Error Detals: If Eail not found
+        Contains email subject , body and to
     """
 
-    send_mail(
-        html_message=data.get("body"),
-        fail_silently=False,
+    outbox.queue_email(
         subject=data.get("subject"),
-        recipient_list=[data.get("user_email")],
-        from_email=settings.EMAIL_HOST_USER,
-        message="html_message",
+        html_body=data.get("body"),
+        to=data.get("user_email"),
     )
 
 
-async def get_html_template(context):
+def get_html_template(context):
     return get_template("user_notice.html").render(context)
 
 
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import models, services
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Drop the cached principal so the next request reads the new row
+    services.invalidate_cached_user(instance.id)
@@ -14,9 +14,6 @@ from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 
-# Async
-import asyncio
-
 # Swagger Spectacular
 from drf_spectacular.utils import (
     extend_schema,
@@ -58,8 +55,7 @@ class RegisterApi(views.APIView):
                 "btn_text": "Proceed to verify email",
             }
 
-            # Perform html template generation asynchronously
-            html_template = asyncio.run(services.get_html_template(email_context))
+            html_template = services.get_html_template(email_context)
 
             data = {
                 "subject": "Verify your email",
@@ -197,8 +193,7 @@ class RequestPasswordReset(views.APIView):
             "btn_text": "Proceed to reset password.",
         }
 
-        # Perform html template generation asynchronously
-        html_template = asyncio.run(services.get_html_template(email_context))
+        html_template = services.get_html_template(email_context)
 
         data = {
             "subject": "Reset your password",